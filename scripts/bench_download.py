@@ -0,0 +1,116 @@
+"""
+测量文件下载路由（file_streaming.send_file_ranges）的吞吐量，用于重新评估
+CHUNK_BYTES（由服务器写出响应头、之后改用 sendfile 的切换点）等参数。
+
+在子进程中用 eventlet WSGI 服务器运行应用，父进程通过本机回环地址下载：
+- 完整下载和单区间 Range 下载（每个 --chunk-bytes 取值各测一次）
+- 小文件的每秒请求数，切换点越大，小文件越多地走普通的 yield 路径
+- 作为对照的 flask.send_file
+
+用法: python scripts/bench_download.py [--size-mb 512] [--chunk-bytes 65536,262144,1048576]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import urllib.parse
+import tempfile
+import http.client
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+READ_BYTES = 1024 * 1024
+
+def _serve(app, sock, chunk_bytes):
+    from eventlet import wsgi
+    from vps_dashboard import file_streaming
+    file_streaming.CHUNK_BYTES = chunk_bytes
+    wsgi.server(sock, app, log_output=False)
+
+def _download(port, cookie, path, headers=None, repeat=1):
+    """在一条 keep-alive 连接上重复下载，返回 (总字节数, 秒数)。"""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    buf = memoryview(bytearray(READ_BYTES))
+    total = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        conn.request('GET', path, headers={'Cookie': f'session={cookie}', **(headers or {})})
+        resp = conn.getresponse()
+        if resp.status not in (200, 206):
+            raise RuntimeError(f"{path}: HTTP {resp.status} {resp.read()[:200]!r}")
+        while True:
+            n = resp.readinto(buf)
+            if not n:
+                break
+            total += n
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return total, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=512, help="大文件的大小（MiB）")
+    parser.add_argument('--repeat', type=int, default=3, help="大文件下载的重复次数")
+    parser.add_argument('--small-kb', type=int, default=256, help="小文件的大小（KiB）")
+    parser.add_argument('--small-requests', type=int, default=500, help="小文件的请求次数")
+    parser.add_argument('--chunk-bytes', default='65536,262144,1048576',
+                        help="逗号分隔的 CHUNK_BYTES 取值")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench-download-')
+    os.environ.update(FILE_MANAGER_ROOT=root, METRICS_DIR='', FILE_INDEX_PATH='')
+    import eventlet
+    from flask import send_file
+    from vps_dashboard import create_app
+
+    big = os.path.join(root, 'big.bin')
+    with open(big, 'wb') as f:
+        block = os.urandom(READ_BYTES)
+        for _ in range(args.size_mb):
+            f.write(block)
+    with open(os.path.join(root, 'small.bin'), 'wb') as f:
+        f.write(os.urandom(args.small_kb * 1024))
+
+    app, _ = create_app()
+    app.add_url_rule('/bench/send_file', 'bench_send_file', lambda: send_file(big, conditional=False))
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+    cookie = client.get_cookie('session').value
+
+    # 以 root 运行时文件管理器以 / 为根，否则以 FILE_MANAGER_ROOT 为根，绝对路径在两种情况下都指向同一文件
+    big_url = '/file_manager/files/download?path=' + urllib.parse.quote(big)
+    small_url = '/file_manager/files/download?path=' + urllib.parse.quote(os.path.join(root, 'small.bin'))
+    size = args.size_mb * READ_BYTES
+    range_header = {'Range': f'bytes={size // 4}-{size * 3 // 4 - 1}'}
+    print(f"大文件 {args.size_mb} MiB x {args.repeat}，小文件 {args.small_kb} KiB x {args.small_requests}")
+    runs = [(None, int(value)) for value in args.chunk_bytes.split(',')] + [('send_file', None)]
+    try:
+        for baseline, chunk_bytes in runs:
+            sock = eventlet.listen(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+            server = multiprocessing.Process(target=_serve, args=(app, sock, chunk_bytes or 0), daemon=True)
+            server.start()
+            sock.close()
+            try:
+                if baseline:
+                    total, elapsed = _download(port, cookie, '/bench/send_file', repeat=args.repeat)
+                    print(f"flask.send_file         完整 {total / elapsed / 1e6:8.0f} MB/s")
+                    continue
+                total, elapsed = _download(port, cookie, big_url, repeat=args.repeat)
+                line = f"CHUNK_BYTES={chunk_bytes:<9d} 完整 {total / elapsed / 1e6:8.0f} MB/s"
+                total, elapsed = _download(port, cookie, big_url, range_header, repeat=args.repeat)
+                line += f"  Range {total / elapsed / 1e6:8.0f} MB/s"
+                _, elapsed = _download(port, cookie, small_url, repeat=args.small_requests)
+                line += f"  小文件 {args.small_requests / elapsed:7.0f} 次/秒"
+                print(line)
+            finally:
+                server.terminate()
+                server.join()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
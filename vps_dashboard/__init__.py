@@ -34,16 +34,20 @@ def create_app(debug=False):
     from .auth import auth_bp
     app.register_blueprint(auth_bp, url_prefix=f'{base_path}')
 
-    from .dashboard import dashboard_bp
+    from .dashboard import dashboard_bp, register_socketio_events as register_dashboard_events, start_metrics_sampler
     app.register_blueprint(dashboard_bp, url_prefix=f'{base_path}/dashboard')
 
     from .file_manager import file_manager_bp
+    from .file_index import start_file_indexer
     app.register_blueprint(file_manager_bp, url_prefix=f'{base_path}/file_manager')
 
+    from .jobs import jobs_bp, register_socketio_events as register_job_events, start_job_workers
+    app.register_blueprint(jobs_bp, url_prefix=f'{base_path}/jobs')
+
     from .process_manager import process_manager_bp
     app.register_blueprint(process_manager_bp, url_prefix=f'{base_path}/process_manager')
 
-    from .systemd_manager import systemd_manager_bp
+    from .systemd_manager import systemd_manager_bp, register_socketio_events as register_systemd_events
     app.register_blueprint(systemd_manager_bp, url_prefix=f'{base_path}/systemd_manager')
 
     from .screen_manager import screen_manager_bp
@@ -56,6 +60,9 @@ def create_app(debug=False):
     # 为 Socket.IO 设置路径
     socketio_path = f'{base_path}/socket.io'
     register_socketio_events(socketio)
+    register_dashboard_events(socketio)
+    register_systemd_events(socketio)
+    register_job_events(socketio)
 
     # 主路由重定向
     @app.route(f'{base_path}/')
@@ -64,4 +71,15 @@ def create_app(debug=False):
         return redirect(url_for('dashboard.dashboard_index'))
 
     socketio.init_app(app, async_mode='eventlet', path=socketio_path)
+
+    # 启动唯一的系统指标采样任务，采集成本与连接的客户端数量无关
+    start_metrics_sampler(socketio, app.config['METRICS_INTERVAL'],
+                          app.config['METRICS_DIR'], app.config['METRICS_RETENTION_DAYS'])
+
+    # 后台维护文件搜索的元数据索引
+    start_file_indexer(socketio, app.config['FILE_INDEX_PATH'], app.config['FILE_INDEX_ROOTS'],
+                       app.config['FILE_INDEX_EXCLUDE'], app.config['FILE_INDEX_INTERVAL'])
+
+    # 压缩、解压、删除大目录等耗时的文件操作在独立的线程池中执行
+    start_job_workers(socketio, app.config['JOB_WORKERS'])
     return app, socketio
\ No newline at end of file
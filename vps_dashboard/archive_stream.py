@@ -0,0 +1,263 @@
+import os
+import stat
+import zlib
+import logging
+import tarfile
+import zipfile
+from eventlet import tpool
+from .file_index import virtual_mounts
+
+ARCHIVE_FORMATS = {
+    'zip': ('.zip', 'application/zip'),
+    'tar.gz': ('.tar.gz', 'application/gzip'),
+}
+
+# 已经压缩过的文件类型，放入 zip 时直接存储，不再 deflate
+STORED_EXTENSIONS = {
+    '.zip', '.gz', '.tgz', '.bz2', '.tbz2', '.xz', '.txz', '.zst', '.lz4', '.lzma', '.7z', '.rar', '.zipx',
+    '.jar', '.war', '.apk', '.whl', '.deb', '.rpm', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.epub',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.avif',
+    '.mp3', '.aac', '.m4a', '.ogg', '.opus', '.flac',
+    '.mp4', '.m4v', '.mkv', '.webm', '.avi', '.mov', '.wmv', '.flv',
+    '.woff', '.woff2', '.pdf',
+}
+
+# 每次在线程池中执行的工作量（读取的字节数），以及读取文件的块大小
+STEP_BYTES = 4 * 1024 * 1024
+READ_BYTES = 1024 * 1024
+
+# 每个条目（目录、链接、小文件）按这么多字节计入工作量，避免大量小文件时单步过久
+ENTRY_COST = 16 * 1024
+
+# tar.gz 的 gzip 压缩级别，比 tarfile 默认的 9 快得多，压缩率相差很小
+TAR_GZ_LEVEL = 6
+
+class _Sink:
+    """收集归档写出的字节，由 take() 取走。没有 tell/seek，zipfile 会按流式方式写入数据描述符。"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+def _walk(path, arcname):
+    """
+    深度优先遍历 path，产生 (路径, 归档内名称, lstat 结果)，目录先于其内容产生。
+    arcname 为空时目录的内容直接位于归档顶层（与 shutil.make_archive 相同）。
+    除 path 本身外不跟随目录符号链接，跳过 /proc 等虚拟文件系统的挂载点和无法读取的目录。
+    """
+    skip = virtual_mounts() - {path}
+    st = os.stat(path)
+    if arcname:
+        yield path, arcname, st
+    stack = [(path, arcname)] if stat.S_ISDIR(st.st_mode) else []
+    while stack:
+        directory, prefix = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            logging.warning(f"Skipping unreadable directory {directory} in archive: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            name = f"{prefix}/{entry.name}" if prefix else entry.name
+            if stat.S_ISDIR(st.st_mode):
+                if entry.path in skip:
+                    continue
+                subdirs.append((entry.path, name))
+            yield entry.path, name, st
+        stack.extend(reversed(subdirs))
+
+class _ArchiveStream:
+    """
+    边遍历边生成归档，不使用临时文件。step() 在线程池中执行，每次完成约 STEP_BYTES 的工作
+    并返回新产生的字节，内存占用与目录大小无关。read_bytes 和 entry_count 记录已读取的
+    文件字节数和已处理的条目数，用于报告进度。子类实现 _begin（开始一个条目）、
+    _write（写入当前文件的数据）、_end_file 和 _finish。
+    """
+
+    def __init__(self, path, arcname):
+        self.out = _Sink()
+        self._entries = _walk(path, arcname)
+        self._src = None
+        self._remaining = 0
+        self.read_bytes = 0
+        self.entry_count = 0
+
+    def step(self):
+        """返回 (数据, 是否结束)。"""
+        budget = STEP_BYTES
+        while budget > 0:
+            if self._src is None:
+                entry = next(self._entries, None)
+                if entry is None:
+                    self._finish()
+                    return self.out.take(), True
+                try:
+                    self._begin(*entry)
+                except OSError as e:
+                    logging.warning(f"Skipping {entry[0]} in archive: {e}")
+                self.entry_count += 1
+                budget -= ENTRY_COST
+                continue
+            data = self._src.read(min(READ_BYTES, self._remaining)) if self._remaining else b''
+            self._remaining -= len(data)
+            self.read_bytes += len(data)
+            budget -= len(data)
+            if data:
+                self._write(data)
+            if not data or not self._remaining:
+                self._close_source()
+        return self.out.take(), False
+
+    def _open_source(self, path, size):
+        self._src = open(path, 'rb')
+        self._remaining = size
+
+    def _close_source(self):
+        src, self._src = self._src, None
+        if self._remaining:
+            logging.warning(f"{src.name} shrank while archiving.")
+        try:
+            self._end_file(self._remaining)
+        finally:
+            src.close()
+
+    def close(self):
+        """客户端中途断开时释放打开的文件。"""
+        if self._src is not None:
+            self._src.close()
+            self._src = None
+        self._entries.close()
+
+class ZipStream(_ArchiveStream):
+    """
+    流式 zip。条目大小预先未知地写入数据描述符，超过 4 GiB 的文件和偏移量自动使用 ZIP64；
+    STORED_EXTENSIONS 中的文件直接存储。文件的符号链接按目标内容存储（与 make_archive 相同），
+    目录的符号链接和其他特殊文件被跳过。
+    """
+
+    def __init__(self, path, arcname):
+        super().__init__(path, arcname)
+        self._zip = zipfile.ZipFile(self.out, 'w', zipfile.ZIP_DEFLATED, allowZip64=True, strict_timestamps=False)
+        self._dest = None
+
+    def _begin(self, path, arcname, st):
+        if stat.S_ISDIR(st.st_mode):
+            self._zip.write(path, arcname)
+            return
+        if stat.S_ISLNK(st.st_mode):
+            try:
+                st = os.stat(path)
+            except OSError:
+                # 目标不存在的链接
+                return
+        if not stat.S_ISREG(st.st_mode):
+            return
+        zinfo = zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=False)
+        if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+            zinfo.compress_type = zipfile.ZIP_STORED
+        else:
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+        # 只读取 stat 时的大小，文件在打包过程中变大也不会超出是否使用 ZIP64 的判断
+        self._open_source(path, zinfo.file_size)
+        self._dest = self._zip.open(zinfo, 'w')
+
+    def _write(self, data):
+        self._dest.write(data)
+
+    def _end_file(self, missing):
+        # 文件变小时数据描述符按实际读取的大小记录
+        dest, self._dest = self._dest, None
+        dest.close()
+
+    def _finish(self):
+        self._zip.close()
+
+class TarGzStream(_ArchiveStream):
+    """
+    流式 tar.gz（PAX 格式，支持长文件名和超过 8 GiB 的文件）。gzip 作用于整个流，
+    无法按文件选择是否压缩。保留符号链接本身，跳过设备等特殊文件。
+    """
+
+    def __init__(self, path, arcname):
+        super().__init__(path, arcname)
+        self._gzip = zlib.compressobj(TAR_GZ_LEVEL, zlib.DEFLATED, 31)
+        self._offset = 0
+
+    def _emit(self, data):
+        self._offset += len(data)
+        compressed = self._gzip.compress(data)
+        if compressed:
+            self.out.write(compressed)
+
+    def _begin(self, path, arcname, st):
+        info = tarfile.TarInfo(arcname)
+        info.mode = stat.S_IMODE(st.st_mode)
+        info.mtime = st.st_mtime
+        info.uid, info.gid = st.st_uid, st.st_gid
+        if stat.S_ISDIR(st.st_mode):
+            info.type = tarfile.DIRTYPE
+        elif stat.S_ISLNK(st.st_mode):
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.readlink(path)
+        elif stat.S_ISREG(st.st_mode):
+            info.size = st.st_size
+        else:
+            return
+        if info.isreg():
+            self._open_source(path, info.size)
+        self._emit(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+
+    def _write(self, data):
+        self._emit(data)
+
+    def _end_file(self, missing):
+        # 文件在打包过程中变小时用零补足头部中记录的大小，保证归档结构完整
+        while missing:
+            size = min(missing, READ_BYTES)
+            self._emit(bytes(size))
+            missing -= size
+        if self._offset % tarfile.BLOCKSIZE:
+            self._emit(bytes(tarfile.BLOCKSIZE - self._offset % tarfile.BLOCKSIZE))
+
+    def _finish(self):
+        self._emit(bytes(2 * tarfile.BLOCKSIZE))
+        if self._offset % tarfile.RECORDSIZE:
+            self._emit(bytes(tarfile.RECORDSIZE - self._offset % tarfile.RECORDSIZE))
+        self.out.write(self._gzip.flush())
+
+def stream_archive(path, archive_format):
+    """
+    返回逐块产生 path（文件或目录）归档内容的生成器，归档内以 path 的名称为顶层。
+    每一块在线程池中生成，客户端断开时生成器被关闭，打包随之停止。
+    """
+    stream_class = ZipStream if archive_format == 'zip' else TarGzStream
+    stream = stream_class(path, os.path.basename(path.rstrip('/\\')) or 'root')
+    try:
+        while True:
+            data, done = tpool.execute(stream.step)
+            if data:
+                yield data
+            if done:
+                return
+    finally:
+        stream.close()
@@ -0,0 +1,196 @@
+import os
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+
+# 默认和最大的分块大小
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# 从请求体读取、写入磁盘的单次字节数
+READ_BYTES = 1024 * 1024
+
+# 超过该秒数没有任何进展的上传会被丢弃，同时进行的上传数也有上限
+UPLOAD_EXPIRY = 24 * 3600
+MAX_ACTIVE_UPLOADS = 64
+
+_uploads = {}  # upload_id -> ChunkedUpload
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, 'pwrite'):
+        return os.pwrite(fd, data, offset)
+    # Windows 没有 pwrite；两步之间不会切换协程，并发的分块不会互相干扰
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.write(fd, data)
+
+class UploadError(Exception):
+    """分块上传的错误，code 为对应的 HTTP 状态码。"""
+
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.code = code
+
+class ChunkedUpload:
+    """
+    一次分块上传。
+
+    初始化时在目标目录创建与目标文件等长的稀疏文件（.<文件名>.<ID>.part），
+    各分块按偏移直接 pwrite 到该文件，不经过临时文件，多个分块可以并行写入。
+    已收到的区间以有序、不相交的 [start, end) 列表记录，客户端断线后据此只补传缺失部分。
+    全部收到后原子地重命名为目标文件。
+    """
+
+    def __init__(self, directory, filename, size, chunk_size):
+        self.id = uuid.uuid4().hex
+        self.path = os.path.join(directory, filename)
+        self.part_path = os.path.join(directory, f".{filename}.{self.id}.part")
+        self.size = size
+        self.chunk_size = chunk_size
+        self.received = []
+        self.writing = 0
+        self.completing = False
+        self.aborted = False
+        self.updated = time.time()
+        self.fd = os.open(self.part_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            os.ftruncate(self.fd, size)
+        except BaseException:
+            self.discard()
+            raise
+
+    def status(self):
+        return {
+            "upload_id": self.id,
+            "path": self.path.replace("\\", "/"),
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "received": self.received,
+            "received_bytes": sum(end - start for start, end in self.received)
+        }
+
+    def write(self, offset, length, stream, sha256=None):
+        """把请求体中的 length 字节写到 offset 处；给出 sha256 时校验这一块的内容。"""
+        if self.aborted:
+            raise UploadError("Upload was aborted.", 410)
+        if self.completing:
+            raise UploadError("Upload is being completed.", 409)
+        if offset < 0 or length <= 0 or offset + length > self.size:
+            raise UploadError("Chunk is outside of the file.", 416)
+        digest = hashlib.sha256() if sha256 else None
+        self.writing += 1
+        try:
+            pos = offset
+            end = offset + length
+            while pos < end:
+                data = stream.read(min(READ_BYTES, end - pos))
+                if self.aborted:
+                    raise UploadError("Upload was aborted.", 410)
+                if not data:
+                    raise UploadError("Incomplete chunk.")
+                if digest is not None:
+                    digest.update(data)
+                view = memoryview(data)
+                while view:
+                    written = _pwrite(self.fd, view, pos)
+                    view = view[written:]
+                    pos += written
+        finally:
+            self.writing -= 1
+            # 写入期间上传被放弃时，由最后一个写入者关闭并删除文件
+            if self.aborted and not self.writing:
+                self.discard()
+        if self.aborted:
+            raise UploadError("Upload was aborted.", 410)
+        if digest is not None and digest.hexdigest() != sha256.lower():
+            raise UploadError("Chunk checksum mismatch.", 422)
+        self._add_range(offset, end)
+        self.updated = time.time()
+
+    def _add_range(self, start, end):
+        merged = []
+        for s, e in self.received:
+            if e < start or s > end:
+                merged.append([s, e])
+            else:
+                start, end = min(s, start), max(e, end)
+        merged.append([start, end])
+        merged.sort()
+        self.received = merged
+
+    def is_complete(self):
+        return self.size == 0 or self.received == [[0, self.size]]
+
+    def sha256(self):
+        """计算已写入文件的 SHA-256（读取整个文件，应在线程池中执行）。"""
+        digest = hashlib.sha256()
+        with open(self.part_path, 'rb') as f:
+            while True:
+                data = f.read(READ_BYTES)
+                if not data:
+                    break
+                digest.update(data)
+        return digest.hexdigest()
+
+    def finish(self):
+        # 上一次完成时重命名失败的话文件已经关闭，所有数据都已写入，可以直接重试重命名
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        os.replace(self.part_path, self.path)
+
+    def abort(self):
+        """放弃上传。仍有分块在写入时只做标记，文件由最后一个写入者删除。"""
+        self.aborted = True
+        if not self.writing:
+            self.discard()
+
+    def discard(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        try:
+            os.remove(self.part_path)
+        except OSError:
+            pass
+
+def _expire_uploads():
+    cutoff = time.time() - UPLOAD_EXPIRY
+    for upload_id, upload in list(_uploads.items()):
+        if upload.updated < cutoff and not upload.writing:
+            logging.info(f"Discarding expired upload {upload_id} of {upload.path}.")
+            del _uploads[upload_id]
+            upload.discard()
+
+def create_upload(directory, filename, size, chunk_size=DEFAULT_CHUNK_SIZE):
+    _expire_uploads()
+    if len(_uploads) >= MAX_ACTIVE_UPLOADS:
+        raise UploadError("Too many uploads in progress.", 429)
+    # .part 是稀疏文件，创建时不占用空间，空间不足要等写入时才会失败，因此预先检查
+    if size > shutil.disk_usage(directory).free:
+        raise UploadError("Not enough free disk space for this upload.", 507)
+    upload = ChunkedUpload(directory, filename, size, chunk_size)
+    _uploads[upload.id] = upload
+    return upload
+
+def get_upload(upload_id):
+    upload = _uploads.get(upload_id)
+    if upload is None:
+        raise UploadError("Upload not found.", 404)
+    return upload
+
+def abort_upload(upload_id):
+    """客户端放弃上传；正在完成的上传不能放弃。"""
+    upload = _uploads.get(upload_id)
+    if upload is None:
+        return
+    if upload.completing:
+        raise UploadError("Upload is being completed.", 409)
+    del _uploads[upload_id]
+    upload.abort()
+
+def remove_upload(upload_id):
+    upload = _uploads.pop(upload_id, None)
+    if upload is not None and upload.fd is not None:
+        upload.discard()
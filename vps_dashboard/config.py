@@ -19,4 +19,38 @@ if CURRENT_USER == 'root':
     SYSTEMCTL_COMMAND = ['systemctl']
 else:
     SYSTEMD_PATH = os.path.expanduser('~/.config/systemd/user')
-    SYSTEMCTL_COMMAND = ['systemctl', '--user']
\ No newline at end of file
+    SYSTEMCTL_COMMAND = ['systemctl', '--user']
+
+# 仪表盘后台采样间隔（秒），所有客户端共享同一份采样结果
+METRICS_INTERVAL = float(os.getenv('METRICS_INTERVAL', '1'))
+
+# 指标历史的持久化目录及保留天数，设置 METRICS_DIR 为空字符串可关闭持久化
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics_data'))
+METRICS_RETENTION_DAYS = int(os.getenv('METRICS_RETENTION_DAYS', '30'))
+
+# Web 终端会话在没有客户端连接时保留的秒数，超时后终止其中的进程
+TERMINAL_IDLE_TIMEOUT = int(os.getenv('TERMINAL_IDLE_TIMEOUT', '1800'))
+
+# Web 终端录像（asciicast v2 格式）的保存目录，为空时不录像。
+# 单个录像文件超过 TERMINAL_RECORDING_MAX_BYTES 字节后轮转，轮转下来的文件可选压缩为 .gz
+TERMINAL_RECORDING_DIR = os.getenv('TERMINAL_RECORDING_DIR', '')
+TERMINAL_RECORDING_MAX_BYTES = int(os.getenv('TERMINAL_RECORDING_MAX_BYTES', str(64 * 1024 * 1024)))
+TERMINAL_RECORDING_COMPRESS = os.getenv('TERMINAL_RECORDING_COMPRESS', '1') == '1'
+
+# systemd 后端：auto 表示安装了 jeepney 且能连接 D-Bus 时直接与 systemd 通信，
+# 否则调用 systemctl；subprocess 表示总是调用 systemctl。
+# SYSTEMD_DBUS_ADDRESS 可指定 D-Bus 地址，默认根据用户选择系统总线或会话总线
+SYSTEMD_BACKEND = os.getenv('SYSTEMD_BACKEND', 'auto')
+SYSTEMD_DBUS_ADDRESS = os.getenv('SYSTEMD_DBUS_ADDRESS', '')
+
+# 文件搜索使用的元数据索引（SQLite 数据库）路径，设置为空字符串时不建立索引，搜索总是实时遍历目录。
+# FILE_INDEX_ROOTS 为需要索引的目录（以 os.pathsep 分隔），默认只索引文件管理器根目录；
+# 索引根目录之外的搜索仍然实时遍历。FILE_INDEX_EXCLUDE 中的目录不会被索引。
+FILE_INDEX_PATH = os.getenv('FILE_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'file_index.db'))
+FILE_INDEX_ROOTS = [path for path in os.getenv('FILE_INDEX_ROOTS', FILE_MANAGER_ROOT).split(os.pathsep) if path]
+FILE_INDEX_EXCLUDE = [path for path in os.getenv('FILE_INDEX_EXCLUDE', os.pathsep.join(['/proc', '/sys', '/dev', '/run'])).split(os.pathsep) if path]
+# 增量重新扫描的间隔（秒）
+FILE_INDEX_INTERVAL = int(os.getenv('FILE_INDEX_INTERVAL', '300'))
+
+# 后台任务（耗时的压缩、解压、删除和跨文件系统移动）线程池的线程数
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
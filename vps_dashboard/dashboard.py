@@ -1,74 +1,200 @@
+import time
+import logging
 import platform
 import psutil
 import datetime
-from flask import Blueprint, render_template, jsonify
+from flask import Blueprint, render_template, jsonify, session, request
+from flask_socketio import join_room
 from .utils import login_required
+from .metrics import METRIC_NAMES, MetricsHistory, RateTracker, parse_range
+from .metrics_store import MetricsStore
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
 
+# 所有仪表盘页面共享的 Socket.IO 房间，采样器每个周期只广播一次
+METRICS_NAMESPACE = '/dashboard'
+METRICS_ROOM = 'metrics-viewers'
+
+# 磁盘分区列表变化很少，缓存一段时间后再重新枚举
+DISK_PARTITIONS_TTL = 60
+
+# 采样器状态：最近一次采样结果和缓存的静态信息
+_sampler_state = {
+    'started': False,
+    'latest': None,
+    'system': None,
+    'partitions': None,
+    'partitions_at': 0,
+}
+
+# 内存中的多分辨率历史，以及累计计数器到速率的换算
+metrics_history = MetricsHistory()
+_rates = RateTracker()
+
 @dashboard_bp.route('/')
 @login_required
 def dashboard_index():
     return render_template('dashboard.html')
 
-@dashboard_bp.route('/system_info')
-@login_required
-def get_system_info():
-    """获取系统信息和资源使用情况。"""
-    try:
-        # 系统信息
-        system_info = {
+def _get_static_system_info():
+    """获取不会随时间变化的系统信息，只在首次调用时查询。"""
+    if _sampler_state['system'] is None:
+        _sampler_state['system'] = {
             "os": platform.system(),
             "os_release": platform.release(),
             "os_version": platform.version(),
             "hostname": platform.node(),
             "uptime": datetime.timedelta(seconds=psutil.boot_time()).__str__().split('.')[0] # 运行时间
         }
+    return _sampler_state['system']
 
-        # CPU
-        cpu_percent = psutil.cpu_percent(interval=None, percpu=True) # 每个核心的占用率
-        cpu_overall = psutil.cpu_percent(interval=None) # 总体占用率
-
-        # 内存
-        memory = psutil.virtual_memory()
-        memory_info = {
-            "total": memory.total,
-            "available": memory.available,
-            "percent": memory.percent,
-            "used": memory.used,
-            "free": memory.free
-        }
+def _get_disk_partitions():
+    """获取磁盘分区列表，结果缓存 DISK_PARTITIONS_TTL 秒。"""
+    now = time.monotonic()
+    if _sampler_state['partitions'] is None or now - _sampler_state['partitions_at'] > DISK_PARTITIONS_TTL:
+        _sampler_state['partitions'] = [(p.device, p.mountpoint) for p in psutil.disk_partitions()]
+        _sampler_state['partitions_at'] = now
+    return _sampler_state['partitions']
 
-        # 磁盘 (只获取根分区，可扩展)
-        disk_partitions = []
-        for partition in psutil.disk_partitions():
-            try:
-                usage = psutil.disk_usage(partition.mountpoint)
-                disk_partitions.append({
-                    "device": partition.device,
-                    "mountpoint": partition.mountpoint,
-                    "total": usage.total,
-                    "used": usage.used,
-                    "free": usage.free,
-                    "percent": usage.percent
-                })
-            except Exception:
-                continue # 某些分区可能无法访问
-
-        # 网络流量 (自上次调用以来的增量)
-        net_io = psutil.net_io_counters()
-        network_info = {
-            "bytes_sent": net_io.bytes_sent,
-            "bytes_recv": net_io.bytes_recv
-        }
-        
-        return jsonify({
-            "status": "success",
-            "system": system_info,
-            "cpu": {"overall": cpu_overall, "percpu": cpu_percent},
-            "memory": memory_info,
-            "disk": disk_partitions,
-            "network": network_info
-        })
+def collect_system_info():
+    """采集一次系统信息和资源使用情况。"""
+    now = time.time()
+
+    # CPU
+    cpu_percent = psutil.cpu_percent(interval=None, percpu=True) # 每个核心的占用率
+    cpu_overall = psutil.cpu_percent(interval=None) # 总体占用率
+
+    # 内存
+    memory = psutil.virtual_memory()
+    memory_info = {
+        "total": memory.total,
+        "available": memory.available,
+        "percent": memory.percent,
+        "used": memory.used,
+        "free": memory.free
+    }
+
+    # 磁盘
+    disk_partitions = []
+    for device, mountpoint in _get_disk_partitions():
+        try:
+            usage = psutil.disk_usage(mountpoint)
+            disk_partitions.append({
+                "device": device,
+                "mountpoint": mountpoint,
+                "total": usage.total,
+                "used": usage.used,
+                "free": usage.free,
+                "percent": usage.percent
+            })
+        except Exception:
+            continue # 某些分区可能无法访问
+
+    # 网络流量 (累计值以及根据上次采样计算的速率)
+    net_io = psutil.net_io_counters()
+    network_info = {
+        "bytes_sent": net_io.bytes_sent,
+        "bytes_recv": net_io.bytes_recv,
+        "sent_rate": _rates.rate('net_sent', net_io.bytes_sent, now),
+        "recv_rate": _rates.rate('net_recv', net_io.bytes_recv, now)
+    }
+
+    # 磁盘 I/O 速率 (部分容器环境中不可用)
+    disk_io = psutil.disk_io_counters()
+    disk_io_info = {
+        "read_rate": _rates.rate('disk_read', disk_io.read_bytes, now) if disk_io else 0.0,
+        "write_rate": _rates.rate('disk_write', disk_io.write_bytes, now) if disk_io else 0.0
+    }
+
+    return {
+        "timestamp": now,
+        "system": _get_static_system_info(),
+        "cpu": {"overall": cpu_overall, "percpu": cpu_percent},
+        "memory": memory_info,
+        "disk": disk_partitions,
+        "disk_io": disk_io_info,
+        "network": network_info
+    }
+
+def _history_row(sample):
+    """把一次采样转换为历史序列的一行，列顺序与 METRIC_NAMES 一致。"""
+    disk_total = sum(d['total'] for d in sample['disk'])
+    disk_used = sum(d['used'] for d in sample['disk'])
+    return (
+        sample['cpu']['overall'],
+        sample['memory']['percent'],
+        disk_used * 100.0 / disk_total if disk_total else 0.0,
+        sample['network']['sent_rate'],
+        sample['network']['recv_rate'],
+        sample['disk_io']['read_rate'],
+        sample['disk_io']['write_rate'],
+    )
+
+def _metrics_sampler_loop(socketio, interval):
+    """后台采样循环：每个周期采集一次，并广播给房间内的所有客户端。"""
+    while True:
+        try:
+            sample = collect_system_info()
+            _sampler_state['latest'] = sample
+            metrics_history.add(sample['timestamp'], _history_row(sample))
+            socketio.emit('system-info', sample, namespace=METRICS_NAMESPACE, to=METRICS_ROOM)
+        except Exception as e:
+            logging.warning(f"Metrics sampler failed: {e}")
+        socketio.sleep(interval)
+
+def _open_metrics_store(directory, retention_days):
+    """打开持久化存储；1 秒分辨率最多保留 1 天，其余分辨率按配置天数保留。"""
+    retention = retention_days * 86400
+    tiers = {tier.step: (min(retention, 86400) if tier.step == 1 else retention) for tier in metrics_history.tiers}
+    return MetricsStore(directory, tiers, width=len(METRIC_NAMES))
+
+def start_metrics_sampler(socketio, interval, store_dir=None, retention_days=30):
+    """在 socketio 上启动唯一的后台采样任务，重复调用不会启动多个。"""
+    if _sampler_state['started']:
+        return
+    _sampler_state['started'] = True
+    if store_dir:
+        try:
+            metrics_history.attach_store(_open_metrics_store(store_dir, retention_days))
+        except OSError as e:
+            logging.warning(f"Metrics store unavailable, history will not persist: {e}")
+    socketio.start_background_task(_metrics_sampler_loop, socketio, interval)
+
+def register_socketio_events(socketio):
+    """注册仪表盘相关的 Socket.IO 事件。"""
+
+    @socketio.on("connect", namespace=METRICS_NAMESPACE)
+    def connect():
+        """新的仪表盘客户端加入共享房间，并立即收到最近一次采样。"""
+        if 'logged_in' not in session:
+            logging.warning(f"Unauthorized dashboard connection attempt from SID {request.sid}.")
+            return False  # 拒绝未认证的连接
+        join_room(METRICS_ROOM)
+        if _sampler_state['latest'] is not None:
+            socketio.emit('system-info', _sampler_state['latest'], namespace=METRICS_NAMESPACE, to=request.sid)
+
+@dashboard_bp.route('/system_info')
+@login_required
+def get_system_info():
+    """获取系统信息和资源使用情况，优先返回后台采样器的最近结果。"""
+    try:
+        sample = _sampler_state['latest'] or collect_system_info()
+        return jsonify({"status": "success", **sample})
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@dashboard_bp.route('/history')
+@login_required
+def get_history():
+    """返回指定指标在某个时间范围内的历史数据（列式数组）。"""
+    metric_arg = request.args.get('metric', '')
+    metrics = [m for m in metric_arg.split(',') if m] or list(METRIC_NAMES)
+    unknown = [m for m in metrics if m not in METRIC_NAMES]
+    if unknown:
+        return jsonify({"status": "error", "message": f"Unknown metric: {', '.join(unknown)}"}), 400
+
+    range_seconds = parse_range(request.args.get('range', '10m'))
+    if range_seconds is None:
+        return jsonify({"status": "error", "message": "Invalid range. Use e.g. 600, 10m, 24h or 7d."}), 400
+
+    return jsonify({"status": "success", **metrics_history.query(metrics, range_seconds)})
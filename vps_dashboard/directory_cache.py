@@ -0,0 +1,117 @@
+import os
+import stat
+import datetime
+from array import array
+from collections import OrderedDict
+from eventlet import tpool
+
+# 最多缓存的目录数和所有缓存目录的条目总数，超出后淘汰最久未使用的目录
+LISTING_CACHE_DIRS = 32
+LISTING_CACHE_ENTRIES = 2_000_000
+
+SORT_KEYS = ('name', 'size', 'mtime')
+
+_listing_cache = OrderedDict()  # 目录路径 -> DirectoryListing
+
+def _entry_is_dir(entry):
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+def _stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        try:
+            # 损坏的符号链接
+            return os.lstat(path)
+        except OSError:
+            return None
+
+class DirectoryListing:
+    """
+    一个目录的名称列表及其排序结果。
+
+    构建时只用 scandir 取得名称和是否目录（来自 d_type，一般不需要 stat），
+    按名称排序也不需要 stat；只有按大小或修改时间排序时才对全部条目 stat 一次。
+    每种排序的结果以下标数组保存，分页时直接切片，只对返回的行 stat。
+    目录总是排在文件之前，降序只在两组内部倒序。
+    """
+
+    def __init__(self, path, stamp):
+        self.path = path
+        self.stamp = stamp
+        with os.scandir(path) as it:
+            entries = [(entry.name, _entry_is_dir(entry)) for entry in it]
+        self.names = [name for name, _ in entries]
+        self.is_dir = bytearray(is_dir for _, is_dir in entries)
+        self.dir_count = sum(self.is_dir)
+        self._orders = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _order(self, sort):
+        """返回按 sort 升序（目录在前）排列的下标数组，首次使用时计算。"""
+        order = self._orders.get(sort)
+        if order is None:
+            names, is_dir = self.names, self.is_dir
+            if sort == 'name':
+                key = lambda i: (not is_dir[i], names[i].casefold(), names[i])
+            else:
+                stats = [_stat(os.path.join(self.path, name)) for name in names]
+                if sort == 'size':
+                    values = [st.st_size if st else -1 for st in stats]
+                else:
+                    values = [st.st_mtime if st else 0 for st in stats]
+                key = lambda i: (not is_dir[i], values[i], names[i])
+            order = self._orders[sort] = array('l', sorted(range(len(names)), key=key))
+        return order
+
+    def rows(self, sort, reverse, offset, limit):
+        """返回排序后第 offset 行起的 limit 行，只对这些行 stat。"""
+        order = self._order(sort)
+        total = len(order)
+        if reverse:
+            # 目录组和文件组分别倒序
+            dirs = self.dir_count
+            indexes = [order[dirs - 1 - i] if i < dirs else order[total - 1 - (i - dirs)]
+                       for i in range(offset, min(offset + limit, total))]
+        else:
+            indexes = order[offset:offset + limit]
+        return [self._item(i) for i in indexes]
+
+    def _item(self, i):
+        name = self.names[i]
+        path = os.path.join(self.path, name)
+        st = _stat(path)
+        is_dir = stat.S_ISDIR(st.st_mode) if st else bool(self.is_dir[i])
+        return {
+            "name": name,
+            "type": "directory" if is_dir else "file",
+            "path": path.replace("\\", "/"),
+            "size": st.st_size if st else None,
+            "last_modified": datetime.datetime.fromtimestamp(st.st_mtime).isoformat() if st else None,
+            "permissions": oct(st.st_mode & 0o777) if st else None
+        }
+
+def get_listing(path):
+    """
+    返回目录的缓存列表。缓存以目录的 (st_ino, st_mtime_ns) 校验，目录中有增删或
+    重命名时重新列出；列目录在线程池中执行，不阻塞其他请求。
+    """
+    st = os.stat(path)
+    stamp = (st.st_ino, st.st_mtime_ns)
+    listing = _listing_cache.get(path)
+    if listing is not None and listing.stamp == stamp:
+        _listing_cache.move_to_end(path)
+        return listing
+    listing = tpool.execute(DirectoryListing, path, stamp)
+    _listing_cache[path] = listing
+    _listing_cache.move_to_end(path)
+    total = sum(len(cached) for cached in _listing_cache.values())
+    while len(_listing_cache) > 1 and (len(_listing_cache) > LISTING_CACHE_DIRS or total > LISTING_CACHE_ENTRIES):
+        _, evicted = _listing_cache.popitem(last=False)
+        total -= len(evicted)
+    return listing
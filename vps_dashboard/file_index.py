@@ -0,0 +1,335 @@
+import os
+import re
+import stat
+import time
+import sqlite3
+import logging
+import threading
+from eventlet import tpool
+
+# 每同步多少个目录提交一次事务，避免长时间持有写锁
+COMMIT_EVERY_DIRS = 500
+
+# 选择最稀有的三元组时，每个三元组最多数到这么多条记录
+TRIGRAM_PROBE_LIMIT = 10000
+
+# 文件管理器中的写操作触发的重新扫描，两次之间至少间隔的秒数
+MIN_RESCAN_GAP = 5
+
+# 含有该文件的目录不会被索引，实时搜索时也会跳过
+NOINDEX_MARKER = '.noindex'
+
+# 虚拟文件系统的挂载点不参与索引和搜索：遍历它们没有意义，有的还会触发自动挂载
+VIRTUAL_FS_TYPES = {
+    'proc', 'sysfs', 'devtmpfs', 'devpts', 'cgroup', 'cgroup2', 'securityfs', 'debugfs', 'tracefs',
+    'pstore', 'bpf', 'configfs', 'fusectl', 'mqueue', 'hugetlbfs', 'binfmt_misc', 'autofs',
+    'efivarfs', 'selinuxfs', 'nsfs', 'rpc_pipefs',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY, scanned_at REAL);
+CREATE TABLE IF NOT EXISTS dirs (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, mtime_ns INTEGER);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    dir_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    lname TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    is_link INTEGER NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    mode INTEGER
+);
+CREATE INDEX IF NOT EXISTS entries_dir ON entries (dir_id);
+CREATE TABLE IF NOT EXISTS trigrams (tri TEXT NOT NULL, entry_id INTEGER NOT NULL, PRIMARY KEY (tri, entry_id)) WITHOUT ROWID;
+"""
+
+def _trigrams(lname):
+    return {lname[i:i + 3] for i in range(len(lname) - 2)}
+
+def _encodable(name):
+    """SQLite 只能保存合法的 UTF-8，文件名中无法解码的字节（代理字符）无法索引。"""
+    try:
+        name.encode('utf-8')
+        return True
+    except UnicodeEncodeError:
+        return False
+
+def _entry_stat(entry):
+    try:
+        return entry.stat()
+    except OSError:
+        # 损坏的符号链接
+        return entry.stat(follow_symlinks=False)
+
+def virtual_mounts():
+    """返回虚拟文件系统的挂载点（读取 /proc/self/mounts，其他平台返回空集合）。"""
+    mounts = set()
+    try:
+        with open('/proc/self/mounts') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3 and fields[2] in VIRTUAL_FS_TYPES:
+                    # 挂载点中的空格等字符以 \040 形式转义
+                    mounts.add(re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), fields[1]))
+    except OSError:
+        pass
+    return mounts
+
+def search_excludes(excludes):
+    """配置的排除目录加上当前的虚拟文件系统挂载点。"""
+    return {os.path.abspath(path) for path in excludes} | virtual_mounts()
+
+def walk_matches(base, query, excludes=()):
+    """
+    实时遍历 base 目录树，逐个产生名称包含 query（不区分大小写）的条目，
+    格式与 FileIndex.search 相同。每列完一个目录额外产生一个 None，调用方借此
+    检查时间预算和取消请求。不跟随符号链接，跳过 excludes 中的目录和含有
+    NOINDEX_MARKER 的子目录。
+    """
+    lquery = query.lower()
+    stack = [base]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            yield None
+            continue
+        if path != base and any(entry.name == NOINDEX_MARKER for entry in entries):
+            yield None
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False) and entry.path not in excludes:
+                    subdirs.append(entry.path)
+                if lquery in entry.name.lower():
+                    st = _entry_stat(entry)
+                    yield (path, entry.name, stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime, st.st_mode & 0o777)
+            except OSError:
+                continue
+        # 逆序入栈，使同一目录下的子目录按列出的顺序遍历
+        stack.extend(reversed(subdirs))
+        yield None
+
+def _under(path, base):
+    """path 是否等于 base 或位于 base 之下。"""
+    return path == base or path.startswith(base.rstrip(os.sep) + os.sep)
+
+class FileIndex:
+    """
+    保存在 SQLite 中的文件元数据索引：目录、文件名、大小、修改时间和权限，
+    文件名按小写三元组建立倒排表，子串搜索只需查询最稀有的一个三元组再逐条核对。
+
+    重新扫描是增量的：目录的 mtime 没有变化说明其中没有增删或重命名，
+    直接沿用索引中的子目录继续向下，不再列目录也不再 stat 其中的文件；
+    只有 mtime 变化的目录才会重新列出并与索引比对。因此文件内容的修改
+    （大小、修改时间）要等所在目录发生变化后才会更新到索引中。
+
+    扫描和查询都是阻塞操作，应放在线程池中执行；每个线程使用自己的连接。
+    """
+
+    def __init__(self, db_path, roots, excludes=()):
+        self.db_path = db_path
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.excludes = {os.path.abspath(path) for path in excludes}
+        self._local = threading.local()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        # 上次运行时已经完整扫描过的根目录在启动后立即可用于搜索
+        self.ready_roots = {path for (path,) in conn.execute(
+            "SELECT path FROM roots WHERE scanned_at IS NOT NULL") if path in self.roots}
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            # WAL 模式下扫描写入时搜索仍可并发读取
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def covers(self, path):
+        """path 是否位于一个已完成扫描的根目录之下。"""
+        return any(_under(path, root) for root in self.ready_roots)
+
+    # --- 扫描 ---
+
+    def scan(self):
+        """增量扫描所有根目录。"""
+        excludes = self.excludes | virtual_mounts()
+        for root in self.roots:
+            if not os.path.isdir(root):
+                logging.warning(f"File index root {root} is not a directory, skipping.")
+                continue
+            started = time.monotonic()
+            stats = self._scan_root(root, excludes)
+            self.ready_roots.add(root)
+            logging.info(f"Indexed {root} in {time.monotonic() - started:.2f}s: "
+                         f"{stats['listed']} of {stats['dirs']} directories changed.")
+
+    def _scan_root(self, root, excludes=frozenset()):
+        conn = self._conn()
+        prefix = root.rstrip(os.sep) + os.sep
+        known = {path: (dir_id, mtime_ns) for path, dir_id, mtime_ns in conn.execute(
+            "SELECT path, id, mtime_ns FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?",
+            (root, len(prefix), prefix))}
+        seen = set()
+        stats = {'dirs': 0, 'listed': 0}
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            if path in excludes or path in seen:
+                continue
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(path)
+            stats['dirs'] += 1
+            row = known.get(path)
+            if row is not None and row[1] == mtime_ns:
+                # 目录没有变化，子目录列表直接取自索引
+                stack.extend(os.path.join(path, name) for (name,) in conn.execute(
+                    "SELECT name FROM entries WHERE dir_id = ? AND is_dir = 1 AND is_link = 0", (row[0],)))
+                continue
+            if row is None:
+                dir_id = conn.execute("INSERT INTO dirs (path) VALUES (?)", (path,)).lastrowid
+            else:
+                dir_id = row[0]
+            stack.extend(self._sync_dir(conn, dir_id, path))
+            conn.execute("UPDATE dirs SET mtime_ns = ? WHERE id = ?", (mtime_ns, dir_id))
+            stats['listed'] += 1
+            if stats['listed'] % COMMIT_EVERY_DIRS == 0:
+                conn.commit()
+
+        # 不再存在（或已被排除、无法访问）的目录连同其中的条目一起删除
+        for path in known.keys() - seen:
+            self._delete_dir(conn, known[path][0])
+        conn.execute("INSERT OR REPLACE INTO roots (path, scanned_at) VALUES (?, ?)", (root, time.time()))
+        conn.commit()
+        return stats
+
+    def _sync_dir(self, conn, dir_id, path):
+        """重新列出一个目录并与索引比对，返回需要继续扫描的子目录。"""
+        existing = {row[0]: row[1:] for row in conn.execute(
+            "SELECT name, id, is_dir, is_link, size, mtime, mode FROM entries WHERE dir_id = ?", (dir_id,))}
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError as e:
+            logging.debug(f"File index cannot list {path}: {e}")
+            return []
+        if any(entry.name == NOINDEX_MARKER for entry in entries):
+            # 标记为不索引的目录按空目录处理，已有的条目被删除
+            entries = []
+        for entry in entries:
+            name = entry.name
+            if not _encodable(name):
+                continue
+            try:
+                is_link = entry.is_symlink()
+                st = _entry_stat(entry)
+            except OSError:
+                continue
+            is_dir = stat.S_ISDIR(st.st_mode)
+            values = (int(is_dir), int(is_link), st.st_size, st.st_mtime, st.st_mode & 0o777)
+            old = existing.pop(name, None)
+            if old is None:
+                entry_id = conn.execute(
+                    "INSERT INTO entries (dir_id, name, lname, is_dir, is_link, size, mtime, mode) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (dir_id, name, name.lower()) + values).lastrowid
+                conn.executemany("INSERT OR IGNORE INTO trigrams (tri, entry_id) VALUES (?, ?)",
+                                 [(tri, entry_id) for tri in _trigrams(name.lower())])
+            elif tuple(old[1:]) != values:
+                conn.execute("UPDATE entries SET is_dir = ?, is_link = ?, size = ?, mtime = ?, mode = ? "
+                             "WHERE id = ?", values + (old[0],))
+            if is_dir and not is_link:
+                subdirs.append(entry.path)
+        for name, old in existing.items():
+            self._delete_entry(conn, old[0], name)
+        return subdirs
+
+    def _delete_entry(self, conn, entry_id, name):
+        conn.executemany("DELETE FROM trigrams WHERE tri = ? AND entry_id = ?",
+                         [(tri, entry_id) for tri in _trigrams(name.lower())])
+        conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+
+    def _delete_dir(self, conn, dir_id):
+        for entry_id, name in conn.execute("SELECT id, name FROM entries WHERE dir_id = ?", (dir_id,)).fetchall():
+            self._delete_entry(conn, entry_id, name)
+        conn.execute("DELETE FROM dirs WHERE id = ?", (dir_id,))
+
+    # --- 查询 ---
+
+    def search(self, base, query, limit):
+        """
+        返回 base 目录树中名称包含 query（不区分大小写）的条目，最多 limit 条。
+        每个条目为 (所在目录, 名称, 是否目录, 大小, 修改时间, 权限位)。
+        """
+        conn = self._conn()
+        lquery = query.lower()
+        prefix = base.rstrip(os.sep) + os.sep
+        scope = "(d.path = ? OR substr(d.path, 1, ?) = ?)"
+        columns = "d.path, e.name, e.is_dir, e.size, e.mtime, e.mode"
+        grams = _trigrams(lquery)
+        if grams:
+            # 从命中条目最少的三元组出发，再用 instr 核对完整的子串
+            count, tri = min((conn.execute(
+                "SELECT COUNT(*) FROM (SELECT 1 FROM trigrams WHERE tri = ? LIMIT ?)",
+                (gram, TRIGRAM_PROBE_LIMIT)).fetchone()[0], gram) for gram in grams)
+            if count == 0:
+                return []
+            sql = (f"SELECT {columns} FROM trigrams t JOIN entries e ON e.id = t.entry_id "
+                   f"JOIN dirs d ON d.id = e.dir_id WHERE t.tri = ? AND instr(e.lname, ?) > 0 AND {scope} LIMIT ?")
+            params = (tri, lquery, base, len(prefix), prefix, limit)
+        else:
+            # 一两个字符的查询没有三元组可用，直接在 SQLite 中扫描，命中 limit 条即停止
+            sql = (f"SELECT {columns} FROM entries e JOIN dirs d ON d.id = e.dir_id "
+                   f"WHERE instr(e.lname, ?) > 0 AND {scope} LIMIT ?")
+            params = (lquery, base, len(prefix), prefix, limit)
+        return conn.execute(sql, params).fetchall()
+
+_indexer_state = {'started': False, 'index': None, 'dirty': False}
+
+def get_file_index():
+    """返回已启动的索引，未启用时返回 None。"""
+    return _indexer_state['index']
+
+def request_rescan():
+    """文件被修改后请求尽快重新扫描（增量扫描只会重新列出 mtime 变化的目录）。"""
+    _indexer_state['dirty'] = True
+
+def _indexer_loop(socketio, index, interval):
+    last_scan = None
+    while True:
+        now = time.monotonic()
+        due = last_scan is None or now - last_scan >= interval
+        if due or (_indexer_state['dirty'] and now - last_scan >= MIN_RESCAN_GAP):
+            _indexer_state['dirty'] = False
+            last_scan = now
+            try:
+                tpool.execute(index.scan)
+            except Exception as e:
+                logging.warning(f"File index scan failed: {e}")
+        socketio.sleep(1)
+
+def start_file_indexer(socketio, db_path, roots, excludes, interval):
+    """启动唯一的后台索引任务；db_path 为空时不建立索引。"""
+    if _indexer_state['started'] or not db_path or not roots:
+        return
+    _indexer_state['started'] = True
+    try:
+        index = FileIndex(db_path, roots, excludes)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f"File index unavailable, searches will walk the filesystem: {e}")
+        return
+    _indexer_state['index'] = index
+    socketio.start_background_task(_indexer_loop, socketio, index, interval)
@@ -1,16 +1,59 @@
 import os
-import shutil
+import errno
 import datetime
 import zipfile
 import tarfile
 import json
+import time
+import uuid
 import string
-from flask import Blueprint, render_template, jsonify, request, send_from_directory, current_app
+from flask import Blueprint, render_template, jsonify, request, current_app, Response
 from werkzeug.utils import secure_filename
+from eventlet import tpool
 from .utils import login_required, _get_safe_path, is_admin
+from .chunked_upload import DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE, UploadError, create_upload, get_upload, remove_upload, abort_upload
+from .directory_cache import SORT_KEYS, get_listing
+from .file_streaming import content_disposition, send_file_ranges
+from .archive_stream import ARCHIVE_FORMATS, stream_archive
+from .file_index import get_file_index, request_rescan, search_excludes, walk_matches
+from .file_operations import NO_PROGRESS, measure_tree, delete_path, move_across_filesystems, compress_path, extract_archive
+from .jobs import JobError, submit_job
 
 file_manager_bp = Blueprint('file_manager', __name__, url_prefix='/file_manager')
 
+# 列目录时单次最多返回的行数
+MAX_LIST_LIMIT = 1000
+
+# 搜索默认和最多返回的结果数、默认和最长的时间预算（秒）
+MAX_SEARCH_RESULTS = 1000
+MAX_SEARCH_LIMIT = 10000
+DEFAULT_SEARCH_TIMEOUT = 10
+MAX_SEARCH_TIMEOUT = 60
+
+# 实时遍历时每批的最长搜索时间，第一批结果在这段时间内即可发出
+SEARCH_BATCH_SECONDS = 0.05
+
+# 正在进行的流式搜索：search_id -> 状态
+_active_searches = {}
+
+# 删除、压缩、解压和跨文件系统移动涉及的条目数或字节数超过以下阈值时作为后台任务执行，
+# 较小的操作仍在请求中同步完成
+JOB_SYNC_ENTRIES = 1000
+JOB_SYNC_BYTES = 64 * 1024 * 1024
+
+def _needs_job(path, check_bytes=True):
+    """粗略统计 path 的规模（最多统计 JOB_SYNC_ENTRIES 个条目），判断是否应作为后台任务执行。"""
+    measured = tpool.execute(measure_tree, path, JOB_SYNC_ENTRIES)
+    return measured is None or (check_bytes and measured[1] > JOB_SYNC_BYTES)
+
+def _start_job(kind, title, func, *args):
+    """提交后台任务并返回 202；任务结束后请求重新扫描文件索引。"""
+    try:
+        job = submit_job(kind, title, func, *args, on_done=request_rescan)
+    except JobError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.code
+    return jsonify({"status": "success", "message": f"已在后台开始: {title}", "job": job.to_dict()}), 202
+
 @file_manager_bp.route('/')
 @login_required
 def file_manager_index():
@@ -19,11 +62,20 @@ def file_manager_index():
 @file_manager_bp.route('/files')
 @login_required
 def list_files():
-    """列出指定目录下的文件和文件夹，并包含详细信息。"""
+    """
+    列出指定目录下的文件和文件夹，并包含详细信息。
+    目录列表经过缓存并在服务端排序（sort=name/size/mtime，order=asc/desc），只对返回的行 stat。
+    可以按 page/page_size 分页，也可以用 offset/limit 取任意区间（虚拟滚动使用，此时不插入 ".." 行）。
+    """
     try:
         req_path = request.args.get('path', '')
-        page = request.args.get('page', 1, type=int)
-        page_size = request.args.get('page_size', 100, type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('page_size', 100, type=int), 1), MAX_LIST_LIMIT)
+        offset = request.args.get('offset', type=int)
+        sort = request.args.get('sort', 'name')
+        reverse = request.args.get('order') == 'desc'
+        if sort not in SORT_KEYS:
+            return jsonify({"status": "error", "message": f"Invalid sort key: {sort}"}), 400
 
         # 当 Windows 管理员访问根目录时，列出所有磁盘驱动器
         if not req_path and os.name == 'nt' and is_admin():
@@ -56,31 +108,18 @@ def list_files():
         if error_response:
             return error_response
 
-        items = []
-        with os.scandir(full_path) as it:
-            for entry in it:
-                try:
-                    stat_info = entry.stat()
-                    is_dir = entry.is_dir()
-                    
-                    items.append({
-                        "name": entry.name,
-                        "type": "directory" if is_dir else "file",
-                        "path": entry.path.replace("\\", "/"),
-                        "size": stat_info.st_size,
-                        "last_modified": datetime.datetime.fromtimestamp(stat_info.st_mtime).isoformat(),
-                        "permissions": oct(stat_info.st_mode & 0o777)
-                    })
-                except OSError:
-                    # 忽略无法访问的文件或链接
-                    continue
-        
+        listing = get_listing(full_path)
+        if offset is None:
+            start = (page - 1) * page_size
+            limit = page_size
+        else:
+            start = max(offset, 0)
+            limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_LIST_LIMIT)
+        paginated_items = tpool.execute(listing.rows, sort, reverse, start, limit)
+
         # 分页处理
-        total_items = len(items)
+        total_items = len(listing)
         total_pages = (total_items + page_size - 1) // page_size
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated_items = items[start:end]
 
         # 添加 ".." 返回上一级
         # 确定是否在根目录
@@ -88,6 +127,7 @@ def list_files():
                        (is_admin() and not req_path and os.name == 'nt') or \
                        (is_admin() and full_path == os.path.abspath('/'))
 
+        parent_path = None
         if not is_root_path:
             # 对于 Windows 驱动器根目录，返回到空路径以显示所有驱动器
             if os.name == 'nt' and is_admin() and len(full_path) == 3 and full_path.endswith(':\\'):
@@ -95,6 +135,7 @@ def list_files():
             else:
                 parent_path = os.path.dirname(full_path).replace("\\", "/")
 
+        if parent_path is not None and offset is None:
             paginated_items.insert(0, {
                 "name": "..",
                 "type": "directory",
@@ -108,7 +149,10 @@ def list_files():
             "items": paginated_items,
             "total_pages": total_pages,
             "current_page": page,
-            "current_full_path": full_path.replace("\\", "/")
+            "current_full_path": full_path.replace("\\", "/"),
+            "total_items": total_items,
+            "offset": start,
+            "parent_path": parent_path
         })
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -116,21 +160,49 @@ def list_files():
 @file_manager_bp.route('/files/download')
 @login_required
 def download_file():
-    """下载指定的文件。"""
+    """
+    下载指定的文件，支持 Range / If-Range 断点续传和多区间请求。
+    inline=1 时在浏览器中直接打开（便于播放媒体文件时拖动进度）。
+    """
     try:
         req_path = request.args.get('path', '')
         full_path, error_response = _get_safe_path(req_path, check_exists=True, check_file=True)
         if error_response:
             return error_response
 
-        return send_from_directory(os.path.dirname(full_path), os.path.basename(full_path), as_attachment=True)
+        return send_file_ranges(full_path, request, inline=request.args.get('inline') == '1')
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@file_manager_bp.route('/files/download_archive')
+@login_required
+def download_archive():
+    """
+    将文件或文件夹打包为 zip（支持 ZIP64）或 tar.gz 并直接流式下载，不生成临时文件。
+    边打包边发送，大目录也能立即开始下载，内存占用恒定。
+    """
+    try:
+        req_path = request.args.get('path', '')
+        archive_format = request.args.get('format', 'zip')
+        if archive_format not in ARCHIVE_FORMATS:
+            return jsonify({"status": "error", "message": "不支持的压缩格式。"}), 400
+
+        full_path, error_response = _get_safe_path(req_path, check_exists=True)
+        if error_response:
+            return error_response
+
+        extension, mimetype = ARCHIVE_FORMATS[archive_format]
+        filename = (os.path.basename(full_path.rstrip('/\\')) or 'root') + extension
+        return Response(stream_archive(full_path, archive_format), mimetype=mimetype,
+                        headers={'Content-Disposition': content_disposition(filename),
+                                 'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @file_manager_bp.route('/files/delete', methods=['POST'])
 @login_required
 def delete_file():
-    """删除指定的文件或文件夹。"""
+    """删除指定的文件或文件夹，条目较多的文件夹在后台任务中删除。"""
     try:
         req_path = request.json.get('path', '')
         if not req_path:
@@ -140,11 +212,10 @@ def delete_file():
         if error_response:
             return error_response
 
-        if os.path.isfile(full_path):
-            os.remove(full_path)
-        elif os.path.isdir(full_path):
-            shutil.rmtree(full_path)
-        
+        if os.path.isdir(full_path) and not os.path.islink(full_path) and _needs_job(full_path, check_bytes=False):
+            return _start_job('delete', f"删除 {req_path}", delete_path, full_path)
+        tpool.execute(delete_path, NO_PROGRESS, full_path)
+
         return jsonify({"status": "success", "message": f"Successfully deleted {req_path}"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -174,6 +245,114 @@ def upload_file():
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@file_manager_bp.route('/files/upload/init', methods=['POST'])
+@login_required
+def init_chunked_upload():
+    """
+    开始一次分块上传。请求体: {"path": 目标目录, "filename": 文件名, "size": 字节数, "chunk_size": 可选}。
+    之后用 PUT /files/upload/<upload_id>?offset=N 上传各分块（可并行、可乱序），
+    最后 POST /files/upload/<upload_id>/complete 完成。
+    """
+    try:
+        data = request.json or {}
+        full_path, error_response = _get_safe_path(data.get('path', ''), check_exists=True, is_dir=True)
+        if error_response:
+            return error_response
+        filename = secure_filename(data.get('filename') or '')
+        if not filename:
+            return jsonify({"status": "error", "message": "No selected file"}), 400
+        size = data.get('size')
+        chunk_size = data.get('chunk_size') or DEFAULT_CHUNK_SIZE
+        if not isinstance(size, int) or size < 0:
+            return jsonify({"status": "error", "message": "size must be a non-negative integer."}), 400
+        if not isinstance(chunk_size, int) or not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            return jsonify({"status": "error", "message": f"chunk_size must be between 1 and {MAX_CHUNK_SIZE}."}), 400
+
+        upload = create_upload(full_path, filename, size, chunk_size)
+        return jsonify(dict(upload.status(), status="success")), 201
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.code
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@file_manager_bp.route('/files/upload/<upload_id>', methods=['GET'])
+@login_required
+def get_chunked_upload(upload_id):
+    """查询上传进度，received 为已收到的 [start, end) 区间，断线重连后只需补传缺失部分。"""
+    try:
+        return jsonify(dict(get_upload(upload_id).status(), status="success"))
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.code
+
+@file_manager_bp.route('/files/upload/<upload_id>', methods=['PUT'])
+@login_required
+def put_upload_chunk(upload_id):
+    """
+    上传一个分块：请求体为原始字节，offset 参数为在文件中的偏移。
+    可选的 X-Chunk-SHA256 头用于校验这一块的内容。
+    """
+    try:
+        upload = get_upload(upload_id)
+        offset = request.args.get('offset', type=int)
+        length = request.content_length
+        if offset is None:
+            return jsonify({"status": "error", "message": "offset is required."}), 400
+        if length is None:
+            return jsonify({"status": "error", "message": "Content-Length is required."}), 411
+        if length > MAX_CHUNK_SIZE:
+            return jsonify({"status": "error", "message": f"Chunk is larger than {MAX_CHUNK_SIZE} bytes."}), 413
+        upload.write(offset, length, request.stream, request.headers.get('X-Chunk-SHA256'))
+        return jsonify({"status": "success", "received": upload.received})
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.code
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@file_manager_bp.route('/files/upload/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_chunked_upload(upload_id):
+    """
+    完成上传：确认所有区间都已收到后把文件移动到目标位置。
+    请求体可以带 {"sha256": 十六进制摘要}，此时先校验整个文件，不一致则丢弃本次上传。
+    """
+    try:
+        upload = get_upload(upload_id)
+        if upload.writing:
+            return jsonify({"status": "error", "message": "Chunks are still being written."}), 409
+        if not upload.is_complete():
+            return jsonify({"status": "error", "message": "Upload is incomplete.", "received": upload.received}), 409
+        expected = ((request.get_json(silent=True) or {}).get('sha256') or '').lower()
+        upload.completing = True
+        result = {"status": "success"}
+        try:
+            if expected:
+                actual = tpool.execute(upload.sha256)
+                result['sha256'] = actual
+                if actual != expected:
+                    remove_upload(upload_id)
+                    return jsonify({"status": "error", "message": "Checksum mismatch, upload discarded.", "sha256": actual}), 422
+            upload.finish()
+        finally:
+            # 校验或重命名出错时上传保留，客户端可以再次请求完成
+            upload.completing = False
+        remove_upload(upload_id)
+        result['message'] = f"File {os.path.basename(upload.path)} uploaded successfully"
+        return jsonify(result)
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.code
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@file_manager_bp.route('/files/upload/<upload_id>', methods=['DELETE'])
+@login_required
+def abort_chunked_upload(upload_id):
+    """放弃一次上传并删除已写入的数据，正在写入的分块随之以 410 结束。"""
+    try:
+        abort_upload(upload_id)
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.code
+    return jsonify({"status": "success", "message": "Upload aborted."})
+
 @file_manager_bp.route('/files/create_folder', methods=['POST'])
 @login_required
 def create_folder():
@@ -198,7 +377,7 @@ def create_folder():
 @file_manager_bp.route('/files/rename', methods=['POST'])
 @login_required
 def rename_file():
-    """重命名文件或文件夹。"""
+    """重命名文件或文件夹。跨文件系统时改为复制后删除，较大的在后台任务中进行。"""
     try:
         old_path_rel = request.json.get('old_path', '')
         new_path_rel = request.json.get('new_path', '')
@@ -217,7 +396,15 @@ def rename_file():
         if os.path.exists(new_full_path):
             return jsonify({"status": "error", "message": "New path already exists."}), 400
         
-        os.rename(old_full_path, new_full_path)
+        try:
+            os.rename(old_full_path, new_full_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            if _needs_job(old_full_path):
+                return _start_job('move', f"移动 {old_path_rel} 到 {new_path_rel}", move_across_filesystems,
+                                  old_full_path, new_full_path)
+            tpool.execute(move_across_filesystems, NO_PROGRESS, old_full_path, new_full_path)
         return jsonify({"status": "success", "message": f"Renamed '{old_path_rel}' to '{new_path_rel}'."})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -312,7 +499,7 @@ def handle_permissions():
 @file_manager_bp.route('/files/compress', methods=['POST'])
 @login_required
 def compress_file_or_folder():
-    """压缩文件或文件夹。"""
+    """压缩文件或文件夹，较大的在后台任务中压缩。"""
     try:
         req_path = request.json.get('path', '')
         archive_format = request.json.get('format', 'zip')
@@ -324,34 +511,17 @@ def compress_file_or_folder():
         if error_response:
             return error_response
 
-        output_filename = os.path.basename(full_path)
-        output_dir = os.path.dirname(full_path)
-
-        if os.path.isfile(full_path):
-            if archive_format == 'zip':
-                archive_name = os.path.join(output_dir, f"{output_filename}.zip")
-                with zipfile.ZipFile(archive_name, 'w', zipfile.ZIP_DEFLATED) as zf:
-                    zf.write(full_path, os.path.basename(full_path))
-            elif archive_format == 'tar.gz':
-                archive_name = os.path.join(output_dir, f"{output_filename}.tar.gz")
-                with tarfile.open(archive_name, "w:gz") as tar:
-                    tar.add(full_path, arcname=os.path.basename(full_path))
-            else:
-                return jsonify({"status": "error", "message": "不支持的压缩格式。"}), 400
-        elif os.path.isdir(full_path):
-            if archive_format == 'zip':
-                archive_name = os.path.join(output_dir, output_filename)
-                shutil.make_archive(archive_name, 'zip', full_path)
-                archive_name = f"{output_filename}.zip"
-            elif archive_format == 'tar.gz':
-                archive_name = os.path.join(output_dir, output_filename)
-                shutil.make_archive(archive_name, 'gztar', full_path)
-                archive_name = f"{output_filename}.tar.gz"
-            else:
-                return jsonify({"status": "error", "message": "不支持的压缩格式。"}), 400
-        else:
+        if archive_format not in ARCHIVE_FORMATS:
+            return jsonify({"status": "error", "message": "不支持的压缩格式。"}), 400
+        if not os.path.isfile(full_path) and not os.path.isdir(full_path):
             return jsonify({"status": "error", "message": "无法压缩非文件或文件夹的路径。"}), 400
-        
+
+        archive_name = os.path.basename(full_path) + ARCHIVE_FORMATS[archive_format][0]
+        archive_path = os.path.join(os.path.dirname(full_path), archive_name)
+        if _needs_job(full_path):
+            return _start_job('compress', f"压缩 {req_path}", compress_path, full_path, archive_path, archive_format)
+        tpool.execute(compress_path, NO_PROGRESS, full_path, archive_path, archive_format)
+
         return jsonify({"status": "success", "message": f"'{req_path}' 已成功压缩为 '{os.path.basename(archive_name)}'。"}), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -359,7 +529,7 @@ def compress_file_or_folder():
 @file_manager_bp.route('/files/decompress', methods=['POST'])
 @login_required
 def decompress_file():
-    """解压文件。"""
+    """解压文件，较大的压缩文件在后台任务中解压。"""
     try:
         req_path = request.json.get('path', '')
         destination = request.json.get('destination', '')
@@ -380,22 +550,103 @@ def decompress_file():
 
         os.makedirs(full_destination, exist_ok=True)
 
-        if zipfile.is_zipfile(full_path):
-            with zipfile.ZipFile(full_path, 'r') as zf:
-                zf.extractall(full_destination)
-        elif tarfile.is_tarfile(full_path):
-            with tarfile.open(full_path, 'r:*') as tar:
-                tar.extractall(full_destination)
-        else:
+        if not zipfile.is_zipfile(full_path) and not tarfile.is_tarfile(full_path):
             return jsonify({"status": "error", "message": "不支持的解压文件格式。"}), 400
-        
+        if os.path.getsize(full_path) > JOB_SYNC_BYTES:
+            return _start_job('decompress', f"解压 {req_path}", extract_archive, full_path, full_destination)
+        tpool.execute(extract_archive, NO_PROGRESS, full_path, full_destination)
+
         return jsonify({"status": "success", "message": f"'{req_path}' 已成功解压到 '{destination if destination else os.path.basename(full_destination)}'。"}), 200
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
+def _search_item(directory, name, is_dir, size, mtime, mode):
+    entry_path = os.path.join(directory, name)
+    return {
+        "name": name,
+        "type": "directory" if is_dir else "file",
+        "path": entry_path.replace("\\", "/"),
+        "size": size,
+        "last_modified": datetime.datetime.fromtimestamp(mtime).isoformat(),
+        "permissions": oct(mode & 0o777)
+    }
+
+def _take_matches(matches, count, until):
+    """
+    在线程池中从遍历生成器取出最多 count 条结果，到达 until 时刻后提前返回，
+    返回 (结果列表, 是否已遍历完)。
+    """
+    items = []
+    for match in matches:
+        if match is not None:
+            items.append(_search_item(*match))
+            if len(items) >= count:
+                return items, False
+        if time.monotonic() >= until:
+            return items, False
+    return items, True
+
+def _search_batches(full_path, query, limit, budget, state, index, excludes):
+    """
+    搜索管道：逐批产生结果列表，结束原因记录在 state 中。
+    使用索引时一次查询即可返回；实时遍历时每批最多搜索 SEARCH_BATCH_SECONDS 秒，
+    批与批之间检查取消请求和时间预算。
+    """
+    deadline = time.monotonic() + budget
+    if index is not None:
+        rows = tpool.execute(index.search, full_path, query, limit + 1)
+        state['truncated'] = len(rows) > limit
+        yield [_search_item(*row) for row in rows[:limit]]
+        return
+
+    matches = walk_matches(full_path, query, excludes)
+    found = 0
+    try:
+        while True:
+            if state['cancelled']:
+                return
+            now = time.monotonic()
+            if now >= deadline:
+                state['timed_out'] = True
+                return
+            # 多取一条用于判断结果是否被截断
+            items, done = tpool.execute(_take_matches, matches, limit + 1 - found,
+                                        min(deadline, now + SEARCH_BATCH_SECONDS))
+            found += len(items)
+            if found > limit:
+                state['truncated'] = True
+                items = items[:limit - found]
+            if items:
+                yield items
+            if done or state['truncated']:
+                return
+    finally:
+        matches.close()
+
+def _stream_search(batches, state, header):
+    """以 NDJSON 逐行输出搜索结果：start 行、若干 items 行和 end 行。"""
+    _active_searches[state['id']] = state
+    try:
+        yield json.dumps(dict(header, type="start", search_id=state['id']), ensure_ascii=False) + '\n'
+        count = 0
+        for items in batches:
+            count += len(items)
+            yield json.dumps({"type": "items", "items": items}, ensure_ascii=False) + '\n'
+        yield json.dumps({"type": "end", "count": count, "truncated": state['truncated'],
+                          "timed_out": state['timed_out'], "cancelled": state['cancelled']}) + '\n'
+    finally:
+        # 客户端断开连接时生成器被关闭，遍历随之停止
+        batches.close()
+        _active_searches.pop(state['id'], None)
+
 @file_manager_bp.route('/files/search')
 @login_required
 def search_files():
-    """在指定路径下递归搜索文件和文件夹。"""
+    """
+    在指定路径下递归搜索文件和文件夹。
+    路径已被元数据索引覆盖时直接查询索引，否则实时遍历目录；两者都在线程池中执行，不会阻塞其他请求。
+    stream=1 时以 NDJSON 流式返回，边搜索边输出，客户端可断开连接或调用取消接口停止搜索。
+    可选参数：limit 最多结果数，timeout 搜索时间预算（秒），search_id 用于取消的标识。
+    """
     try:
         query = request.args.get('query', '').strip()
         search_path = request.args.get('path', '')
@@ -407,43 +658,49 @@ def search_files():
         if error_response:
             return error_response
 
-        items = []
-        for root, dirs, files in os.walk(full_path):
-            # 检查文件名和文件夹名是否匹配查询
-            for name in files + dirs:
-                if query.lower() in name.lower():
-                    try:
-                        entry_path = os.path.join(root, name)
-                        stat_info = os.stat(entry_path)
-                        is_dir = os.path.isdir(entry_path)
-                        
-                        # 安全检查：确保非管理员无法看到根目录之外的搜索结果
-                        if not is_admin():
-                            safe_root = current_app.config['FILE_MANAGER_ROOT']
-                            if not os.path.abspath(entry_path).startswith(safe_root):
-                                continue
-
-                        items.append({
-                            "name": name,
-                            "type": "directory" if is_dir else "file",
-                            "path": entry_path.replace("\\", "/"),
-                            "size": stat_info.st_size,
-                            "last_modified": datetime.datetime.fromtimestamp(stat_info.st_mtime).isoformat(),
-                            "permissions": oct(stat_info.st_mode & 0o777)
-                        })
-                    except (OSError, FileNotFoundError):
-                        # 忽略无法访问的文件或损坏的链接
-                        continue
-        
-        return jsonify({
-            "items": items,
-            "total_pages": 1,
-            "current_page": 1,
+        limit = min(max(request.args.get('limit', MAX_SEARCH_RESULTS, type=int), 1), MAX_SEARCH_LIMIT)
+        budget = min(max(request.args.get('timeout', DEFAULT_SEARCH_TIMEOUT, type=float), 0.1), MAX_SEARCH_TIMEOUT)
+        search_id = request.args.get('search_id') or uuid.uuid4().hex
+
+        index = get_file_index()
+        if index is not None and not index.covers(full_path):
+            index = None
+        excludes = search_excludes(current_app.config['FILE_INDEX_EXCLUDE'])
+        state = {'id': search_id, 'cancelled': False, 'truncated': False, 'timed_out': False}
+        batches = _search_batches(full_path, query, limit, budget, state, index, excludes)
+        header = {
             "current_full_path": f"在 '{full_path}' 中搜索 '{query}' 的结果",
-            "is_search_result": True
-        })
+            "is_search_result": True,
+            "indexed": index is not None
+        }
+
+        if request.args.get('stream') == '1':
+            return Response(_stream_search(batches, state, header), mimetype='application/x-ndjson',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+        items = [item for batch in batches for item in batch]
+        return jsonify(dict(header, items=items, total_pages=1, current_page=1,
+                            truncated=state['truncated'], timed_out=state['timed_out']))
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
+
+@file_manager_bp.route('/files/search/<search_id>', methods=['DELETE'])
+@login_required
+def cancel_search(search_id):
+    """取消一个正在进行的流式搜索。"""
+    state = _active_searches.get(search_id)
+    if state is None:
+        return jsonify({"status": "error", "message": "Search not found."}), 404
+    state['cancelled'] = True
+    return jsonify({"status": "success", "message": "Search cancelled."})
+
+@file_manager_bp.after_request
+def _rescan_after_change(response):
+    """文件管理器中的写操作成功后，让索引尽快重新扫描变化的目录。"""
+    if request.method == 'POST' and response.status_code < 400:
+        request_rescan()
+    return response
+
 BOOKMARKS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bookmarks.json')
 
 def _load_bookmarks():
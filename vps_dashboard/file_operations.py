@@ -0,0 +1,211 @@
+import os
+import stat
+import shutil
+import tarfile
+import zipfile
+from .archive_stream import ZipStream, TarGzStream
+
+# 复制文件时每次读写的字节数
+COPY_BYTES = 1024 * 1024
+
+class _NoProgress:
+    """同步执行操作时代替 Job，不报告进度也不会被取消。"""
+
+    def set_total(self, total_bytes=None, total_files=None):
+        pass
+
+    def advance(self, num_bytes=0, num_files=0):
+        pass
+
+NO_PROGRESS = _NoProgress()
+
+def measure_tree(path, max_entries=None):
+    """
+    统计 path 下的条目数（包括目录）和普通文件的总字节数，不跟随符号链接。
+    给出 max_entries 且条目数超过它时提前返回 None。
+    """
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        return 1, st.st_size if stat.S_ISREG(st.st_mode) else 0
+    entries, total_bytes = 1, 0
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                entries += 1
+                if max_entries is not None and entries > max_entries:
+                    return None
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total_bytes += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    pass
+    return entries, total_bytes
+
+def delete_path(job, path):
+    """删除文件或整个目录树，每删除一个条目报告一次进度。"""
+    if os.path.islink(path) or not os.path.isdir(path):
+        os.remove(path)
+        job.advance(num_files=1)
+        return f"Successfully deleted {path}"
+    entries, _ = measure_tree(path)
+    job.set_total(total_files=entries)
+
+    def onerror(error):
+        raise error
+
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False, onerror=onerror):
+        for name in filenames:
+            os.remove(os.path.join(dirpath, name))
+            job.advance(num_files=1)
+        for name in dirnames:
+            # os.walk 把目录的符号链接也列在 dirnames 中，但不会进入
+            subdir = os.path.join(dirpath, name)
+            if os.path.islink(subdir):
+                os.remove(subdir)
+            else:
+                os.rmdir(subdir)
+            job.advance(num_files=1)
+    os.rmdir(path)
+    job.advance(num_files=1)
+    return f"Successfully deleted {path}"
+
+def _copy_file(job, src, dst):
+    with open(src, 'rb') as fsrc, open(dst, 'xb') as fdst:
+        while True:
+            data = fsrc.read(COPY_BYTES)
+            if not data:
+                break
+            fdst.write(data)
+            job.advance(num_bytes=len(data))
+    shutil.copystat(src, dst)
+    job.advance(num_files=1)
+
+def _copy_special(job, src, dst, st):
+    """
+    重建 FIFO 和设备文件（设备文件需要 root 权限）。套接字无法复制，抛出异常，
+    由调用方清理已复制的部分，源保持不变。
+    """
+    if stat.S_ISFIFO(st.st_mode):
+        os.mkfifo(dst, stat.S_IMODE(st.st_mode))
+    elif stat.S_ISCHR(st.st_mode) or stat.S_ISBLK(st.st_mode):
+        os.mknod(dst, st.st_mode, st.st_rdev)
+    else:
+        raise ValueError(f"无法跨文件系统移动特殊文件 '{src}'。")
+    shutil.copystat(src, dst, follow_symlinks=False)
+    job.advance(num_files=1)
+
+def _copy_entry(job, src, dst):
+    """按类型复制一个条目，符号链接复制链接本身。"""
+    st = os.lstat(src)
+    if stat.S_ISLNK(st.st_mode):
+        os.symlink(os.readlink(src), dst)
+        job.advance(num_files=1)
+    elif stat.S_ISDIR(st.st_mode):
+        _copy_tree(job, src, dst)
+    elif stat.S_ISREG(st.st_mode):
+        _copy_file(job, src, dst)
+    else:
+        _copy_special(job, src, dst, st)
+
+def _copy_tree(job, src, dst):
+    """复制目录树（符号链接按链接本身复制），目录的权限和时间在其内容复制完之后设置。"""
+    os.mkdir(dst)
+    job.advance(num_files=1)
+    with os.scandir(src) as it:
+        entries = list(it)
+    for entry in entries:
+        _copy_entry(job, entry.path, os.path.join(dst, entry.name))
+    shutil.copystat(src, dst)
+
+def move_across_filesystems(job, src, dst):
+    """
+    跨文件系统移动（os.rename 返回 EXDEV 时）：先复制并报告字节进度，全部复制成功后
+    再删除源。复制中途失败（包括遇到无法复制的套接字）或被取消时删除已复制的部分，
+    源保持不变。
+    """
+    entries, total_bytes = measure_tree(src)
+    job.set_total(total_bytes=total_bytes, total_files=entries)
+    try:
+        _copy_entry(job, src, dst)
+    except BaseException:
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst, ignore_errors=True)
+        elif os.path.lexists(dst):
+            os.remove(dst)
+        raise
+    if os.path.isdir(src) and not os.path.islink(src):
+        shutil.rmtree(src)
+    else:
+        os.remove(src)
+    return f"Renamed '{src}' to '{dst}'."
+
+def compress_path(job, src, archive_path, archive_format):
+    """
+    把文件或目录压缩为 archive_path。目录的内容位于归档顶层（与 shutil.make_archive 相同）。
+    先写入同目录下的临时文件，完成后原子地重命名，失败或取消时删除临时文件。
+    """
+    entries, total_bytes = measure_tree(src)
+    if os.path.isdir(src):
+        # 目录本身不在归档中，只有其内容
+        arcname = ''
+        entries -= 1
+    else:
+        arcname = os.path.basename(src)
+    job.set_total(total_bytes=total_bytes, total_files=entries)
+    stream = (ZipStream if archive_format == 'zip' else TarGzStream)(src, arcname)
+    directory, name = os.path.split(archive_path)
+    part_path = os.path.join(directory, f".{name}.part")
+    try:
+        with open(part_path, 'wb') as out:
+            done = False
+            while not done:
+                read_bytes, entry_count = stream.read_bytes, stream.entry_count
+                data, done = stream.step()
+                out.write(data)
+                job.advance(stream.read_bytes - read_bytes, stream.entry_count - entry_count)
+        os.replace(part_path, archive_path)
+    except BaseException:
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        stream.close()
+    return f"'{src}' 已成功压缩为 '{name}'。"
+
+def _report_members(job, members, size_of):
+    """在 extractall 逐个取得成员时报告上一个成员已完成，并响应取消。"""
+    previous = None
+    for member in members:
+        if previous is not None:
+            job.advance(*size_of(previous))
+        previous = member
+        yield member
+    if previous is not None:
+        job.advance(*size_of(previous))
+
+def extract_archive(job, archive_path, destination):
+    """解压 zip 或 tar（支持各种压缩）文件，按成员报告进度。"""
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path, 'r') as zf:
+            members = zf.infolist()
+            job.set_total(total_bytes=sum(info.file_size for info in members), total_files=len(members))
+            zf.extractall(destination, members=_report_members(job, members, lambda info: (info.file_size, 1)))
+    elif tarfile.is_tarfile(archive_path):
+        # tar 的解压后大小事先未知，以读取的压缩文件字节数作为进度
+        with open(archive_path, 'rb') as raw, tarfile.open(fileobj=raw, mode='r:*') as tar:
+            job.set_total(total_bytes=os.fstat(raw.fileno()).st_size)
+            position = [0]
+
+            def consumed(member):
+                offset, position[0] = position[0], raw.tell()
+                return position[0] - offset, 1
+
+            tar.extractall(destination, members=_report_members(job, tar, consumed))
+    else:
+        raise ValueError("不支持的解压文件格式。")
+    return f"'{archive_path}' 已成功解压到 '{destination}'。"
@@ -0,0 +1,225 @@
+import os
+import uuid
+import socket
+import mimetypes
+from urllib.parse import quote
+from eventlet.hubs import trampoline
+from flask import Response
+from werkzeug.http import http_date, parse_date
+
+# 不能使用 sendfile 时每次读取并发送的字节数
+CHUNK_BYTES = 256 * 1024
+
+# 单次 sendfile 调用最多发送的字节数，发送之间让出协程
+SENDFILE_BYTES = 8 * 1024 * 1024
+
+# 一个请求最多接受的区间数，超出时忽略 Range 头返回整个文件
+MAX_RANGES = 32
+
+def file_etag(st):
+    """由 inode、大小和修改时间组成的强 ETag，文件被替换或修改后随之变化。"""
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+def parse_ranges(header, size):
+    """
+    解析 Range 头，返回按起点排序、合并了重叠部分的 [(start, end)]（end 不含）。
+    没有 Range 头、格式无效或区间过多时返回 None（应返回整个文件），
+    所有区间都无法满足时返回空列表（应返回 416）。
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, sep, last = part.partition('-')
+        if not sep:
+            return None
+        try:
+            if not first:
+                # 后缀区间：最后 N 个字节
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size
+            else:
+                start = int(first)
+                end = int(last) + 1 if last else size
+                if start < 0 or (last and end <= start):
+                    return None
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _if_range_matches(value, etag, mtime):
+    """If-Range 可以是 ETag（必须完全一致）或日期（必须等于 Last-Modified）。"""
+    if value.startswith('"') or value.startswith('W/'):
+        return value == etag
+    date = parse_date(value)
+    return date is not None and int(date.timestamp()) == int(mtime)
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags or f'W/{etag}' in tags
+    since = request.headers.get('If-Modified-Since')
+    if since:
+        date = parse_date(since)
+        return date is not None and int(mtime) <= int(date.timestamp())
+    return False
+
+def _sendfile_socket(environ):
+    """eventlet 的 WSGI 服务器下取得客户端连接，可以对其使用 os.sendfile；其他服务器或 TLS 连接返回 None。"""
+    if not hasattr(os, 'sendfile'):
+        return None
+    sock = getattr(environ.get('eventlet.input'), '_sock', None)
+    if sock is None or hasattr(sock, 'getpeercert'):
+        return None
+    return sock
+
+def _sendfile(sock, fd, offset, count):
+    """用 sendfile 把文件的一段直接从页缓存发送到套接字，套接字写满时等待可写。"""
+    timeout = sock.gettimeout()
+    while count > 0:
+        try:
+            sent = os.sendfile(sock.fileno(), fd, offset, min(count, SENDFILE_BYTES))
+        except BlockingIOError:
+            trampoline(sock, write=True, timeout=timeout, timeout_exc=socket.timeout("timed out"))
+            continue
+        if sent == 0:
+            raise OSError("File was truncated while sending.")
+        offset += sent
+        count -= sent
+
+def _stream_segments(f, segments, sock):
+    """
+    依次发送 segments 中的字节串和文件区间 (start, end)。
+    响应头要等服务器写出第一段数据时才发送，因此开头的内容先攒够 CHUNK_BYTES 再产生
+    （eventlet 对不小于其 minimum_chunk_size 的数据立即写出）；此后响应头已在套接字上，
+    其余文件区间直接 sendfile，多区间的分隔头也直接写入套接字。
+    """
+    fd = f.fileno()
+    buffered = []
+    buffered_size = 0
+    direct = False
+    for segment in segments:
+        if isinstance(segment, bytes):
+            if direct:
+                sock.sendall(segment)
+            else:
+                buffered.append(segment)
+                buffered_size += len(segment)
+            continue
+        start, end = segment
+        while start < end:
+            if direct:
+                _sendfile(sock, fd, start, end - start)
+                break
+            data = _read_at(f, start, min(CHUNK_BYTES, end - start))
+            if not data:
+                raise OSError("File was truncated while sending.")
+            start += len(data)
+            buffered.append(data)
+            buffered_size += len(data)
+            if buffered_size >= CHUNK_BYTES:
+                yield b''.join(buffered)
+                buffered = []
+                buffered_size = 0
+                direct = sock is not None
+    if buffered:
+        yield b''.join(buffered)
+
+def _read_at(f, offset, size):
+    if hasattr(os, 'pread'):
+        return os.pread(f.fileno(), size, offset)
+    f.seek(offset)
+    return f.read(size)
+
+def content_disposition(filename, inline=False):
+    """attachment/inline 的 Content-Disposition，非 ASCII 文件名使用 RFC 5987 编码。"""
+    kind = 'inline' if inline else 'attachment'
+    if filename.isascii() and '"' not in filename and '\\' not in filename:
+        return f'{kind}; filename="{filename}"'
+    return f"{kind}; filename*=UTF-8''{quote(filename)}"
+
+def send_file_ranges(path, request, inline=False):
+    """
+    发送文件，支持条件请求（If-None-Match / If-Modified-Since）、Range / If-Range
+    断点续传以及多区间（multipart/byteranges）。在 eventlet 服务器上，首段数据之后的
+    文件内容通过 os.sendfile 零拷贝发送。
+    """
+    f = open(path, 'rb')
+    try:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        etag = file_etag(st)
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'ETag': etag,
+            'Last-Modified': http_date(st.st_mtime),
+            'Content-Disposition': content_disposition(os.path.basename(path), inline),
+        }
+
+        if _not_modified(request, etag, st.st_mtime):
+            f.close()
+            return Response(status=304, headers=headers)
+
+        ranges = parse_ranges(request.headers.get('Range'), size)
+        if_range = request.headers.get('If-Range')
+        if ranges is not None and if_range and not _if_range_matches(if_range, etag, st.st_mtime):
+            ranges = None
+
+        if ranges == []:
+            f.close()
+            headers['Content-Range'] = f'bytes */{size}'
+            return Response(status=416, headers=headers)
+
+        if ranges is None:
+            status = 200
+            segments = [(0, size)]
+            length = size
+            mimetype = content_type
+        elif len(ranges) == 1:
+            status = 206
+            start, end = ranges[0]
+            segments = [(start, end)]
+            length = end - start
+            mimetype = content_type
+            headers['Content-Range'] = f'bytes {start}-{end - 1}/{size}'
+        else:
+            status = 206
+            boundary = uuid.uuid4().hex
+            segments = []
+            for start, end in ranges:
+                segments.append((f'\r\n--{boundary}\r\nContent-Type: {content_type}\r\n'
+                                 f'Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n').encode())
+                segments.append((start, end))
+            segments.append(f'\r\n--{boundary}--\r\n'.encode())
+            length = sum(len(s) if isinstance(s, bytes) else s[1] - s[0] for s in segments)
+            mimetype = f'multipart/byteranges; boundary={boundary}'
+
+        headers['Content-Length'] = str(length)
+        sock = _sendfile_socket(request.environ)
+        response = Response(_stream_segments(f, segments, sock), status=status, mimetype=mimetype,
+                            headers=headers, direct_passthrough=True)
+        response.call_on_close(f.close)
+        return response
+    except Exception:
+        f.close()
+        raise
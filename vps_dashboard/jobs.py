@@ -0,0 +1,229 @@
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, jsonify, request, session
+from flask_socketio import join_room
+from .utils import login_required
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+# 任务进度通过 Socket.IO 推送给打开文件管理器的页面
+JOBS_NAMESPACE = '/jobs'
+JOBS_ROOM = 'job-watchers'
+
+# 推送进度的间隔（秒），同一任务在一个间隔内的多次更新只推送一次
+PROGRESS_INTERVAL = 0.5
+
+# 已结束的任务保留的秒数和最多保留的个数
+FINISHED_JOB_RETENTION = 3600
+MAX_FINISHED_JOBS = 100
+
+FINISHED_STATES = ('completed', 'failed', 'cancelled')
+
+_jobs = {}  # job_id -> Job
+_job_state = {
+    'executor': None,
+}
+
+class JobCancelled(Exception):
+    """任务被取消，由 Job.advance / check_cancelled 在工作线程中抛出。"""
+
+class JobError(Exception):
+    """任务操作的错误，code 为对应的 HTTP 状态码。"""
+
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.code = code
+
+class Job:
+    """
+    一个在线程池中执行的耗时操作。
+
+    操作函数在工作线程中运行，通过 set_total / advance 报告已处理的字节数和文件数，
+    并在 advance 时响应取消请求。进度只记录在对象上，由监视协程定期推送，
+    工作线程本身不接触 eventlet 的事件循环。
+    """
+
+    def __init__(self, kind, title, on_done=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.title = title
+        self.state = 'queued'
+        self.message = None
+        self.total_bytes = None
+        self.done_bytes = 0
+        self.total_files = None
+        self.done_files = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.on_done = on_done
+        self.version = 0
+        self._cancel = threading.Event()
+        self._future = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "title": self.title,
+            "state": self.state,
+            "message": self.message,
+            "total_bytes": self.total_bytes,
+            "done_bytes": self.done_bytes,
+            "total_files": self.total_files,
+            "done_files": self.done_files,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+    def set_total(self, total_bytes=None, total_files=None):
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.version += 1
+
+    def advance(self, num_bytes=0, num_files=0):
+        """记录新完成的字节数和文件数；任务已被取消时抛出 JobCancelled。"""
+        self.done_bytes += num_bytes
+        self.done_files += num_files
+        self.version += 1
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        """请求取消。排队中的任务直接取消，运行中的任务在下一次报告进度时停止。"""
+        if self.state in FINISHED_STATES:
+            raise JobError("Job has already finished.", 409)
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self._finish('cancelled', "已取消。")
+
+    def _finish(self, state, message):
+        self.state = state
+        self.message = message
+        self.finished = time.time()
+        self.version += 1
+
+    def _run(self, func, args):
+        """在工作线程中执行操作函数，函数的返回值作为完成时的消息。"""
+        if self._cancel.is_set():
+            self._finish('cancelled', "已取消。")
+            return
+        self.state = 'running'
+        self.started = time.time()
+        self.version += 1
+        try:
+            message = func(self, *args)
+        except JobCancelled:
+            self._finish('cancelled', "已取消。")
+        except Exception as e:
+            logging.warning(f"Job {self.id} ({self.title}) failed: {e}")
+            self._finish('failed', str(e))
+        else:
+            self._finish('completed', message)
+
+def submit_job(kind, title, func, *args, on_done=None):
+    """
+    提交一个任务，func(job, *args) 在线程池中执行。on_done 在任务结束后于
+    eventlet 协程中调用，可用于刷新缓存等后续处理。
+    """
+    executor = _job_state['executor']
+    if executor is None:
+        raise JobError("Job workers are not running.", 503)
+    _expire_jobs()
+    job = Job(kind, title, on_done)
+    _jobs[job.id] = job
+    job._future = executor.submit(job._run, func, args)
+    return job
+
+def get_job(job_id):
+    job = _jobs.get(job_id)
+    if job is None:
+        raise JobError("Job not found.", 404)
+    return job
+
+def _expire_jobs():
+    finished = sorted((job for job in _jobs.values() if job.state in FINISHED_STATES), key=lambda job: job.finished)
+    cutoff = time.time() - FINISHED_JOB_RETENTION
+    for i, job in enumerate(finished):
+        if job.finished < cutoff or len(finished) - i > MAX_FINISHED_JOBS:
+            del _jobs[job.id]
+
+def _job_monitor_loop(socketio):
+    """推送有变化的任务，并在任务结束后调用其 on_done。"""
+    sent = {}  # job_id -> 已推送的版本
+    while True:
+        for job in list(_jobs.values()):
+            if sent.get(job.id) == job.version:
+                continue
+            sent[job.id] = job.version
+            socketio.emit('job-update', job.to_dict(), namespace=JOBS_NAMESPACE, to=JOBS_ROOM)
+            if job.state in FINISHED_STATES and job.on_done is not None:
+                on_done, job.on_done = job.on_done, None
+                try:
+                    on_done()
+                except Exception as e:
+                    logging.warning(f"Job {job.id} completion callback failed: {e}")
+        for job_id in list(sent):
+            if job_id not in _jobs:
+                del sent[job_id]
+        socketio.sleep(PROGRESS_INTERVAL)
+
+def start_job_workers(socketio, workers):
+    """创建任务线程池并启动推送进度的协程，重复调用不会重复创建。"""
+    if _job_state['executor'] is not None:
+        return
+    _job_state['executor'] = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='job')
+    socketio.start_background_task(_job_monitor_loop, socketio)
+
+@jobs_bp.route('/')
+@login_required
+def list_jobs():
+    """列出进行中和最近结束的任务，按创建时间倒序。"""
+    _expire_jobs()
+    jobs = sorted(_jobs.values(), key=lambda job: job.created, reverse=True)
+    state = request.args.get('state')
+    if state:
+        jobs = [job for job in jobs if job.state == state]
+    return jsonify({"status": "success", "jobs": [job.to_dict() for job in jobs]})
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@login_required
+def get_job_status(job_id):
+    try:
+        return jsonify({"status": "success", "job": get_job(job_id).to_dict()})
+    except JobError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.code
+
+@jobs_bp.route('/<job_id>', methods=['DELETE'])
+@login_required
+def cancel_job(job_id):
+    """取消排队中或运行中的任务；已结束的任务从列表中移除。"""
+    try:
+        job = get_job(job_id)
+        if job.state in FINISHED_STATES:
+            _jobs.pop(job_id, None)
+            return jsonify({"status": "success", "message": "任务已从列表中移除。"})
+        job.cancel()
+        return jsonify({"status": "success", "message": "已请求取消任务。", "job": job.to_dict()})
+    except JobError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.code
+
+def register_socketio_events(socketio):
+    """注册任务进度的 Socket.IO 事件。"""
+
+    @socketio.on("connect", namespace=JOBS_NAMESPACE)
+    def connect():
+        """页面加入共享房间接收进度，并立即收到当前所有任务的状态。"""
+        if 'logged_in' not in session:
+            logging.warning(f"Unauthorized jobs connection attempt from SID {request.sid}.")
+            return False  # 拒绝未认证的连接
+        join_room(JOBS_ROOM)
+        for job in sorted(_jobs.values(), key=lambda job: job.created):
+            socketio.emit('job-update', job.to_dict(), namespace=JOBS_NAMESPACE, to=request.sid)
@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import logging
+import subprocess
+from eventlet.hubs import trampoline
+
+# journalctl 的日志级别，下标即数字级别
+PRIORITY_NAMES = ('emerg', 'alert', 'crit', 'err', 'warning', 'notice', 'info', 'debug')
+
+# 单元名和时间参数允许的字符，参数总是以 --opt=value 的形式传给 journalctl
+UNIT_PATTERN = re.compile(r'^[\w@:.\\-]+$')
+TIME_PATTERN = re.compile(r'^[\w :+-]+$')
+
+# 跟踪模式下单次读取的最大字节数
+MAX_READ_BYTES = 64 * 1024
+
+def parse_priority(value):
+    """把 'err'、'3' 等解析为数字级别；为空时返回 None，无效时抛出 ValueError。"""
+    if value in (None, ''):
+        return None
+    value = str(value).lower()
+    if value.isdigit() and int(value) < len(PRIORITY_NAMES):
+        return int(value)
+    if value in PRIORITY_NAMES:
+        return PRIORITY_NAMES.index(value)
+    raise ValueError(f"Invalid priority: {value}")
+
+def time_arg(value):
+    """校验 --since/--until 的取值：纯数字视为 unix 秒，其余按 journalctl 的时间格式原样传递。"""
+    if value in (None, ''):
+        return None
+    value = str(value).strip()
+    if value.isdigit():
+        return '@' + value
+    if not TIME_PATTERN.match(value):
+        raise ValueError(f"Invalid time: {value}")
+    return value
+
+def journal_command(unit, priority=None, since=None, until=None):
+    """构造按单元、级别和时间过滤的 journalctl JSON 输出命令。"""
+    command = ["journalctl", f"--unit={unit}", "--output=json", "--no-pager"]
+    if priority is not None:
+        command.append(f"--priority={priority}")
+    if since:
+        command.append(f"--since={since}")
+    if until:
+        command.append(f"--until={until}")
+    return command
+
+def parse_entry(line):
+    """把 journalctl -o json 的一行转换为精简的日志条目，无法解析时返回 None。"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    message = record.get('MESSAGE', '')
+    if isinstance(message, list):
+        # 非 UTF-8 的消息以字节数组表示
+        message = bytes(message).decode('utf-8', errors='replace')
+    priority = record.get('PRIORITY')
+    return {
+        "cursor": record.get('__CURSOR'),
+        "timestamp": int(record.get('__REALTIME_TIMESTAMP', 0)) / 1e6,
+        "priority": int(priority) if priority is not None else None,
+        "identifier": record.get('SYSLOG_IDENTIFIER') or record.get('_COMM', ''),
+        "pid": record.get('_PID'),
+        "message": message or '',
+    }
+
+def read_page(unit, lines, before=None, priority=None, since=None, until=None):
+    """
+    读取一页日志，按时间升序返回 (条目列表, 更早一页的游标)。
+    before 为游标时返回该条目之前的 lines 条；没有更早的日志时游标为 None。
+    """
+    command = journal_command(unit, priority, since, until) + ["--reverse", f"--lines={lines}"]
+    if before:
+        # 倒序读取时 --after-cursor 表示从该条目的前一条开始
+        command.append(f"--after-cursor={before}")
+    result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8')
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "journalctl failed.")
+    entries = [entry for entry in map(parse_entry, result.stdout.splitlines()) if entry is not None]
+    entries.reverse()
+    next_cursor = entries[0]['cursor'] if len(entries) >= lines else None
+    return entries, next_cursor
+
+class JournalFollowers:
+    """
+    每个单元只运行一个 `journalctl -f -o json` 进程，由所有查看该单元日志的客户端共享。
+    新条目按客户端选择的级别分别广播到对应房间，级别过滤在服务端完成。
+    最后一个客户端离开后终止进程。
+    """
+
+    def __init__(self, socketio, namespace):
+        self.socketio = socketio
+        self.namespace = namespace
+        self._followers = {}  # 单元名 -> {'proc', 'viewers': {sid: 级别}}
+        self._viewers = {}    # sid -> 单元名
+
+    @staticmethod
+    def room(unit, priority):
+        return f"journal:{unit}:{priority}"
+
+    def follow(self, sid, unit, priority):
+        """让客户端跟踪某个单元的日志；priority 为 None 时接收所有级别。"""
+        self.unfollow(sid)
+        priority = len(PRIORITY_NAMES) - 1 if priority is None else priority
+        follower = self._followers.get(unit)
+        if follower is None:
+            proc = subprocess.Popen(journal_command(unit) + ["--follow", "--lines=0"],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            os.set_blocking(proc.stdout.fileno(), False)
+            follower = self._followers[unit] = {'proc': proc, 'viewers': {}}
+            self.socketio.start_background_task(self._read_loop, unit, follower)
+            logging.info(f"Started journal follower for {unit}.")
+        follower['viewers'][sid] = priority
+        self._viewers[sid] = unit
+        self.socketio.server.enter_room(sid, self.room(unit, priority), namespace=self.namespace)
+
+    def unfollow(self, sid):
+        unit = self._viewers.pop(sid, None)
+        follower = self._followers.get(unit)
+        if follower is None:
+            return
+        priority = follower['viewers'].pop(sid, None)
+        self.socketio.server.leave_room(sid, self.room(unit, priority), namespace=self.namespace)
+        if not follower['viewers']:
+            # 读取协程在管道 EOF 后自行退出并回收进程
+            del self._followers[unit]
+            follower['proc'].terminate()
+            logging.info(f"Stopped journal follower for {unit}.")
+
+    def _read_loop(self, unit, follower):
+        proc = follower['proc']
+        fd = proc.stdout.fileno()
+        pending = b''
+        try:
+            while True:
+                trampoline(fd, read=True)
+                try:
+                    data = os.read(fd, MAX_READ_BYTES)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    break
+                # 一次读取中的所有完整行合并为一次广播
+                *lines, pending = (pending + data).split(b'\n')
+                entries = [entry for entry in map(parse_entry, lines) if entry is not None]
+                if entries:
+                    self._broadcast(unit, follower, entries)
+        finally:
+            proc.stdout.close()
+            while proc.poll() is None:
+                self.socketio.sleep(0.05)
+            if self._followers.get(unit) is follower:
+                # journalctl 意外退出，通知客户端并让它们离开房间
+                del self._followers[unit]
+                for priority in set(follower['viewers'].values()):
+                    self.socketio.emit('journal-ended', {"unit": unit}, namespace=self.namespace,
+                                       to=self.room(unit, priority))
+                for sid, priority in follower['viewers'].items():
+                    self._viewers.pop(sid, None)
+                    self.socketio.server.leave_room(sid, self.room(unit, priority), namespace=self.namespace)
+
+    def _broadcast(self, unit, follower, entries):
+        for priority in set(follower['viewers'].values()):
+            matched = [entry for entry in entries if entry['priority'] is None or entry['priority'] <= priority]
+            if matched:
+                self.socketio.emit('journal-entries', {"unit": unit, "entries": matched},
+                                   namespace=self.namespace, to=self.room(unit, priority))
@@ -0,0 +1,172 @@
+import re
+import time
+from array import array
+
+# 历史序列中记录的指标，顺序即列顺序
+METRIC_NAMES = (
+    'cpu',              # 总体 CPU 占用率 (%)
+    'mem',              # 内存占用率 (%)
+    'disk',             # 所有分区合计的磁盘占用率 (%)
+    'net_sent_rate',    # 网络发送速率 (字节/秒)
+    'net_recv_rate',    # 网络接收速率 (字节/秒)
+    'disk_read_rate',   # 磁盘读取速率 (字节/秒)
+    'disk_write_rate',  # 磁盘写入速率 (字节/秒)
+)
+
+# 各级分辨率：(步长秒数, 保留的点数)
+# 1 秒保留 10 分钟，1 分钟保留 24 小时，5 分钟保留 7 天
+DEFAULT_TIERS = (
+    (1, 600),
+    (60, 1440),
+    (300, 2016),
+)
+
+# 从持久化存储读取长时间范围时，返回的最大点数
+MAX_STORE_POINTS = 2000
+
+_RANGE_PATTERN = re.compile(r'^(\d+)([smhd]?)$')
+_RANGE_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_range(value):
+    """将 '10m'、'24h'、'7d' 或纯秒数解析为秒数，格式无效时返回 None。"""
+    match = _RANGE_PATTERN.match((value or '').strip().lower())
+    if not match:
+        return None
+    seconds = int(match.group(1)) * _RANGE_UNITS[match.group(2)]
+    return seconds if seconds > 0 else None
+
+class RingSeries:
+    """
+    固定容量的列式环形缓冲区，数据保存在 array 中，内存占用与运行时长无关。
+    写入的每个点先累加到当前时间桶，桶结束时写入平均值，实现增量降采样。
+    """
+
+    def __init__(self, step, capacity, width=len(METRIC_NAMES)):
+        self.step = step
+        self.capacity = capacity
+        self.width = width
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity * width))
+        self.head = 0   # 下一个写入位置
+        self.count = 0
+        # 当前时间桶的累加器
+        self._bucket = None
+        self._sums = [0.0] * width
+        self._n = 0
+
+    def add(self, ts, row):
+        """
+        加入一个原始点；当时间桶切换时，把上一个桶的平均值写入环形缓冲区，
+        并返回写入的 (timestamp, row)，否则返回 None。
+        """
+        flushed = None
+        bucket = int(ts // self.step)
+        if self._bucket is not None and bucket != self._bucket:
+            flushed = self._flush()
+        self._bucket = bucket
+        sums = self._sums
+        for i, v in enumerate(row):
+            sums[i] += v
+        self._n += 1
+        return flushed
+
+    def _flush(self):
+        if not self._n:
+            return None
+        ts = self._bucket * self.step
+        row = [total / self._n for total in self._sums]
+        self.put(ts, row)
+        self._sums = [0.0] * self.width
+        self._n = 0
+        return ts, row
+
+    def put(self, ts, row):
+        """直接写入一个已聚合的点（用于从持久化存储恢复）。"""
+        pos = self.head
+        self.timestamps[pos] = ts
+        base = pos * self.width
+        self.values[base:base + self.width] = array('d', row)
+        self.head = (pos + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    @property
+    def span(self):
+        """该分辨率能覆盖的时间跨度（秒）。"""
+        return self.step * self.capacity
+
+    def query(self, columns, since):
+        """返回 since 之后的时间戳列表和指定列的取值列表（按时间升序）。"""
+        start = (self.head - self.count) % self.capacity
+        timestamps = []
+        series = [[] for _ in columns]
+        for k in range(self.count):
+            pos = (start + k) % self.capacity
+            ts = self.timestamps[pos]
+            if ts < since:
+                continue
+            timestamps.append(int(ts))
+            base = pos * self.width
+            for j, col in enumerate(columns):
+                series[j].append(round(self.values[base + col], 2))
+        return timestamps, series
+
+class MetricsHistory:
+    """多分辨率的指标历史，每个原始采样同时写入所有分辨率。"""
+
+    def __init__(self, tiers=DEFAULT_TIERS):
+        self.tiers = [RingSeries(step, capacity) for step, capacity in tiers]
+        self.store = None
+
+    def attach_store(self, store):
+        """关联持久化存储，并用存储中最近的数据预热各级环形缓冲区。"""
+        self.store = store
+        now = time.time()
+        all_columns = list(range(len(METRIC_NAMES)))
+        for tier in self.tiers:
+            timestamps, series = store.read(tier.step, all_columns, now - tier.span)
+            for k in range(max(0, len(timestamps) - tier.capacity), len(timestamps)):
+                tier.put(timestamps[k], [col[k] for col in series])
+
+    def add(self, ts, row):
+        for tier in self.tiers:
+            flushed = tier.add(ts, row)
+            if flushed and self.store is not None:
+                self.store.append(tier.step, *flushed)
+
+    def pick_tier(self, range_seconds):
+        """选择能覆盖所需时间范围的最细分辨率。"""
+        for tier in self.tiers:
+            if tier.span >= range_seconds:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, metrics, range_seconds, now=None):
+        """返回紧凑的列式结果：{'step', 'timestamps', <metric>: [...]}。"""
+        now = time.time() if now is None else now
+        columns = [METRIC_NAMES.index(m) for m in metrics]
+        if range_seconds > self.tiers[-1].span and self.store is not None:
+            # 超出内存保留范围时，从最粗的持久化分辨率中按间隔抽样读取
+            step = self.tiers[-1].step
+            timestamps, series = self.store.read(step, columns, now - range_seconds, MAX_STORE_POINTS)
+        else:
+            tier = self.pick_tier(range_seconds)
+            step = tier.step
+            timestamps, series = tier.query(columns, now - range_seconds)
+        result = {"step": step, "timestamps": timestamps}
+        for name, values in zip(metrics, series):
+            result[name] = values
+        return result
+
+class RateTracker:
+    """把累计计数器（如 net_io_counters）转换为每秒速率。"""
+
+    def __init__(self):
+        self._last = {}
+
+    def rate(self, key, value, ts):
+        last = self._last.get(key)
+        self._last[key] = (value, ts)
+        if last is None or ts <= last[1] or value < last[0]:
+            # 首次采样或计数器被重置时没有可用的速率
+            return 0.0
+        return (value - last[0]) / (ts - last[1])
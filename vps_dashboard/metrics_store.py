@@ -0,0 +1,129 @@
+import os
+import math
+import mmap
+import struct
+import logging
+from bisect import bisect_left
+
+# 每个分段文件最多容纳的记录数，写满对应的时间跨度后切换到新分段
+ROWS_PER_SEGMENT = 4096
+
+class MetricsStore:
+    """
+    定宽二进制格式的指标持久化存储。
+
+    每个分辨率一个目录，目录内按时间切分为多个分段文件，每条记录为
+    (timestamp, v1, v2, ...) 的小端 double 数组。读取时通过 mmap 直接在
+    文件上二分查找和按列切片，不需要逐条解析。
+    """
+
+    def __init__(self, directory, retention, width, rows_per_segment=ROWS_PER_SEGMENT):
+        self.directory = directory
+        self.retention = dict(retention)  # 步长 -> 保留秒数
+        self.width = width
+        self.rows_per_segment = rows_per_segment
+        self.record = struct.Struct(f'<{width + 1}d')
+        self._open_segments = {}  # 步长 -> (分段编号, fd)
+        for step in self.retention:
+            os.makedirs(self._tier_dir(step), exist_ok=True)
+
+    def _tier_dir(self, step):
+        # 目录名包含列数，指标列变化后不会误读旧格式的数据
+        return os.path.join(self.directory, f'{step}s-w{self.width}')
+
+    def _segment_span(self, step):
+        return step * self.rows_per_segment
+
+    def _segment_path(self, step, segment):
+        return os.path.join(self._tier_dir(step), f'{segment}.bin')
+
+    def _segments(self, step):
+        """返回该分辨率下已有的分段编号（升序）。"""
+        segments = []
+        for name in os.listdir(self._tier_dir(step)):
+            stem, ext = os.path.splitext(name)
+            if ext == '.bin' and stem.isdigit():
+                segments.append(int(stem))
+        return sorted(segments)
+
+    def append(self, step, ts, row):
+        """追加一条记录，必要时切换分段并清理过期分段。"""
+        segment = int(ts // self._segment_span(step))
+        current = self._open_segments.get(step)
+        if current is None or current[0] != segment:
+            if current is not None:
+                os.close(current[1])
+            fd = os.open(self._segment_path(step, segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            # 截掉异常退出时可能留下的不完整记录
+            size = os.fstat(fd).st_size
+            if size % self.record.size:
+                os.ftruncate(fd, size - size % self.record.size)
+            self._open_segments[step] = (segment, fd)
+            self._enforce_retention(step, ts)
+        os.write(self._open_segments[step][1], self.record.pack(ts, *row))
+
+    def _enforce_retention(self, step, now):
+        """删除整段都已超出保留期限的分段文件。"""
+        span = self._segment_span(step)
+        cutoff = now - self.retention[step]
+        for segment in self._segments(step):
+            if (segment + 1) * span < cutoff:
+                try:
+                    os.remove(self._segment_path(step, segment))
+                except OSError as e:
+                    logging.warning(f"Failed to remove expired metrics segment: {e}")
+
+    def _first_index(self, path, count, since):
+        """在分段文件中二分查找第一条 timestamp >= since 的记录。"""
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), count * self.record.size, access=mmap.ACCESS_READ) as mm:
+            values = memoryview(mm).cast('d')
+            ts_column = values[0::self.width + 1]
+            try:
+                return bisect_left(ts_column, since)
+            finally:
+                ts_column.release()
+                values.release()
+
+    def read(self, step, columns, since, max_points=None):
+        """
+        读取 since 之后的记录，返回 (timestamps, [列值, ...])。
+        指定 max_points 时按固定间隔抽取，使返回的点数不超过该值。
+        """
+        span = self._segment_span(step)
+        width = self.width + 1
+        ranges = []
+        total = 0
+        for segment in self._segments(step):
+            if (segment + 1) * span <= since:
+                continue
+            path = self._segment_path(step, segment)
+            count = os.path.getsize(path) // self.record.size
+            first = self._first_index(path, count, since) if count else 0
+            if first < count:
+                ranges.append((path, count, first))
+                total += count - first
+
+        stride = max(1, math.ceil(total / max_points)) if max_points else 1
+        timestamps = []
+        series = [[] for _ in columns]
+        taken = 0  # 已经跨过的记录数，使抽样间隔在分段之间保持连续
+        for path, count, first in ranges:
+            start = first + (-taken) % stride
+            taken += count - first
+            if start >= count:
+                continue
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), count * self.record.size, access=mmap.ACCESS_READ) as mm:
+                values = memoryview(mm).cast('d')
+                try:
+                    end = count * width
+                    timestamps.extend(int(t) for t in values[start * width:end:width * stride].tolist())
+                    for out, col in zip(series, columns):
+                        out.extend(round(v, 2) for v in values[start * width + col + 1:end:width * stride].tolist())
+                finally:
+                    values.release()
+        return timestamps, series
+
+    def close(self):
+        for _, fd in self._open_segments.values():
+            os.close(fd)
+        self._open_segments.clear()
@@ -1,9 +1,59 @@
+import time
+import signal
 import psutil
 from flask import Blueprint, render_template, jsonify, request
+from . import socketio
 from .utils import login_required
+from .process_table import ProcessTable, SORTABLE_FIELDS, decode_cursor, row_filter, window_filter
 
 process_manager_bp = Blueprint('process_manager', __name__, url_prefix='/process_manager')
 
+# 所有请求共享的进程缓存，刷新间隔内的重复请求直接使用缓存结果
+process_table = ProcessTable()
+
+# 单页最多返回的进程数，以及列表中命令行的最大长度
+MAX_PAGE_SIZE = 1000
+CMDLINE_PREVIEW_LENGTH = 256
+
+# 进程详情的缓存时间（秒）以及列表类字段最多返回的条目数
+DETAIL_CACHE_TTL = 3
+DETAIL_LIST_LIMIT = 200
+
+# pid -> (过期时间, 进程 key, 详情数据)
+_detail_cache = {}
+
+# 结束进程时允许发送的信号；终止类信号会等待进程退出并在超时后升级为 SIGKILL
+ALLOWED_SIGNALS = ('SIGTERM', 'SIGKILL', 'SIGINT', 'SIGHUP', 'SIGQUIT', 'SIGUSR1', 'SIGUSR2', 'SIGSTOP', 'SIGCONT')
+TERMINATING_SIGNALS = tuple(getattr(signal, name) for name in ('SIGTERM', 'SIGINT', 'SIGHUP', 'SIGQUIT', 'SIGKILL') if hasattr(signal, name))
+DEFAULT_KILL_TIMEOUT = 3
+MAX_KILL_TIMEOUT = 30
+KILL_ESCALATION_TIMEOUT = 2
+KILL_POLL_INTERVAL = 0.1
+
+def _preview_row(row):
+    """列表中只返回命令行的前一部分，完整内容可在进程详情中查看。"""
+    if len(row['cmdline']) > CMDLINE_PREVIEW_LENGTH:
+        return {**row, "cmdline": row['cmdline'][:CMDLINE_PREVIEW_LENGTH], "cmdline_truncated": True}
+    return row
+
+def _list_filters():
+    return {"user": request.args.get('user'), "name": request.args.get('name'),
+            "status": request.args.get('status'), "search": request.args.get('q')}
+
+def _parse_signal(value):
+    """把信号名称（如 'TERM'、'SIGKILL'）或编号解析为 signal.Signals，不允许的信号返回 None。"""
+    if isinstance(value, int):
+        try:
+            value = signal.Signals(value).name
+        except ValueError:
+            return None
+    name = str(value).upper()
+    if not name.startswith('SIG'):
+        name = 'SIG' + name
+    if name not in ALLOWED_SIGNALS or not hasattr(signal, name):
+        return None
+    return getattr(signal, name)
+
 @process_manager_bp.route('/')
 @login_required
 def process_manager_index():
@@ -12,42 +62,322 @@ def process_manager_index():
 @process_manager_bp.route('/processes')
 @login_required
 def get_processes():
-    """获取所有正在运行的进程信息。"""
+    """
+    获取正在运行的进程信息，支持服务端过滤、排序和游标分页。
+    参数: sort, order (asc/desc), limit, cursor, user, name, status, q
+    """
+    try:
+        sort = request.args.get('sort', 'pid')
+        if sort not in SORTABLE_FIELDS:
+            return jsonify({"status": "error", "message": f"Invalid sort field: {sort}"}), 400
+        descending = request.args.get('order', 'asc') == 'desc'
+
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+        cursor = request.args.get('cursor')
+        try:
+            cursor = decode_cursor(cursor, sort) if cursor else None
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        process_table.refresh()
+        total, page, next_cursor = process_table.query(
+            sort=sort, descending=descending, limit=limit, cursor=cursor, **_list_filters())
+
+        return jsonify({
+            "status": "success",
+            "version": process_table.version,
+            "total": total,
+            "processes": [_preview_row(row) for row in page],
+            "next_cursor": next_cursor
+        })
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@process_manager_bp.route('/processes/delta')
+@login_required
+def get_processes_delta():
+    """
+    返回指定版本之后新增、删除和变化的进程行。
+
+    带 sort 参数时只针对分页列表已加载的窗口：sort、order 和过滤参数与 /processes 相同，
+    until 为已加载的最后一页返回的 next_cursor（已加载全部时省略）。离开窗口的行以 key
+    放在 removed 中，total 为当前匹配过滤条件的进程数；版本过旧时 full 为真且不带行数据，
+    客户端应重新按页查询。
+    """
     try:
-        processes_list = []
-        for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent', 'status', 'cmdline']):
+        since = request.args.get('since', type=int)
+        sort = request.args.get('sort')
+        window = None
+        if sort is not None:
+            if sort not in SORTABLE_FIELDS:
+                return jsonify({"status": "error", "message": f"Invalid sort field: {sort}"}), 400
+            until = request.args.get('until')
+            try:
+                until = decode_cursor(until, sort) if until else None
+            except ValueError as e:
+                return jsonify({"status": "error", "message": str(e)}), 400
+            window = window_filter(sort, request.args.get('order', 'asc') == 'desc', until, **_list_filters())
+
+        process_table.refresh()
+        delta = process_table.delta(since, window)
+        for field in ('processes', 'added', 'changed'):
+            if field in delta:
+                delta[field] = [_preview_row(row) for row in delta[field]]
+        if window is not None:
+            matches = row_filter(**_list_filters())
+            delta['total'] = sum(1 for row in process_table.rows() if matches(row))
+        return jsonify({"status": "success", **delta})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def _to_plain(value):
+    """把 psutil 返回的 namedtuple（及其列表）转换为可 JSON 序列化的结构。"""
+    if isinstance(value, list):
+        return [_to_plain(v) for v in value[:DETAIL_LIST_LIMIT]]
+    if hasattr(value, '_asdict'):
+        return {k: _to_plain(v) for k, v in value._asdict().items()}
+    if isinstance(value, tuple):
+        return list(value)
+    if hasattr(value, 'name') and hasattr(value, 'value'):
+        return value.name  # 枚举类型，例如连接的 family/type
+    return value
+
+def _collect_process_detail(proc):
+    """在 oneshot() 上下文中采集进程的开销较大的字段，并记录每个字段的耗时。"""
+    collectors = {
+        "memory_full_info": proc.memory_full_info,
+        "io_counters": proc.io_counters,
+        "num_fds": proc.num_fds,
+        "num_threads": proc.num_threads,
+        "threads": proc.threads,
+        "open_files": proc.open_files,
+        "connections": proc.net_connections,
+    }
+    detail = {}
+    timings = {}
+    errors = {}
+    with proc.oneshot():
+        detail["pid"] = proc.pid
+        detail["name"] = proc.name()
+        detail["cmdline"] = ' '.join(proc.cmdline())
+        for field, collect in collectors.items():
+            started = time.perf_counter()
             try:
-                pinfo = proc.as_dict(attrs=['pid', 'name', 'username', 'cpu_percent', 'memory_percent', 'status', 'cmdline'])
-                pinfo['cpu_percent'] = round(pinfo['cpu_percent'], 2)
-                pinfo['memory_percent'] = round(pinfo['memory_percent'], 2)
-                pinfo['cmdline'] = ' '.join(pinfo['cmdline']) if pinfo['cmdline'] else ''
-                processes_list.append(pinfo)
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
-        
-        return jsonify({"status": "success", "processes": processes_list})
+                value = collect()
+                detail[field] = _to_plain(value)
+                if isinstance(value, list):
+                    detail[f"{field}_count"] = len(value)
+            except psutil.AccessDenied:
+                detail[field] = None
+                errors[field] = "access denied"
+            except (AttributeError, NotImplementedError):
+                detail[field] = None
+                errors[field] = "not supported on this platform"
+            timings[field] = round((time.perf_counter() - started) * 1000, 3)
+    detail["timings_ms"] = timings
+    detail["errors"] = errors
+    return detail
+
+@process_manager_bp.route('/processes/<int:pid>')
+@login_required
+def get_process_detail(pid):
+    """按需获取单个进程的详细信息，结果按 pid 短暂缓存。"""
+    try:
+        now = time.monotonic()
+        for cached_pid in [p for p, c in _detail_cache.items() if c[0] <= now]:
+            del _detail_cache[cached_pid]
+
+        # 优先复用进程表中长期持有的 Process 对象
+        entry = process_table.get(pid)
+        if entry is not None and not entry.proc.is_running():
+            # 进程表刷新后进程已退出，或 pid 已被新进程复用（is_running 会比较创建时间）
+            raise psutil.NoSuchProcess(pid)
+        proc = entry.proc if entry is not None else psutil.Process(pid)
+        key = entry.key if entry is not None else f"{pid}-{int(proc.create_time() * 100)}"
+
+        cached = _detail_cache.get(pid)
+        if cached and cached[1] == key:
+            return jsonify({"status": "success", "cached": True, "detail": cached[2]})
+
+        detail = _collect_process_detail(proc)
+        detail["key"] = key
+        _detail_cache[pid] = (now + DETAIL_CACHE_TTL, key, detail)
+        return jsonify({"status": "success", "cached": False, "detail": detail})
+    except psutil.NoSuchProcess:
+        return jsonify({"status": "error", "message": f"进程 {pid} 不存在。"}), 404
+    except psutil.AccessDenied:
+        return jsonify({"status": "error", "message": f"权限不足，无法读取进程 {pid}。"}), 403
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@process_manager_bp.route('/processes/tree')
+@login_required
+def get_process_tree():
+    """
+    以树形结构（深度优先顺序的扁平列表）返回进程，每个节点附带子进程数和子树合计。
+    参数: root（只返回该进程的子树）、depth（默认展开的层数，省略时全部展开）、
+    expand / collapse（逗号分隔的 PID，强制展开或折叠）、limit（最多返回的行数）。
+    折叠节点的子树合计仍然完整，客户端展开时带上 expand 重新请求。
+    """
+    try:
+        root = request.args.get('root', type=int)
+        depth = request.args.get('depth', type=int)
+        limit = request.args.get('limit', MAX_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        try:
+            expand, collapse = (
+                {int(pid) for pid in request.args.get(name, '').split(',') if pid.strip()}
+                for name in ('expand', 'collapse'))
+        except ValueError:
+            return jsonify({"status": "error", "message": "expand and collapse must be comma separated PIDs."}), 400
+        if depth is not None and depth < 0:
+            return jsonify({"status": "error", "message": "depth must be a non-negative integer."}), 400
+
+        process_table.refresh()
+        if root is not None and process_table.get(root) is None:
+            return jsonify({"status": "error", "message": f"进程 {root} 不存在。"}), 404
+        rows, total, truncated = process_table.tree_rows(root, depth, expand, collapse, limit)
+        return jsonify({
+            "status": "success",
+            "version": process_table.version,
+            "total": total,
+            "truncated": truncated,
+            "processes": [_preview_row(row) for row in rows]
+        })
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def _collect_kill_targets(pids, tree):
+    """把 PID 列表（以及 tree 模式下的子孙进程）解析为 Process 对象，先父后子。"""
+    process_table.refresh(force=True)
+    targets, missing, seen = [], [], set()
+    for pid in pids:
+        if pid in seen:
+            continue
+        entry = process_table.get(pid)
+        if entry is None:
+            missing.append(pid)
+            continue
+        group = [pid] + (process_table.tree.descendants(pid) if tree else [])
+        for target in group:
+            if target not in seen:
+                seen.add(target)
+                targets.append(process_table.get(target).proc)
+    return targets, missing
+
+def _wait_for_exit(procs, timeout):
+    """
+    等待进程退出，返回仍然存活的进程列表。
+    以 psutil.wait_procs 非阻塞轮询，间隔中让出 eventlet 协程，避免阻塞整个服务。
+    """
+    deadline = time.monotonic() + timeout
+    alive = list(procs)
+    while alive:
+        _, alive = psutil.wait_procs(alive, timeout=0)
+        if not alive or time.monotonic() >= deadline:
+            break
+        socketio.sleep(KILL_POLL_INTERVAL)
+    return alive
+
+def kill_processes(pids, sig=signal.SIGTERM, timeout=DEFAULT_KILL_TIMEOUT, escalate=True, tree=False):
+    """
+    向一组进程发送信号，并生成一份结果报告。
+    对终止类信号，等待 timeout 秒后仍存活的进程会被升级为 SIGKILL。
+    """
+    targets, missing = _collect_kill_targets(pids, tree)
+    report = {pid: {"pid": pid, "status": "not_found"} for pid in missing}
+
+    signaled = []
+    for proc in targets:
+        result = report[proc.pid] = {"pid": proc.pid, "name": process_table.get(proc.pid).row['name']}
+        try:
+            proc.send_signal(sig)
+            result["status"] = "signaled"
+            signaled.append(proc)
+        except psutil.NoSuchProcess:
+            result["status"] = "gone"
+        except psutil.AccessDenied:
+            result["status"] = "access_denied"
+
+    if sig in TERMINATING_SIGNALS and signaled:
+        alive = _wait_for_exit(signaled, timeout)
+        if escalate and alive and sig != signal.SIGKILL:
+            for proc in alive:
+                try:
+                    proc.kill()
+                    report[proc.pid]["escalated"] = True
+                except psutil.NoSuchProcess:
+                    pass
+                except psutil.AccessDenied:
+                    report[proc.pid]["status"] = "access_denied"
+            alive = _wait_for_exit(alive, KILL_ESCALATION_TIMEOUT)
+        alive_pids = {proc.pid for proc in alive}
+        for proc in signaled:
+            result = report[proc.pid]
+            if result["status"] == "signaled":
+                result["status"] = "alive" if proc.pid in alive_pids else ("killed" if result.get("escalated") else "terminated")
+            # wait_procs 只给已退出的进程设置 returncode
+            returncode = getattr(proc, 'returncode', None)
+            if returncode is not None:
+                result["returncode"] = returncode
+
+    return _ordered_report(pids, targets, report)
+
+def _ordered_report(pids, targets, report):
+    """按请求顺序（子孙进程紧随其后）排列报告。"""
+    ordered = []
+    for pid in [proc.pid for proc in targets] + list(pids):
+        if pid in report:
+            ordered.append(report.pop(pid))
+    return ordered
+
 @process_manager_bp.route('/processes/kill', methods=['POST'])
 @login_required
 def kill_process():
-    """结束指定 PID 的进程。"""
+    """
+    结束一个或一组进程。
+    参数: pid 或 pids, signal (名称或编号，默认 SIGTERM), timeout (秒),
+          escalate (超时后是否升级为 SIGKILL，默认 true), tree (是否包含子孙进程)
+    """
     try:
-        pid = request.json.get('pid')
-        if not pid:
+        data = request.json or {}
+        single = 'pids' not in data
+        pids = [data.get('pid')] if single else data.get('pids')
+        if not pids or not all(isinstance(pid, int) and pid > 0 for pid in pids):
             return jsonify({"status": "error", "message": "PID is required."}), 400
-        
+
+        sig = _parse_signal(data.get('signal', 'SIGTERM'))
+        if sig is None:
+            return jsonify({"status": "error", "message": f"不支持的信号: {data.get('signal')}"}), 400
         try:
-            p = psutil.Process(pid)
-            p.terminate() # 尝试优雅地终止进程
-            # p.kill() # 如果 terminate 失败，可以使用 kill 强制终止
-            return jsonify({"status": "success", "message": f"进程 {pid} 已发送终止信号。"}), 200
-        except psutil.NoSuchProcess:
-            return jsonify({"status": "error", "message": f"进程 {pid} 不存在。"}), 404
-        except psutil.AccessDenied:
-            return jsonify({"status": "error", "message": f"权限不足，无法终止进程 {pid}。"}), 403
-        except Exception as e:
-            return jsonify({"status": "error", "message": f"终止进程 {pid} 失败: {str(e)}"}), 500
+            timeout = min(float(data.get('timeout', DEFAULT_KILL_TIMEOUT)), MAX_KILL_TIMEOUT)
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "message": "无效的超时时间。"}), 400
+        # 只接受 JSON 布尔值，避免 "false" 之类的字符串被当作真值
+        escalate = data.get('escalate', True)
+        tree = data.get('tree', False)
+        if not isinstance(escalate, bool) or not isinstance(tree, bool):
+            return jsonify({"status": "error", "message": "escalate 和 tree 必须是布尔值。"}), 400
+
+        results = kill_processes(pids, sig, timeout, escalate, tree)
+
+        failed = [r for r in results if r["status"] in ("not_found", "access_denied", "alive")]
+        if single and not tree and failed:
+            # 保持单个 PID 时原有的错误码
+            pid = pids[0]
+            if failed[0]["status"] == "not_found":
+                return jsonify({"status": "error", "message": f"进程 {pid} 不存在。", "results": results}), 404
+            if failed[0]["status"] == "access_denied":
+                return jsonify({"status": "error", "message": f"权限不足，无法终止进程 {pid}。", "results": results}), 403
+
+        done = len(results) - len(failed)
+        return jsonify({
+            "status": "warning" if failed else "success",
+            "message": f"已向 {len(results)} 个进程发送 {sig.name}，{done} 个成功，{len(failed)} 个失败。",
+            "results": results
+        }), 200
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
+        return jsonify({"status": "error", "message": str(e)}), 500
@@ -0,0 +1,401 @@
+import time
+import json
+import heapq
+import base64
+from collections import deque
+import psutil
+
+# 保留最近多少次刷新的删除记录，客户端的版本号比这更旧时返回完整快照
+REMOVED_HISTORY_VERSIONS = 50
+
+# 允许服务端排序的字段
+SORTABLE_FIELDS = ('pid', 'name', 'username', 'cpu_percent', 'memory_percent', 'rss', 'status', 'cmdline')
+
+# 数值型的排序字段，其余字段都是字符串
+NUMERIC_FIELDS = ('pid', 'cpu_percent', 'memory_percent', 'rss')
+
+def encode_cursor(row, sort):
+    """把一行的排序键编码为不透明的分页游标。"""
+    raw = json.dumps([row[sort], row['pid']]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor, sort):
+    """
+    解析分页游标，格式无效或值的类型与排序字段不符（例如换了排序字段后沿用旧游标）
+    时抛出 ValueError，避免排序比较时出现 TypeError。
+    """
+    try:
+        value, pid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        pid = int(pid)
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    if sort in NUMERIC_FIELDS:
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    else:
+        valid = isinstance(value, str)
+    if not valid:
+        raise ValueError(f"Cursor does not match sort field: {sort}")
+    return value, pid
+
+def _matches(row, user=None, name=None, status=None, search=None):
+    if user and row['username'] != user:
+        return False
+    if name and name not in row['name'].lower():
+        return False
+    if status and row['status'] != status:
+        return False
+    if search and not (search in row['name'].lower() or search in str(row['pid']) or search in row['cmdline'].lower()):
+        return False
+    return True
+
+def row_filter(user=None, name=None, status=None, search=None):
+    """返回按过滤条件判断一行是否匹配的函数。"""
+    name = name.lower() if name else None
+    search = search.lower() if search else None
+    return lambda row: _matches(row, user, name, status, search)
+
+def window_filter(sort, descending=False, until=None, **filters):
+    """
+    返回判断一行是否属于客户端已加载窗口的函数：满足过滤条件，并且按 (sort, pid)
+    排在 until 之前或就是 until。until 为客户端最后一页的 next_cursor 解码后的值，
+    为 None 表示客户端已加载全部匹配的行。
+    """
+    matches = row_filter(**filters)
+    if until is None:
+        return matches
+    until = tuple(until)
+    if descending:
+        return lambda row: matches(row) and (row[sort], row['pid']) >= until
+    return lambda row: matches(row) and (row[sort], row['pid']) <= until
+
+class ProcessTree:
+    """
+    根据 ppid 维护的进程树，每个节点保存子树的 CPU、RSS 和进程数合计。
+
+    合计值是增量维护的：进程新增、退出、数值变化或换了父进程时，只沿着它的
+    祖先链调整，不需要在每次刷新时重新遍历整棵树。
+    """
+
+    def __init__(self):
+        self.ppid = {}      # pid -> 进程报告的 ppid
+        self.parent = {}    # pid -> 树中的父节点，父进程不在表中时为 None
+        self.children = {}  # pid -> 子节点集合
+        self.own = {}       # pid -> (cpu_percent, rss)
+        self.totals = {}    # pid -> [子树 cpu_percent, 子树 rss, 子树进程数]
+        self._orphans = {}  # ppid -> 等待该父进程出现的根节点集合
+
+    def _ancestors(self, pid):
+        parent = self.parent.get(pid)
+        while parent is not None:
+            yield parent
+            parent = self.parent.get(parent)
+
+    def _shift(self, pid, cpu, rss, count):
+        """把增量加到 pid 的所有祖先节点上（不包括 pid 自身）。"""
+        for ancestor in self._ancestors(pid):
+            totals = self.totals[ancestor]
+            totals[0] += cpu
+            totals[1] += rss
+            totals[2] += count
+
+    def _detach(self, pid):
+        """把 pid 的子树从父节点上摘下，pid 成为根节点。"""
+        parent = self.parent.get(pid)
+        if parent is None:
+            ppid = self.ppid[pid]
+            orphans = self._orphans.get(ppid)
+            if orphans is not None:
+                orphans.discard(pid)
+                if not orphans:
+                    del self._orphans[ppid]
+            return
+        cpu, rss, count = self.totals[pid]
+        self._shift(pid, -cpu, -rss, -count)
+        self.children[parent].discard(pid)
+        self.parent[pid] = None
+
+    def _attach(self, pid):
+        """把根节点 pid 挂到它的 ppid 下；父进程尚不存在时登记为孤儿。"""
+        ppid = self.ppid[pid]
+        if ppid not in self.totals or ppid == pid or pid in self._ancestors_of(ppid):
+            self._orphans.setdefault(ppid, set()).add(pid)
+            return
+        self.parent[pid] = ppid
+        self.children[ppid].add(pid)
+        cpu, rss, count = self.totals[pid]
+        self._shift(pid, cpu, rss, count)
+
+    def _ancestors_of(self, pid):
+        return set(self._ancestors(pid)) | {pid}
+
+    def add(self, row):
+        pid = row['pid']
+        cpu, rss = row['cpu_percent'], row['rss']
+        self.ppid[pid] = row['ppid']
+        self.parent[pid] = None
+        self.children[pid] = set()
+        self.own[pid] = (cpu, rss)
+        self.totals[pid] = [cpu, rss, 1]
+        # 先收养之前等待该进程出现的子树，再把自己挂到父节点下
+        for orphan in self._orphans.pop(pid, ()):
+            self._attach(orphan)
+        self._attach(pid)
+
+    def update(self, row):
+        pid = row['pid']
+        cpu, rss = row['cpu_percent'], row['rss']
+        old_cpu, old_rss = self.own[pid]
+        if cpu != old_cpu or rss != old_rss:
+            self.own[pid] = (cpu, rss)
+            totals = self.totals[pid]
+            totals[0] += cpu - old_cpu
+            totals[1] += rss - old_rss
+            self._shift(pid, cpu - old_cpu, rss - old_rss, 0)
+        if row['ppid'] != self.ppid[pid]:
+            self._detach(pid)
+            self.ppid[pid] = row['ppid']
+            self._attach(pid)
+
+    def remove(self, pid):
+        # 子进程先成为孤儿，通常会在本次刷新中随着 ppid 变化被重新挂载
+        for child in list(self.children[pid]):
+            self._detach(child)
+            self._orphans.setdefault(pid, set()).add(child)
+        self._detach(pid)
+        for mapping in (self.ppid, self.parent, self.children, self.own, self.totals):
+            del mapping[pid]
+
+    def roots(self):
+        return [pid for pid, parent in self.parent.items() if parent is None]
+
+    def descendants(self, pid):
+        """返回 pid 子树中除自身以外的所有 pid（先子后孙的广度优先顺序）。"""
+        result = []
+        queue = deque(self.children.get(pid, ()))
+        while queue:
+            child = queue.popleft()
+            result.append(child)
+            queue.extend(self.children[child])
+        return result
+
+    def walk(self, roots, expand=None):
+        """
+        深度优先遍历，生成 (pid, depth, 是否展开)。同级节点按子树 CPU 合计降序排列。
+        expand(pid, depth) 返回假时不进入该节点的子树；遍历是惰性的，调用方提前停止时
+        未访问的部分不会被排序或遍历。
+        """
+        def by_load(pid):
+            return (-self.totals[pid][0], pid)
+        stack = [(pid, 0) for pid in sorted(roots, key=by_load, reverse=True)]
+        while stack:
+            pid, depth = stack.pop()
+            expanded = bool(self.children[pid]) and (expand is None or expand(pid, depth))
+            yield pid, depth, expanded
+            if expanded:
+                for child in sorted(self.children[pid], key=by_load, reverse=True):
+                    stack.append((child, depth + 1))
+
+class _ProcessEntry:
+    """缓存中的一个进程：长期持有的 psutil.Process 对象和它最近的一行数据。"""
+
+    __slots__ = ('proc', 'key', 'row', 'added_version', 'changed_version')
+
+    def __init__(self, proc, key, row, version):
+        self.proc = proc
+        self.key = key
+        self.row = row
+        self.added_version = version
+        self.changed_version = version
+
+class ProcessTable:
+    """
+    增量维护的进程表，以 (pid, create_time) 标识进程。
+
+    Process 对象在进程存活期间一直复用，因此 cpu_percent 反映的是两次刷新之间
+    的真实占用；name、username、cmdline 等静态字段只在首次发现进程时读取一次。
+    每次刷新递增版本号，客户端可以只获取某个版本之后新增、删除和变化的行。
+    """
+
+    def __init__(self, min_interval=2.0):
+        self.min_interval = min_interval
+        self.version = 0
+        self.refreshed_at = 0.0
+        self._entries = {}  # pid -> _ProcessEntry
+        self._removed = deque()  # (version, key)
+        self.tree = ProcessTree()
+
+    @staticmethod
+    def _make_key(pid, create_time):
+        return f"{pid}-{int(create_time * 100)}"
+
+    def _read_static(self, proc):
+        """读取进程生命周期内不变的字段。"""
+        with proc.oneshot():
+            info = proc.as_dict(attrs=['name', 'username', 'cmdline', 'create_time'])
+        return {
+            "name": info['name'] or '',
+            "username": info['username'] or '',
+            "cmdline": ' '.join(info['cmdline']) if info['cmdline'] else '',
+            "create_time": info['create_time'] or 0.0,
+        }
+
+    def _read_dynamic(self, proc):
+        """读取每次刷新都可能变化的字段。"""
+        with proc.oneshot():
+            info = proc.as_dict(attrs=['ppid', 'status', 'cpu_percent', 'memory_percent', 'memory_info'])
+        memory_info = info['memory_info']
+        return {
+            "ppid": info['ppid'],
+            "status": info['status'] or '',
+            "cpu_percent": round(info['cpu_percent'] or 0.0, 2),
+            "memory_percent": round(info['memory_percent'] or 0.0, 2),
+            "rss": memory_info.rss if memory_info else 0,
+        }
+
+    def refresh(self, force=False):
+        """如果距上次刷新已超过 min_interval，则重新扫描进程列表。"""
+        now = time.monotonic()
+        if not force and self.refreshed_at and now - self.refreshed_at < self.min_interval:
+            return False
+        self.refreshed_at = now
+        self.version += 1
+        version = self.version
+
+        entries = {}
+        added, changed = [], []
+        for pid in psutil.pids():
+            entry = self._entries.get(pid)
+            try:
+                if entry is None or not entry.proc.is_running():
+                    # 新进程，或者 PID 已被新进程复用
+                    proc = psutil.Process(pid)
+                    static = self._read_static(proc)
+                    key = self._make_key(pid, static['create_time'])
+                    row = {"key": key, "pid": pid, **static, **self._read_dynamic(proc)}
+                    entry = _ProcessEntry(proc, key, row, version)
+                    added.append(entry)
+                else:
+                    dynamic = self._read_dynamic(entry.proc)
+                    if any(entry.row[k] != v for k, v in dynamic.items()):
+                        entry.row = {**entry.row, **dynamic}
+                        entry.changed_version = version
+                        changed.append(entry)
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                continue
+            except psutil.AccessDenied:
+                if entry is None:
+                    continue
+            entries[pid] = entry
+
+        # 按 删除 -> 更新 -> 新增 的顺序维护进程树，PID 复用时也能正确处理
+        for pid, entry in self._entries.items():
+            if entries.get(pid) is not entry:
+                self._removed.append((version, entry.key))
+                self.tree.remove(pid)
+        for entry in changed:
+            self.tree.update(entry.row)
+        for entry in added:
+            self.tree.add(entry.row)
+        self._entries = entries
+
+        while self._removed and self._removed[0][0] <= version - REMOVED_HISTORY_VERSIONS:
+            self._removed.popleft()
+        return True
+
+    def rows(self):
+        """返回当前所有进程行。"""
+        return [entry.row for entry in self._entries.values()]
+
+    def query(self, sort='pid', descending=False, limit=None, cursor=None,
+              user=None, name=None, status=None, search=None):
+        """
+        按条件过滤并排序进程行，返回 (匹配总数, 本页的行, 下一页游标)。
+        指定 limit 时使用堆选出前 N 行，无需对整张表排序。
+        """
+        matches = row_filter(user, name, status, search)
+        rows = [row for row in self.rows() if matches(row)]
+        total = len(rows)
+
+        def sort_key(row):
+            return (row[sort], row['pid'])
+
+        if cursor is not None:
+            # 只保留排在游标之后的行，(值, pid) 保证顺序唯一
+            after = tuple(cursor)
+            rows = [row for row in rows if (sort_key(row) < after if descending else sort_key(row) > after)]
+
+        if limit is None:
+            page = sorted(rows, key=sort_key, reverse=descending)
+        elif descending:
+            page = heapq.nlargest(limit, rows, key=sort_key)
+        else:
+            page = heapq.nsmallest(limit, rows, key=sort_key)
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit and page:
+            next_cursor = encode_cursor(page[-1], sort)
+        return total, page, next_cursor
+
+    def tree_rows(self, root=None, depth=None, expand=(), collapse=(), limit=None):
+        """
+        以深度优先顺序返回 (行, 树中的进程总数, 是否因 limit 截断)，每行附带 depth、
+        子进程数和子树合计。
+
+        指定 root 时只返回该进程的子树。depth 层以内的节点默认展开（None 表示不限），
+        expand 和 collapse 中的 PID 分别强制展开和折叠；折叠的节点 expanded 为假，
+        子树合计仍然完整。最多返回 limit 行，遍历在达到 limit 后停止。
+        """
+        tree = self.tree
+        roots = [root] if root is not None else tree.roots()
+        total = sum(tree.totals[pid][2] for pid in roots)
+
+        def should_expand(pid, level):
+            if pid in collapse:
+                return False
+            return depth is None or level < depth or pid in expand
+
+        rows = []
+        for pid, level, expanded in tree.walk(roots, should_expand):
+            if limit is not None and len(rows) >= limit:
+                return rows, total, True
+            cpu, rss, count = tree.totals[pid]
+            rows.append({
+                **self._entries[pid].row,
+                "depth": level,
+                "expanded": expanded,
+                "child_count": len(tree.children[pid]),
+                "subtree": {"cpu_percent": round(cpu, 2), "rss": rss, "count": count},
+            })
+        return rows, total, False
+
+    def get(self, pid):
+        """按 PID 返回缓存中的条目，不存在时返回 None。"""
+        return self._entries.get(pid)
+
+    def delta(self, since, window=None):
+        """
+        返回 since 版本之后的变化：新增的行、变化的行和已删除的 key。
+        since 过旧或无效时返回完整快照（full=True）。
+
+        window 为 window_filter 返回的函数时只针对客户端已加载的分页窗口：不属于窗口的
+        新增或变化的行以 key 放入 removed（进程离开了窗口，客户端没有时忽略即可），
+        完整快照也不带行数据，客户端应重新按页查询。
+        """
+        oldest = self.version - REMOVED_HISTORY_VERSIONS + 1
+        if since is None or since < oldest or since > self.version:
+            if window is not None:
+                return {"version": self.version, "full": True}
+            return {"version": self.version, "full": True, "processes": self.rows()}
+
+        added, changed, left = [], [], []
+        for entry in self._entries.values():
+            if entry.changed_version <= since:
+                continue
+            if window is not None and not window(entry.row):
+                left.append(entry.key)
+            elif entry.added_version > since:
+                added.append(entry.row)
+            else:
+                changed.append(entry.row)
+        removed = [key for version, key in self._removed if version > since] + left
+        return {"version": self.version, "full": False, "added": added, "changed": changed, "removed": removed}
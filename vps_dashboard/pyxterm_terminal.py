@@ -1,10 +1,18 @@
 import os
+import time
+import uuid
+import secrets
 import subprocess
-import select
 import shlex
 import logging
-from flask import session, request
-from flask_socketio import emit
+from collections import deque
+from flask import session, request, current_app
+from flask_socketio import emit, join_room
+from eventlet import getcurrent, greenthread, tpool
+from eventlet.hubs import trampoline, IOClosed
+from eventlet.timeout import Timeout
+from eventlet.event import Event
+from .terminal_recorder import AsciicastRecorder, compress_recording, FLUSH_INTERVAL
 
 # 平台特定的导入
 if os.name != 'nt':
@@ -13,58 +21,410 @@ if os.name != 'nt':
     import struct
     import fcntl
 
-# 全局字典，用于存储每个会话的终端进程信息
-# 键是 session ID，值是包含 'fd' 和 'child_pid' 的字典
+# 全局字典，用于存储终端会话。键是与 Socket.IO 连接无关的稳定会话 ID，
+# 值包含 'fd'、'child_pid'、输出回滚缓冲区以及所有观看者 'viewers' 等信息。
+# 一个会话可以被多个连接共享，它们加入同一个房间，由唯一的读取协程广播输出
 user_sessions = {}
 
+# Socket.IO 连接 ID -> 会话 ID
+socket_sessions = {}
+
+# 共享令牌 -> (会话 ID, 是否只读)。每个会话有一个读写令牌和一个只读令牌，
+# 加入已有会话必须出示令牌，访问模式由令牌决定，客户端无法自行选择
+share_tokens = {}
+
+# 每个会话保留的最近输出字节数，重新连接时一次性回放
+SCROLLBACK_BYTES = 256 * 1024
+
+# PTY 输出的读取与合并参数
+MAX_READ_BYTES = 64 * 1024      # 单次 os.read 的最大字节数
+MAX_FRAME_BYTES = 256 * 1024    # 单个 pty-output 帧的最大字节数
+COALESCE_MIN_BYTES = 1024       # 少于该字节数的输出（如键入回显）立即发送
+OUTPUT_LATENCY = 0.005          # 大量输出时，为合并更多数据最多等待的秒数
+
+# 流量控制：任一观看者未确认的输出超过高水位时暂停读取 PTY，所有观看者都降到
+# 低水位以下再恢复。暂停期间子进程会因内核 PTY 缓冲区写满而阻塞，输出不会堆积在
+# 服务端内存中。
+HIGH_WATERMARK = 1024 * 1024
+LOW_WATERMARK = 256 * 1024
+
+def _read_available(fd):
+    """
+    读取 fd 上当前可读的数据，并在很短的时间预算内合并后续输出。
+    返回 bytes；PTY 已关闭时返回 None。
+    """
+    chunks = []
+    size = 0
+    deadline = None
+    while size < MAX_FRAME_BYTES:
+        try:
+            data = os.read(fd, MAX_READ_BYTES)
+        except BlockingIOError:
+            if size < COALESCE_MIN_BYTES:
+                break  # 交互式的少量输出不做等待
+            if deadline is None:
+                deadline = time.monotonic() + OUTPUT_LATENCY
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                trampoline(fd, read=True, timeout=remaining)
+            except Timeout:
+                break
+            continue
+        except OSError:
+            # 子进程退出后读取 PTY 主端会抛出 EIO
+            data = b''
+        if not data:
+            return b''.join(chunks) if chunks else None
+        chunks.append(data)
+        size += len(data)
+    return b''.join(chunks)
+
+def _write_all(fd, data):
+    """向非阻塞的 PTY 写入全部数据，缓冲区满时让出协程等待可写。"""
+    view = memoryview(data)
+    while view:
+        try:
+            written = os.write(fd, view)
+            view = view[written:]
+        except BlockingIOError:
+            trampoline(fd, write=True)
+
+class Scrollback:
+    """有界的输出回滚缓冲区，只保留最近 limit 字节的输出。"""
+
+    def __init__(self, limit=SCROLLBACK_BYTES):
+        self.limit = limit
+        self._chunks = deque()
+        self._size = 0
+
+    def append(self, data):
+        self._chunks.append(data)
+        self._size += len(data)
+        while self._size > self.limit:
+            excess = self._size - self.limit
+            first = self._chunks[0]
+            if len(first) <= excess:
+                self._chunks.popleft()
+                self._size -= len(first)
+            else:
+                self._chunks[0] = first[excess:]
+                self._size -= excess
+
+    def getvalue(self):
+        return b''.join(self._chunks)
+
+def session_room(session_id):
+    """会话对应的 Socket.IO 房间名。"""
+    return f"pty-{session_id}"
+
+def _max_unacked(user_session):
+    return max((viewer['unacked'] for viewer in user_session['viewers'].values()), default=0)
+
 def register_socketio_events(socketio):
     """注册与终端相关的 Socket.IO 事件。"""
 
-    def set_winsize(sid, row, col, xpix=0, ypix=0):
+    def set_winsize(session_id, row, col, xpix=0, ypix=0):
         if os.name != 'nt':
-            if sid in user_sessions:
-                fd = user_sessions[sid]['fd']
-                logging.debug(f"Resizing window for session {sid} to {row}x{col}")
+            if session_id in user_sessions:
+                fd = user_sessions[session_id]['fd']
+                logging.debug(f"Resizing window for session {session_id} to {row}x{col}")
                 winsize = struct.pack("HHHH", row, col, xpix, ypix)
                 fcntl.ioctl(fd, termios.TIOCSWINSZ, winsize)
+                record(session_id, 'resize', col, row)
 
-    def read_and_forward_pty_output(sid):
-        max_read_bytes = 1024 * 20
-        while sid in user_sessions:
-            socketio.sleep(0.01)
-            fd = user_sessions.get(sid, {}).get('fd')
-            if fd:
-                timeout_sec = 0
-                (data_ready, _, _) = select.select([fd], [], [], timeout_sec)
-                if data_ready:
-                    try:
-                        output = os.read(fd, max_read_bytes).decode(errors="ignore")
-                        socketio.emit("pty-output", {"output": output}, namespace="/pty", to=sid)
-                    except OSError:
-                        # 当进程结束时，os.read 可能会抛出 OSError
-                        logging.info(f"PTY for session {sid} has been closed.")
-                        break
+    def record(session_id, method, *args):
+        """
+        写入会话录像（未开启录像时什么也不做）。轮转下来的分段在线程池中压缩，
+        不阻塞 PTY 输出；录像写入失败时只停止录像，不影响终端本身。
+        """
+        user_session = user_sessions[session_id]
+        recorder = user_session['recorder']
+        if recorder is None:
+            return
+        try:
+            rotated = getattr(recorder, method)(*args)
+        except OSError as e:
+            logging.warning(f"Recording for session {session_id} stopped: {e}")
+            user_session['recorder'] = None
+            return
+        if rotated and user_session['compress_recording']:
+            socketio.start_background_task(tpool.execute, compress_recording, rotated)
+
+    def flush_recording(session_id):
+        """定期把录像缓冲区写入磁盘，输出停止后最后一段内容也不会只留在内存中。"""
+        user_session = user_sessions.get(session_id)
+        while True:
+            socketio.sleep(FLUSH_INTERVAL)
+            if user_sessions.get(session_id) is not user_session or user_session['recorder'] is None:
+                return
+            record(session_id, 'flush')
+
+    def resume_reader(user_session):
+        """唤醒因流量控制而暂停的读取协程。"""
+        resume = user_session.get('resume')
+        if resume is not None:
+            user_session['resume'] = None
+            resume.send()
+
+    def read_and_forward_pty_output(session_id):
+        """
+        由 eventlet hub 的可读事件驱动的读取循环，空闲时不消耗 CPU。
+        输出以原始字节帧发送，多字节 UTF-8 字符由浏览器端 xterm.js 拼接。
+        每段输出只读取一次并广播到会话房间，观看者再多也只有这一个读取协程。
+        没有客户端连接时继续读取，输出只写入回滚缓冲区。
+        """
+        user_session = user_sessions.get(session_id)
+        user_session['reader'] = getcurrent()
+        fd = user_session['fd']
+        while user_sessions.get(session_id) is user_session:
+            try:
+                trampoline(fd, read=True)
+            except IOClosed:
+                break
+            output = _read_available(fd)
+            if output is None:
+                logging.info(f"PTY for session {session_id} has been closed.")
+                close_session(session_id)
+                break
+            if not output:
+                continue
+            user_session['scrollback'].append(output)
+            record(session_id, 'output', output)
+            viewers = user_session['viewers']
+            if not viewers:
+                continue
+            for viewer in viewers.values():
+                viewer['unacked'] += len(output)
+            socketio.emit("pty-output", {"output": output}, namespace="/pty", to=session_room(session_id))
+            if _max_unacked(user_session) > HIGH_WATERMARK:
+                logging.debug(f"Pausing PTY reads for session {session_id}: {_max_unacked(user_session)} bytes unacknowledged.")
+                user_session['resume'] = Event()
+                user_session['resume'].wait()
+
+    def spawn_session(cmd, screen=None, recording=None):
+        """
+        在新的 PTY 中启动命令，返回会话 ID。screen 为附加的 screen 会话名；
+        recording 为录像配置 (目录, 分段最大字节数, 是否压缩)，为 None 时不录像。
+        """
+        (child_pid, fd) = pty.fork()
+
+        if child_pid == 0:
+            # 这是子进程
+            # 为子进程设置 TERM 环境变量，以兼容 systemd 等非交互式环境
+            os.environ['TERM'] = 'xterm'
+            subprocess.run(cmd)
+            os._exit(0) # 确保子进程在完成后退出
+
+        # 这是父进程
+        os.set_blocking(fd, False)
+        session_id = uuid.uuid4().hex
+        user_sessions[session_id] = {
+            'fd': fd,
+            'child_pid': child_pid,
+            'screen': screen,
+            'viewers': {},  # sid -> {'readonly': bool, 'unacked': 未确认字节数}
+            'scrollback': Scrollback(),
+            'resume': None,
+            'detached_at': None,
+            'reader': None,
+            'recorder': None,
+            'compress_recording': False,
+            'tokens': {'write': secrets.token_urlsafe(24), 'read': secrets.token_urlsafe(24)},
+        }
+        for mode, token in user_sessions[session_id]['tokens'].items():
+            share_tokens[token] = (session_id, mode == 'read')
+        set_winsize(session_id, 50, 50)
+        if recording is not None:
+            directory, max_bytes, compress = recording
+            try:
+                user_sessions[session_id]['recorder'] = AsciicastRecorder(directory, session_id, 50, 50, ' '.join(cmd), max_bytes)
+                user_sessions[session_id]['compress_recording'] = compress
+                socketio.start_background_task(flush_recording, session_id)
+            except OSError as e:
+                logging.warning(f"Failed to start recording for session {session_id}: {e}")
+        logging.info(f"Started PTY for session {session_id} with PID {child_pid}")
+        socketio.start_background_task(target=read_and_forward_pty_output, session_id=session_id)
+        return session_id
+
+    def emit_viewers(session_id):
+        """通知会话内的所有观看者当前的观看人数。"""
+        viewers = user_sessions[session_id]['viewers']
+        socketio.emit("pty-viewers", {"count": len(viewers), "readonly": sum(v['readonly'] for v in viewers.values())},
+                      namespace="/pty", to=session_room(session_id))
+
+    def attach_session(session_id, sid, readonly, replay):
+        """
+        把连接作为观看者加入会话。replay 为真时先单独回放回滚缓冲区，
+        然后再加入房间接收后续的实时输出。
+        """
+        user_session = user_sessions[session_id]
+        viewer = {'readonly': readonly, 'unacked': 0}
+        user_session['detached_at'] = None
+        socket_sessions[sid] = session_id
+        # token 用于该连接重新连接；只有读写观看者能拿到用于分享的两个令牌
+        tokens = user_session['tokens']
+        socketio.emit("pty-session", {"session_id": session_id, "resumed": replay, "readonly": readonly,
+                                      "token": tokens['read'] if readonly else tokens['write'],
+                                      "share_tokens": None if readonly else tokens},
+                      namespace="/pty", to=sid)
+        if replay:
+            output = user_session['scrollback'].getvalue()
+            if output:
+                viewer['unacked'] = len(output)
+                socketio.emit("pty-output", {"output": output}, namespace="/pty", to=sid)
+        user_session['viewers'][sid] = viewer
+        join_room(session_room(session_id), sid=sid, namespace="/pty")
+        emit_viewers(session_id)
+
+    def detach_session(sid, idle_timeout):
+        """观看者断开连接；最后一个观看者离开后会话保留，超过 idle_timeout 秒仍无人连接时回收。"""
+        session_id = socket_sessions.pop(sid, None)
+        user_session = user_sessions.get(session_id)
+        if user_session is None or user_session['viewers'].pop(sid, None) is None:
+            return
+        # 离开的可能正是落后最多的观看者
+        if _max_unacked(user_session) <= LOW_WATERMARK:
+            resume_reader(user_session)
+        if user_session['viewers']:
+            emit_viewers(session_id)
+            return
+        detached_at = user_session['detached_at'] = time.monotonic()
+        socketio.start_background_task(reap_if_idle, session_id, detached_at, idle_timeout)
+        logging.info(f"Session {session_id} detached; it will be reaped after {idle_timeout}s without a client.")
+
+    def reap_if_idle(session_id, detached_at, idle_timeout):
+        socketio.sleep(idle_timeout)
+        user_session = user_sessions.get(session_id)
+        if user_session is not None and not user_session['viewers'] and user_session['detached_at'] == detached_at:
+            logging.info(f"Reaping idle terminal session {session_id}.")
+            close_session(session_id)
+
+    def reap_child(child_pid, timeout=5):
+        """等待子进程退出并回收，避免留下僵尸进程。"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(child_pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid:
+                return
+            socketio.sleep(0.1)
+
+    def close_session(session_id):
+        """关闭 PTY、终止子进程并移除会话。"""
+        user_session = user_sessions.pop(session_id, None)
+        if user_session is None:
+            return
+        fd = user_session['fd']
+        child_pid = user_session['child_pid']
+        for token in user_session['tokens'].values():
+            share_tokens.pop(token, None)
+
+        # 先结束仍在等待该 fd 的读取协程，再关闭文件描述符和终止子进程，
+        # 否则 fd 编号被新的 PTY 复用时 hub 中会残留旧的监听者
+        reader = user_session['reader']
+        if reader is not None and reader is not getcurrent():
+            greenthread.kill(reader)
+        if fd:
+            os.close(fd)
+        if child_pid:
+            try:
+                os.kill(child_pid, 9) # 强制终止
+            except ProcessLookupError:
+                pass # 进程可能已经自己退出了
+            socketio.start_background_task(reap_child, child_pid)
+        resume_reader(user_session)
+        if user_session['recorder'] is not None:
+            # close 会先写出缓冲区中剩余的事件
+            try:
+                user_session['recorder'].close()
+            except OSError as e:
+                logging.warning(f"Failed to finish recording for session {session_id}: {e}")
+
+        if user_session['viewers']:
+            room = session_room(session_id)
+            for sid in user_session['viewers']:
+                socket_sessions.pop(sid, None)
+            socketio.emit("pty-exit", {"session_id": session_id}, namespace="/pty", to=room)
+            socketio.close_room(room, namespace="/pty")
+
+    def session_for_request(writable=False):
+        """
+        返回当前连接所在的会话，未附加时返回 (None, None)。
+        writable 为真时，只读观看者也返回 (None, None)。
+        """
+        session_id = socket_sessions.get(request.sid)
+        user_session = user_sessions.get(session_id)
+        if user_session is None:
+            return None, None
+        viewer = user_session['viewers'].get(request.sid)
+        if viewer is None or (writable and viewer['readonly']):
+            return None, None
+        return session_id, user_session
+
+    @socketio.on("pty-ack", namespace="/pty")
+    def pty_ack(data):
+        """浏览器确认已处理的输出字节数，所有观看者都低于低水位时恢复读取。"""
+        _, user_session = session_for_request()
+        if user_session is None:
+            return
+        # 格式不对的确认直接忽略
+        acked = data.get('bytes') if isinstance(data, dict) else None
+        if not isinstance(acked, int) or isinstance(acked, bool) or acked < 0:
+            return
+        viewer = user_session['viewers'][request.sid]
+        viewer['unacked'] = max(0, viewer['unacked'] - acked)
+        if _max_unacked(user_session) <= LOW_WATERMARK:
+            resume_reader(user_session)
 
     @socketio.on("pty-input", namespace="/pty")
     def pty_input(data):
-        """将浏览器输入写入子 PTY。"""
-        sid = request.sid
-        if sid in user_sessions:
-            fd = user_sessions[sid]['fd']
-            logging.debug(f"Received input from browser for session {sid}: {data['input']}")
+        """将浏览器输入写入子 PTY，只读观看者的输入被忽略。"""
+        session_id, user_session = session_for_request(writable=True)
+        if user_session is not None:
+            fd = user_session['fd']
+            logging.debug(f"Received input from browser for session {session_id}: {data['input']}")
             if fd:
-                os.write(fd, data["input"].encode())
+                _write_all(fd, data["input"].encode())
 
     @socketio.on("resize", namespace="/pty")
     def resize(data):
         """调整 PTY 窗口大小。"""
-        sid = request.sid
-        if sid in user_sessions:
-            set_winsize(sid, data['rows'], data['cols'])
+        session_id, user_session = session_for_request(writable=True)
+        if user_session is not None:
+            set_winsize(session_id, data['rows'], data['cols'])
+
+    @socketio.on("pty-close", namespace="/pty")
+    def pty_close():
+        """客户端主动结束会话（所有观看者都会收到 pty-exit）。"""
+        session_id, user_session = session_for_request(writable=True)
+        if user_session is not None:
+            close_session(session_id)
+
+    def recording_config():
+        """从应用配置读取录像设置，未配置录像目录时返回 None。"""
+        config = current_app.config
+        if not config['TERMINAL_RECORDING_DIR']:
+            return None
+        return (config['TERMINAL_RECORDING_DIR'], config['TERMINAL_RECORDING_MAX_BYTES'],
+                config['TERMINAL_RECORDING_COMPRESS'])
+
+    def find_screen_session(name):
+        """返回已附加到指定 screen 会话的终端会话 ID，没有时返回 None。"""
+        for session_id, user_session in user_sessions.items():
+            if user_session['screen'] == name:
+                return session_id
+        return None
 
     @socketio.on("connect", namespace="/pty")
     def connect():
-        """新的客户端连接。"""
+        """
+        新的客户端连接：凭共享令牌（查询参数 token）加入已有会话，或者创建新会话。
+        只读令牌的观看者不能输入、调整大小或结束会话。
+        """
         sid = request.sid
         if 'logged_in' not in session:
             logging.warning(f"Unauthorized terminal connection attempt from SID {sid}.")
@@ -72,32 +432,31 @@ def register_socketio_events(socketio):
 
         logging.info(f"New client connected: {sid}")
 
-        if sid in user_sessions:
-            logging.info(f"Session {sid} already has a child process.")
-            return
-
         if os.name != 'nt':
-            # 检查是否要附加到现有的 screen 会话
-            attach_to = request.args.get('attach_screen')
-            if attach_to:
-                cmd = ["screen", "-x", attach_to]
-            else:
-                cmd = ["bash"]
+            # 带有仍然有效的令牌时加入对应的会话，不重新运行任何命令
+            shared = share_tokens.get(request.args.get('token'))
+            if shared is not None:
+                session_id, readonly = shared
+                logging.info(f"Client {sid} joined session {session_id} (readonly={readonly}).")
+                attach_session(session_id, sid, readonly, replay=True)
+                return
 
-            (child_pid, fd) = pty.fork()
+            # 直接附加 screen 或新建 shell 的是已登录的操作者本人，以读写方式加入
+            readonly = False
 
-            if child_pid == 0:
-                # 这是子进程
-                # 为子进程设置 TERM 环境变量，以兼容 systemd 等非交互式环境
-                os.environ['TERM'] = 'xterm'
-                subprocess.run(cmd)
-                os._exit(0) # 确保子进程在完成后退出
+            # 检查是否要附加到现有的 screen 会话；同一个 screen 的观看者共享一个 PTY，
+            # 不会为每个观看者各启动一个 screen -x 进程
+            attach_to = request.args.get('attach_screen')
+            if attach_to:
+                session_id = find_screen_session(attach_to)
+                if session_id is not None:
+                    attach_session(session_id, sid, readonly, replay=True)
+                    return
+                session_id = spawn_session(["screen", "-x", attach_to], screen=attach_to,
+                                           recording=recording_config())
             else:
-                # 这是父进程
-                user_sessions[sid] = {'fd': fd, 'child_pid': child_pid}
-                set_winsize(sid, 50, 50)
-                logging.info(f"Started PTY for session {sid} with PID {child_pid}")
-                socketio.start_background_task(target=read_and_forward_pty_output, sid=sid)
+                session_id = spawn_session(["bash"], recording=recording_config())
+            attach_session(session_id, sid, readonly, replay=False)
         else:
             # Windows 兼容性说明
             logging.warning("PTY is not supported on Windows. Interactive terminal will not be available.")
@@ -106,20 +465,8 @@ def register_socketio_events(socketio):
             
     @socketio.on("disconnect", namespace="/pty")
     def disconnect():
-        """客户端断开连接。"""
+        """客户端断开连接：离开会话，最后一个观看者离开后等待重新连接或空闲超时后回收。"""
         sid = request.sid
-        if sid in user_sessions:
-            logging.info(f"Client disconnected: {sid}. Cleaning up session.")
-            fd = user_sessions[sid]['fd']
-            child_pid = user_sessions[sid]['child_pid']
-            
-            # 关闭文件描述符和终止子进程
-            if fd:
-                os.close(fd)
-            if child_pid:
-                try:
-                    os.kill(child_pid, 9) # 强制终止
-                except ProcessLookupError:
-                    pass # 进程可能已经自己退出了
-            
-            del user_sessions[sid]
\ No newline at end of file
+        if sid in socket_sessions:
+            logging.info(f"Client disconnected: {sid}. Detaching session.")
+            detach_session(sid, current_app.config['TERMINAL_IDLE_TIMEOUT'])
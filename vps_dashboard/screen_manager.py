@@ -1,10 +1,36 @@
-import subprocess
+import os
 import re
+import stat
+import time
+import shutil
+import getpass
+import tempfile
+import subprocess
+import psutil
 from flask import Blueprint, jsonify, request, render_template
 from .utils import login_required
+from . import socketio
 
 screen_manager_bp = Blueprint('screen_manager', __name__, url_prefix='/screen_manager')
 
+# screen 会话 ID 的格式：<pid>.<名称>，或者单独的会话名称
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+# 会话预览（hardcopy）的缓存秒数和等待 screen 写出文件的最长秒数
+PREVIEW_TTL = 2
+PREVIEW_TIMEOUT = 2
+
+# 套接字目录的状态：实际路径，以及按目录 mtime 缓存的会话列表。
+# 会话的创建和退出会改变目录的 mtime，附加/分离只改变套接字文件本身的权限位。
+_socket_dir_state = {
+    'path': None,
+    'scanned': None,  # (目录, mtime_ns)
+    'entries': [],
+}
+
+# 会话 ID -> (截取时间, 屏幕内容)
+_preview_cache = {}
+
 @screen_manager_bp.route('/')
 @login_required
 def screen_manager_index():
@@ -41,18 +67,87 @@ def _parse_screen_ls_output(output):
             })
     return sessions
 
+def _candidate_socket_dirs():
+    """screen 套接字目录的可能位置，与 screen 编译时的 SOCKDIR 设置有关。"""
+    if os.environ.get('SCREENDIR'):
+        return [os.environ['SCREENDIR']]
+    user = getpass.getuser()
+    return [f'/run/screen/S-{user}', f'/var/run/screen/S-{user}', f'/tmp/screens/S-{user}', f'/tmp/uscreens/S-{user}']
+
+def _find_socket_dir():
+    """返回存在的套接字目录，找不到时返回 None。"""
+    path = _socket_dir_state['path']
+    if path and os.path.isdir(path):
+        return path
+    for path in _candidate_socket_dirs():
+        if os.path.isdir(path):
+            _socket_dir_state['path'] = path
+            return path
+    return None
+
+def _remember_socket_dir(output):
+    """从 `screen -ls` 的输出中记下套接字目录，之后即可直接扫描该目录。"""
+    match = re.search(r'Sockets? (?:found )?in (\S+?)\.?\s*$', output or '', re.MULTILINE)
+    if match:
+        _socket_dir_state['path'] = match.group(1)
+
+def _scan_socket_dir(path):
+    """用 os.scandir 列出套接字目录中的会话 (id, pid, 名称)；目录 mtime 未变时直接使用缓存。"""
+    scanned = (path, os.stat(path).st_mtime_ns)
+    if scanned == _socket_dir_state['scanned']:
+        return _socket_dir_state['entries']
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            pid, sep, name = entry.name.partition('.')
+            if sep and pid.isdigit():
+                entries.append((entry.name, pid, name))
+    entries.sort(key=lambda e: int(e[1]))
+    _socket_dir_state.update(scanned=scanned, entries=entries)
+    return entries
+
+def _list_sessions_native():
+    """
+    不启动 screen 进程，直接扫描套接字目录获取会话列表。
+    与 screen 自身的判断方式相同：套接字的属主执行位表示已附加，进程不存在表示会话已失效。
+    找不到套接字目录时返回 None。
+    """
+    path = _find_socket_dir()
+    if path is None:
+        return None
+    sessions = []
+    for session_id, pid, name in _scan_socket_dir(path):
+        try:
+            mode = os.stat(os.path.join(path, session_id)).st_mode
+        except FileNotFoundError:
+            continue  # 扫描之后会话已退出
+        if not psutil.pid_exists(int(pid)):
+            status = 'Dead ???'
+        elif mode & stat.S_IXUSR:
+            status = 'Attached'
+        else:
+            status = 'Detached'
+        sessions.append({'id': session_id, 'pid': pid, 'name': name, 'status': status})
+    return sessions
+
 @screen_manager_bp.route('/sessions', methods=['GET'])
 @login_required
 def list_screen_sessions():
-    """获取所有 screen 会话的列表。"""
+    """获取所有 screen 会话的列表，优先扫描套接字目录，找不到目录时才调用 `screen -ls`。"""
     try:
+        sessions = _list_sessions_native()
+        if sessions is not None:
+            return jsonify({"status": "success", "sessions": sessions})
+
         # 使用 -wipe 参数可以清理死掉的会话
         result = subprocess.run(['screen', '-ls'], capture_output=True, text=True, check=True)
+        _remember_socket_dir(result.stdout)
         sessions = _parse_screen_ls_output(result.stdout)
         return jsonify({"status": "success", "sessions": sessions})
     except FileNotFoundError:
         return jsonify({"status": "error", "message": "screen command not found. Is GNU Screen installed?"}), 500
     except subprocess.CalledProcessError as e:
+        _remember_socket_dir(e.stdout)
         # 如果没有活动的 screen 会话，`screen -ls` 可能会返回非零退出码和特定消息
         if "No Sockets found" in e.stdout or "No Sockets found" in e.stderr:
             return jsonify({"status": "success", "sessions": []})
@@ -96,4 +191,55 @@ def kill_screen_session(session_id):
         # 如果会话已经不存在，可能会报错，但我们可以将其视为成功
         return jsonify({"status": "success", "message": f"Kill command sent to session '{session_id}'."})
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def _capture_hardcopy(session_id):
+    """
+    用 screen 的 hardcopy 命令把会话当前窗口的内容写到临时文件并读取。
+    -X 命令由 screen 服务进程异步执行，因此需要等待文件出现。
+    """
+    workdir = tempfile.mkdtemp(prefix='screen-hardcopy-')
+    path = os.path.join(workdir, 'hardcopy')
+    try:
+        subprocess.run(['screen', '-S', session_id, '-X', 'hardcopy', path],
+                       capture_output=True, text=True, check=True, timeout=PREVIEW_TIMEOUT)
+        deadline = time.monotonic() + PREVIEW_TIMEOUT
+        size = -1
+        while time.monotonic() < deadline:
+            # 文件大小连续两次不变时认为已写完
+            current = os.path.getsize(path) if os.path.exists(path) else -1
+            if current >= 0 and current == size:
+                break
+            size = current
+            socketio.sleep(0.05)
+        else:
+            raise TimeoutError("Timed out waiting for screen hardcopy.")
+        with open(path, 'rb') as f:
+            content = f.read().decode('utf-8', errors='replace')
+        return '\n'.join(line.rstrip() for line in content.rstrip().split('\n'))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+@screen_manager_bp.route('/sessions/<session_id>/preview', methods=['GET'])
+@login_required
+def preview_screen_session(session_id):
+    """返回会话当前屏幕内容的文本快照，结果缓存 PREVIEW_TTL 秒，供列表页显示实时预览。"""
+    if not SESSION_ID_PATTERN.match(session_id):
+        return jsonify({"status": "error", "message": "Invalid session ID."}), 400
+
+    now = time.monotonic()
+    cached = _preview_cache.get(session_id)
+    if cached is None or now - cached[0] > PREVIEW_TTL:
+        try:
+            cached = _preview_cache[session_id] = (now, _capture_hardcopy(session_id))
+        except FileNotFoundError:
+            return jsonify({"status": "error", "message": "screen command not found."}), 500
+        except subprocess.CalledProcessError as e:
+            _preview_cache.pop(session_id, None)
+            return jsonify({"status": "error", "message": e.stderr or e.stdout or "Session not found."}), 404
+        except (subprocess.TimeoutExpired, TimeoutError) as e:
+            return jsonify({"status": "error", "message": str(e)}), 504
+        # 丢弃过期的预览，避免已结束的会话一直留在缓存中
+        for key in [k for k, (captured_at, _) in _preview_cache.items() if now - captured_at > PREVIEW_TTL * 10]:
+            del _preview_cache[key]
+    return jsonify({"status": "success", "content": cached[1], "age": round(now - cached[0], 2)})
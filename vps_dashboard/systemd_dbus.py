@@ -0,0 +1,284 @@
+import os
+import logging
+from itertools import count
+from eventlet.green import socket
+from eventlet.event import Event
+from eventlet.timeout import Timeout
+
+# D-Bus 后端是可选的，未安装 jeepney 时只使用 systemctl 子进程
+try:
+    from jeepney import DBusAddress, HeaderFields, MessageType, Parser, MatchRule, message_bus, new_method_call
+    from jeepney.auth import Authenticator, BEGIN
+    from jeepney.bus import get_bus
+    from jeepney.wrappers import DBusErrorResponse
+except ImportError:
+    DBusAddress = None
+
+    class DBusErrorResponse(Exception):
+        pass
+
+SYSTEMD_BUS_NAME = 'org.freedesktop.systemd1'
+MANAGER_PATH = '/org/freedesktop/systemd1'
+MANAGER_INTERFACE = 'org.freedesktop.systemd1.Manager'
+UNIT_INTERFACE = 'org.freedesktop.systemd1.Unit'
+PROPERTIES_INTERFACE = 'org.freedesktop.DBus.Properties'
+
+# 单元类型 -> 该类型专有属性所在的接口
+TYPE_INTERFACES = {
+    'service': 'org.freedesktop.systemd1.Service',
+    'timer': 'org.freedesktop.systemd1.Timer',
+    'socket': 'org.freedesktop.systemd1.Socket',
+    'target': 'org.freedesktop.systemd1.Target',
+    'path': 'org.freedesktop.systemd1.Path',
+    'mount': 'org.freedesktop.systemd1.Mount',
+}
+
+# 单次 D-Bus 调用的超时秒数
+CALL_TIMEOUT = 5
+
+def _unwrap(properties):
+    """把 a{sv} 属性字典中 jeepney 表示的 variant (签名, 值) 转换为普通的值。"""
+    return {name: value for name, (_, value) in properties.items()}
+
+def error_message(error):
+    """D-Bus 错误回复中的可读描述。"""
+    data = getattr(error, 'data', None)
+    return data[0] if data and isinstance(data[0], str) else str(error)
+
+def is_available():
+    """是否安装了 D-Bus 后端所需的 jeepney。"""
+    return DBusAddress is not None
+
+class SystemdBus:
+    """
+    通过 D-Bus 与 systemd 管理器通信的客户端。
+
+    所有请求复用同一条长连接，按消息序号匹配回复，多个请求可以同时在途；
+    由一个读取协程接收回复和信号。单元属性缓存在进程内，收到 PropertiesChanged、
+    JobRemoved 等信号时更新或失效，并通过 on_change 回调通知调用方。
+    """
+
+    def __init__(self, address, spawn, on_change=None):
+        self.address = address
+        self.on_change = on_change
+        self._spawn = spawn
+        self._serials = count(start=1)
+        self._pending = {}   # 序号 -> Event
+        self._cache = {}     # 单元名 -> {属性: 值}
+        self._paths = {}     # 对象路径 -> 单元名
+        self._sock = None
+        self.connected = False
+        self._manager = DBusAddress(MANAGER_PATH, bus_name=SYSTEMD_BUS_NAME, interface=MANAGER_INTERFACE)
+
+    def connect(self):
+        """建立连接、完成认证并订阅 systemd 的信号。"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(get_bus(self.address))
+            authenticator = Authenticator()
+            for request in authenticator:
+                sock.sendall(request)
+                data = sock.recv(1024)
+                if not data:
+                    raise ConnectionError("D-Bus connection closed during authentication.")
+                authenticator.feed(data)
+            if not authenticator.authenticated:
+                raise ConnectionError("D-Bus authentication failed.")
+            sock.sendall(BEGIN)
+        except BaseException:
+            sock.close()
+            raise
+        self._sock = sock
+        self._parser = Parser()
+        self.connected = True
+        self._spawn(self._receive_loop)
+
+        self.call(message_bus.Hello())
+        rule = MatchRule(type='signal', sender=SYSTEMD_BUS_NAME)
+        self.call(message_bus.AddMatch(rule))
+        # 只有调用过 Subscribe 的客户端才会收到单元和任务的变化信号
+        self.call(new_method_call(self._manager, 'Subscribe'))
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._disconnected(ConnectionError("D-Bus connection closed."))
+
+    def _disconnected(self, error):
+        self.connected = False
+        self._cache.clear()
+        pending, self._pending = self._pending, {}
+        for event in pending.values():
+            event.send_exception(error)
+
+    def _receive_loop(self):
+        sock = self._sock
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    raise ConnectionError("D-Bus connection closed by peer.")
+                self._parser.add_data(data)
+                while True:
+                    msg = self._parser.get_next_message()
+                    if msg is None:
+                        break
+                    self._dispatch(msg)
+        except OSError as e:
+            if self._sock is sock:
+                logging.warning(f"systemd D-Bus connection lost: {e}")
+                self._disconnected(e)
+
+    def _dispatch(self, msg):
+        msg_type = msg.header.message_type
+        if msg_type in (MessageType.method_return, MessageType.error):
+            event = self._pending.pop(msg.header.fields.get(HeaderFields.reply_serial), None)
+            if event is not None:
+                event.send(msg)
+        elif msg_type == MessageType.signal:
+            try:
+                self._handle_signal(msg)
+            except Exception as e:
+                logging.warning(f"Failed to handle systemd signal: {e}")
+
+    def _handle_signal(self, msg):
+        fields = msg.header.fields
+        member = fields.get(HeaderFields.member)
+        if member == 'PropertiesChanged':
+            name = self._paths.get(fields.get(HeaderFields.path))
+            if name is None:
+                return
+            _, changed, invalidated = msg.body
+            cached = self._cache.get(name)
+            if cached is not None:
+                if invalidated:
+                    del self._cache[name]
+                else:
+                    cached.update(_unwrap(changed))
+            self._notify(name, _unwrap(changed))
+        elif member == 'JobRemoved':
+            # (任务 ID, 任务路径, 单元名, 结果)
+            _, _, name, result = msg.body
+            self._cache.pop(name, None)
+            self._notify(name, {'JobResult': result})
+        elif member in ('UnitNew', 'UnitRemoved'):
+            name, path = msg.body
+            self._cache.pop(name, None)
+            if member == 'UnitNew':
+                self._paths[path] = name
+            else:
+                self._paths.pop(path, None)
+            self._notify(name, {'Event': member})
+        elif member in ('UnitFilesChanged', 'Reloading'):
+            self._cache.clear()
+            self._notify(None, {'Event': member})
+
+    def _notify(self, name, changes):
+        if self.on_change is not None:
+            self.on_change(name, changes)
+
+    def send(self, message):
+        """发送一个方法调用，返回等待回复的 Event。"""
+        if not self.connected:
+            raise ConnectionError("Not connected to D-Bus.")
+        serial = next(self._serials)
+        event = Event()
+        self._pending[serial] = event
+        self._sock.sendall(message.serialise(serial=serial))
+        return event
+
+    def wait(self, event, timeout=CALL_TIMEOUT):
+        """等待 send() 发出的调用的回复，返回回复的 body；D-Bus 错误抛出 DBusErrorResponse。"""
+        with Timeout(timeout, TimeoutError("D-Bus call timed out.")):
+            msg = event.wait()
+        if msg.header.message_type == MessageType.error:
+            raise DBusErrorResponse(msg)
+        return msg.body
+
+    def call(self, message, timeout=CALL_TIMEOUT):
+        return self.wait(self.send(message), timeout)
+
+    def call_many(self, messages, timeout=CALL_TIMEOUT):
+        """先发出所有调用再统一等待回复，n 个调用只需约一次往返的时间。"""
+        events = [self.send(message) for message in messages]
+        return [self.wait(event, timeout) for event in events]
+
+    def manager_call(self, method, signature=None, body=()):
+        return self.call(new_method_call(self._manager, method, signature, body))
+
+    # --- systemd 管理器的高层接口 ---
+
+    def list_unit_files(self, patterns):
+        """返回匹配模式的单元文件 [(单元名, 单元文件状态)]。"""
+        (files,) = self.manager_call('ListUnitFilesByPatterns', 'asas', ([], patterns))
+        return sorted((os.path.basename(path), state) for path, state in files)
+
+    def list_units(self, patterns):
+        """返回已加载的单元 [(单元名, 描述, LoadState, ActiveState, SubState)]。"""
+        (units,) = self.manager_call('ListUnitsByPatterns', 'asas', ([], patterns))
+        return [unit[:5] for unit in units]
+
+    def unit_properties(self, units):
+        """
+        返回 {单元名: {属性: 值}}，包括 Unit 接口和单元类型专有接口的全部属性。
+        未缓存的单元通过批量的 LoadUnit 和 GetAll 查询，然后写入缓存。
+        """
+        missing = [unit for unit in dict.fromkeys(units) if unit not in self._cache]
+        if missing:
+            paths = [path for (path,) in self.call_many(
+                [new_method_call(self._manager, 'LoadUnit', 's', (unit,)) for unit in missing])]
+            requests = []
+            for unit, path in zip(missing, paths):
+                self._paths[path] = unit
+                props = DBusAddress(path, bus_name=SYSTEMD_BUS_NAME, interface=PROPERTIES_INTERFACE)
+                interfaces = [UNIT_INTERFACE]
+                unit_type = unit.rsplit('.', 1)[-1]
+                if unit_type in TYPE_INTERFACES:
+                    interfaces.append(TYPE_INTERFACES[unit_type])
+                requests.append([new_method_call(props, 'GetAll', 's', (interface,)) for interface in interfaces])
+            replies = iter(self.call_many([message for group in requests for message in group]))
+            for unit, group in zip(missing, requests):
+                merged = {}
+                for _ in group:
+                    (values,) = next(replies)
+                    merged.update(_unwrap(values))
+                self._cache[unit] = merged
+        return {unit: self._cache[unit] for unit in units if unit in self._cache}
+
+    # 作业类操作对应的管理器方法
+    JOB_METHODS = {
+        'start': 'StartUnit',
+        'stop': 'StopUnit',
+        'restart': 'RestartUnit',
+        'reload': 'ReloadUnit',
+        'try-restart': 'TryRestartUnit',
+    }
+
+    def unit_action(self, action, units, reload=True):
+        """
+        对一批单元执行操作，返回 {单元名: 错误信息}（全部成功时为空）。
+        作业类操作同时发出、统一等待；enable/disable 是一次调用，与 systemctl 相同，
+        之后重载配置（reload=False 时由调用方自行重载）。
+        """
+        errors = {}
+        if action in self.JOB_METHODS:
+            method = self.JOB_METHODS[action]
+            events = [self.send(new_method_call(self._manager, method, 'ss', (unit, 'replace'))) for unit in units]
+            for unit, event in zip(units, events):
+                try:
+                    self.wait(event)
+                except DBusErrorResponse as e:
+                    errors[unit] = error_message(e)
+        elif action in ('enable', 'disable'):
+            if action == 'enable':
+                self.manager_call('EnableUnitFiles', 'asbb', (list(units), False, False))
+            else:
+                self.manager_call('DisableUnitFiles', 'asb', (list(units), False))
+            if reload:
+                self.daemon_reload()
+        else:
+            raise ValueError(f"Unsupported action: {action}")
+        return errors
+
+    def daemon_reload(self):
+        self.manager_call('Reload')
@@ -1,20 +1,348 @@
 import os
 import re
+import time
+import calendar
+import logging
 import subprocess
-from flask import Blueprint, render_template, jsonify, request, current_app
+from flask import Blueprint, render_template, jsonify, request, current_app, session
+from flask_socketio import join_room
+from eventlet.semaphore import Semaphore
 from .utils import login_required, run_systemctl_command
+from .journal import JournalFollowers, UNIT_PATTERN, parse_priority, time_arg, read_page
+from .systemd_dbus import SystemdBus, DBusErrorResponse, error_message, is_available as dbus_available
+from . import socketio
 
 systemd_manager_bp = Blueprint('systemd_manager', __name__, url_prefix='/systemd_manager')
 
+# 列表中每个定时器及其关联服务需要的属性，通过一次多单元的 `systemctl show` 获取
+TIMER_PROPERTIES = ['Id', 'ActiveState', 'SubState', 'Unit', 'NextElapseUSecRealtime', 'LastTriggerUSec']
+SERVICE_PROPERTIES = ['Id', 'ActiveState', 'SubState', 'Result']
+
+# 服务管理支持的单元类型和批量操作
+UNIT_TYPES = ('service', 'socket', 'target', 'timer', 'path', 'mount', 'automount', 'swap', 'slice', 'scope', 'device')
+BATCH_ACTIONS = ('start', 'stop', 'restart', 'reload', 'try-restart', 'enable', 'disable')
+MAX_BATCH_UNITS = 500
+
+# 单元状态变化通过 Socket.IO 推送给页面
+SYSTEMD_NAMESPACE = '/systemd'
+SYSTEMD_ROOM = 'systemd-viewers'
+
+# D-Bus 连接失败后，等待多少秒再重试（期间使用 systemctl 子进程）
+DBUS_RETRY_INTERVAL = 30
+
+# 每页日志的默认和最大条数
+DEFAULT_LOG_LINES = 100
+MAX_LOG_LINES = 1000
+
+# 所有客户端共享的 journalctl -f 读取进程
+journal_followers = JournalFollowers(socketio, SYSTEMD_NAMESPACE)
+
+# D-Bus 后端状态：共享的连接和上次连接失败的时间
+_dbus_state = {
+    'bus': None,
+    'failed_at': None,
+}
+
+# 建立连接期间会让出协程，同时到达的请求排队等待同一条连接，而不是各自创建一条
+_dbus_lock = Semaphore()
+
+# `systemctl show --timestamp=unix` 需要 systemd 248 及以上，旧版本报错后不再使用该参数
+_show_state = {
+    'timestamp_unix': True,
+}
+
+def _push_unit_change(unit, changes):
+    """把 D-Bus 信号带来的单元变化推送给所有打开页面的客户端。"""
+    changes = {k: v for k, v in changes.items() if isinstance(v, (str, int, float, bool))}
+    socketio.emit('systemd-unit-changed', {"unit": unit, "changes": changes}, namespace=SYSTEMD_NAMESPACE, to=SYSTEMD_ROOM)
+
+def _get_bus():
+    """
+    返回已连接的 systemd D-Bus 后端。配置为 subprocess、未安装 jeepney 或连接失败时
+    返回 None，调用方改用 systemctl 子进程。
+    """
+    config = current_app.config
+    if config['SYSTEMD_BACKEND'] == 'subprocess' or not dbus_available():
+        return None
+    bus = _dbus_state['bus']
+    if bus is not None and bus.connected:
+        return bus
+    with _dbus_lock:
+        # 等待期间其他请求可能已经建立了连接或刚刚失败
+        bus = _dbus_state['bus']
+        if bus is not None:
+            if bus.connected:
+                return bus
+            bus.close()
+            _dbus_state['bus'] = None
+        now = time.monotonic()
+        if _dbus_state['failed_at'] is not None and now - _dbus_state['failed_at'] < DBUS_RETRY_INTERVAL:
+            return None
+
+        # 用户模式的 systemd 实例在会话总线上
+        address = config['SYSTEMD_DBUS_ADDRESS'] or ('SESSION' if '--user' in config['SYSTEMCTL_COMMAND'] else 'SYSTEM')
+        bus = SystemdBus(address, socketio.start_background_task, on_change=_push_unit_change)
+        try:
+            bus.connect()
+        except Exception as e:
+            logging.warning(f"systemd D-Bus backend unavailable, falling back to systemctl: {e}")
+            bus.close()
+            _dbus_state.update(bus=None, failed_at=now)
+            return None
+        _dbus_state.update(bus=bus, failed_at=None)
+        return bus
+
+def _systemctl(action, units=(), reload=True):
+    """
+    对一批单元执行一次 systemctl 操作，返回值格式与 run_systemctl_command 相同。
+    D-Bus 后端可用时直接调用 systemd 管理器，否则只启动一个 systemctl 子进程。
+    reload=False 时 enable/disable 不自动重载配置，由调用方在批量操作最后统一重载。
+    """
+    units = list(units)
+    bus = _get_bus()
+    if bus is not None:
+        try:
+            if action == 'daemon-reload':
+                bus.daemon_reload()
+                errors = {}
+            else:
+                errors = bus.unit_action(action, units, reload)
+            if errors:
+                message = '; '.join(f"{unit}: {error}" for unit, error in errors.items())
+                status = "error" if len(errors) == len(units) else "warning"
+                return {"status": status, "message": message, "errors": errors, "stdout": "", "stderr": message}
+            return {"status": "success", "stdout": "", "stderr": ""}
+        except DBusErrorResponse as e:
+            return {"status": "error", "message": error_message(e)}
+        except (OSError, TimeoutError) as e:
+            logging.warning(f"systemd D-Bus call failed, falling back to systemctl: {e}")
+    args = [action]
+    if not reload and action in ('enable', 'disable'):
+        args.append('--no-reload')
+    if units:
+        args += ['--', *units]
+    return run_systemctl_command(args)
+
+def _parse_show_output(output):
+    """解析多单元 `systemctl show` 的输出，每个单元一段，段之间以空行分隔。"""
+    units = []
+    current = {}
+    for line in output.split('\n'):
+        if not line.strip():
+            if current:
+                units.append(current)
+                current = {}
+            continue
+        if '=' in line:
+            key, value = line.split('=', 1)
+            current[key.strip()] = value.strip()
+    if current:
+        units.append(current)
+    return units
+
+def _show_units(units, properties):
+    """
+    用一次 `systemctl show` 查询多个单元的指定属性，返回 {单元名: {属性: 值}}。
+    支持时时间戳以 @<unix 秒> 的形式输出，旧版本 systemd 输出默认的本地时间格式。
+    """
+    if not units:
+        return {}
+    base = current_app.config['SYSTEMCTL_COMMAND'] + ["show", "--no-pager"]
+    args = ["--all", "-p", ",".join(properties), "--", *units]
+    result = None
+    if _show_state['timestamp_unix']:
+        result = subprocess.run(base + ["--timestamp=unix"] + args, capture_output=True, text=True, encoding='utf-8')
+        if result.returncode != 0 and 'timestamp' in result.stderr.lower():
+            logging.info("systemctl does not support --timestamp=unix, parsing default timestamps instead.")
+            _show_state['timestamp_unix'] = False
+            result = None
+    if result is None:
+        result = subprocess.run(base + args, capture_output=True, text=True, encoding='utf-8')
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "systemctl show failed.")
+    blocks = _parse_show_output(result.stdout)
+    if len(blocks) == len(units):
+        # systemctl 按参数顺序输出，别名单元的 Id 可能与请求的名称不同
+        return dict(zip(units, blocks))
+    return {block.get('Id'): block for block in blocks}
+
+def _usec_to_seconds(value):
+    """D-Bus 返回的微秒时间戳转换为整数秒，0 表示没有该时间。"""
+    return value // 1000000 if value else None
+
+def _timers_from_bus(bus):
+    """通过 D-Bus 获取定时器列表，属性来自进程内缓存，未缓存的单元批量查询。"""
+    files = bus.list_unit_files(['*.timer'])
+    timer_props = bus.unit_properties([unit for unit, _ in files])
+    services = [timer_props.get(unit, {}).get('Unit') or unit[:-len('.timer')] + '.service' for unit, _ in files]
+    service_props = bus.unit_properties(services)
+    timers = []
+    for (unit, state), service in zip(files, services):
+        props = timer_props.get(unit, {})
+        sprops = service_props.get(service, {})
+        timers.append({
+            'unit': unit,
+            'state': state,
+            'active_state': props.get('ActiveState', ''),
+            'sub_state': props.get('SubState', ''),
+            'next_elapse': _usec_to_seconds(props.get('NextElapseUSecRealtime')),
+            'last_trigger': _usec_to_seconds(props.get('LastTriggerUSec')),
+            'service': {
+                'unit': service,
+                'active_state': sprops.get('ActiveState', ''),
+                'result': sprops.get('Result', ''),
+            },
+        })
+    return timers
+
+def _unix_timestamp(value):
+    """
+    把 '@1700000000' 或默认格式 'Tue 2023-11-14 22:13:20 UTC' 的时间戳转换为整数秒，
+    空值或 'n/a' 返回 None。默认格式中 UTC 以外的时区按本机本地时间解释。
+    """
+    if not value:
+        return None
+    if value.startswith('@'):
+        try:
+            return int(value[1:])
+        except ValueError:
+            return None
+    parts = value.split()
+    if len(parts) < 3:
+        return None
+    try:
+        parsed = time.strptime(f"{parts[1]} {parts[2]}", "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+    if len(parts) > 3 and parts[3] == 'UTC':
+        return calendar.timegm(parsed)
+    return int(time.mktime(parsed))
+
+def _list_units_from_bus(bus, pattern):
+    """通过 D-Bus 列出单元：已加载单元的运行状态与单元文件状态合并。"""
+    units = {}
+    for name, description, load_state, active_state, sub_state in bus.list_units([pattern]):
+        units[name] = {'unit': name, 'description': description, 'load_state': load_state,
+                       'active_state': active_state, 'sub_state': sub_state, 'unit_file_state': ''}
+    for name, state in bus.list_unit_files([pattern]):
+        units.setdefault(name, {'unit': name, 'description': '', 'load_state': 'not-loaded',
+                                'active_state': 'inactive', 'sub_state': 'dead'})['unit_file_state'] = state
+    return units
+
+def _list_units_from_systemctl(unit_type):
+    """用 list-units 和 list-unit-files 两次调用列出单元并合并。"""
+    type_args = [f"--type={unit_type}"] if unit_type != 'all' else []
+    base = current_app.config['SYSTEMCTL_COMMAND']
+    common = ["--plain", "--no-legend", "--no-pager"] + type_args
+    units = {}
+    result = subprocess.run(base + ["list-units", "--all"] + common, capture_output=True, text=True, encoding='utf-8')
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "systemctl list-units failed.")
+    for line in result.stdout.splitlines():
+        # UNIT LOAD ACTIVE SUB DESCRIPTION，描述中可能有空格
+        parts = line.split(None, 4)
+        if len(parts) >= 4:
+            units[parts[0]] = {'unit': parts[0], 'description': parts[4] if len(parts) > 4 else '',
+                               'load_state': parts[1], 'active_state': parts[2], 'sub_state': parts[3],
+                               'unit_file_state': ''}
+    result = subprocess.run(base + ["list-unit-files"] + common, capture_output=True, text=True, encoding='utf-8')
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "systemctl list-unit-files failed.")
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            units.setdefault(parts[0], {'unit': parts[0], 'description': '', 'load_state': 'not-loaded',
+                                        'active_state': 'inactive', 'sub_state': 'dead'})['unit_file_state'] = parts[1]
+    return units
+
 @systemd_manager_bp.route('/')
 @login_required
 def systemd_manager_index():
     return render_template('systemd.html')
 
+@systemd_manager_bp.route('/units')
+@login_required
+def get_systemd_units():
+    """
+    列出指定类型（type=service 等，all 表示全部类型）的单元，包括运行状态和单元文件状态。
+    支持按名称/描述 (q) 和运行状态 (state) 在服务端过滤。
+    """
+    unit_type = request.args.get('type', 'service')
+    if unit_type != 'all' and unit_type not in UNIT_TYPES:
+        return jsonify({"status": "error", "message": f"Invalid unit type: {unit_type}"}), 400
+    search = request.args.get('q', '').lower()
+    state = request.args.get('state')
+
+    units = None
+    bus = _get_bus()
+    if bus is not None:
+        try:
+            units = _list_units_from_bus(bus, '*' if unit_type == 'all' else f'*.{unit_type}')
+        except DBusErrorResponse as e:
+            return jsonify({"status": "error", "message": error_message(e)}), 500
+        except (OSError, TimeoutError) as e:
+            logging.warning(f"systemd D-Bus call failed, falling back to systemctl: {e}")
+    if units is None:
+        try:
+            units = _list_units_from_systemctl(unit_type)
+        except RuntimeError as e:
+            return jsonify({"status": "error", "message": str(e)}), 500
+
+    result = []
+    for name in sorted(units):
+        unit = units[name]
+        if search and search not in name.lower() and search not in unit['description'].lower():
+            continue
+        if state and unit['active_state'] != state:
+            continue
+        result.append(unit)
+    return jsonify({"status": "success", "units": result})
+
+@systemd_manager_bp.route('/units/action', methods=['POST'])
+@login_required
+def systemd_units_action():
+    """
+    对多个单元执行同一操作，只调用一次 `systemctl <action> u1 u2 ...`（或一批 D-Bus 调用）。
+    请求体: {"action": "restart", "units": ["a.service", "b.service"]}
+    """
+    data = request.json or {}
+    action = data.get('action')
+    units = data.get('units')
+    if action not in BATCH_ACTIONS:
+        return jsonify({"status": "error", "message": f"Invalid action. Use one of: {', '.join(BATCH_ACTIONS)}."}), 400
+    if not isinstance(units, list) or not units:
+        return jsonify({"status": "error", "message": "units must be a non-empty list."}), 400
+    if len(units) > MAX_BATCH_UNITS:
+        return jsonify({"status": "error", "message": f"At most {MAX_BATCH_UNITS} units per request."}), 400
+    invalid = [unit for unit in units if not isinstance(unit, str) or not UNIT_PATTERN.match(unit)]
+    if invalid:
+        return jsonify({"status": "error", "message": f"Invalid unit name: {invalid[0]}"}), 400
+
+    units = list(dict.fromkeys(units))
+    result = _systemctl(action, units)
+    if result['status'] == 'success':
+        return jsonify({"status": "success", "message": f"已对 {len(units)} 个单元执行 '{action}' 操作。"})
+    message = result.get('message') or result.get('stderr') or ''
+    code = 500 if result['status'] == 'error' else 200
+    return jsonify({"status": result['status'], "message": message, "errors": result.get('errors', {})}), code
+
 @systemd_manager_bp.route('/timers')
 @login_required
 def get_systemd_timers():
-    """获取 systemd 定时器列表。"""
+    """
+    获取 systemd 定时器列表，包括运行状态、下次/上次触发时间和关联服务的结果。
+    单元文件列表和所有单元的属性各用一次 systemctl 调用获取，与定时器数量无关。
+    D-Bus 后端可用时不启动任何子进程。
+    """
+    bus = _get_bus()
+    if bus is not None:
+        try:
+            return jsonify({"status": "success", "timers": _timers_from_bus(bus)})
+        except DBusErrorResponse as e:
+            return jsonify({"status": "error", "message": error_message(e)}), 500
+        except (OSError, TimeoutError) as e:
+            logging.warning(f"systemd D-Bus call failed, falling back to systemctl: {e}")
+
     command = current_app.config['SYSTEMCTL_COMMAND'] + ["list-unit-files", "--type=timer", "--all", "--no-pager"]
     result = subprocess.run(command, capture_output=True, text=True, encoding='utf-8')
     
@@ -37,6 +365,32 @@ def get_systemd_timers():
                     'unit': match.group(1),
                     'state': match.group(2) # enabled, disabled, static等
                 })
+
+    # 定时器默认触发同名的 .service，Unit= 另有指定的少数定时器再补查一次
+    timer_units = [timer['unit'] for timer in timers]
+    default_services = [unit[:-len('.timer')] + '.service' for unit in timer_units]
+    try:
+        props = _show_units(timer_units + default_services, TIMER_PROPERTIES + SERVICE_PROPERTIES)
+        extra = sorted({props.get(unit, {}).get('Unit') for unit in timer_units} - set(default_services) - {None, ''})
+        props.update(_show_units(extra, SERVICE_PROPERTIES))
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    for timer, default_service in zip(timers, default_services):
+        timer_props = props.get(timer['unit'], {})
+        service = timer_props.get('Unit') or default_service
+        service_props = props.get(service, {})
+        timer.update({
+            'active_state': timer_props.get('ActiveState', ''),
+            'sub_state': timer_props.get('SubState', ''),
+            'next_elapse': _unix_timestamp(timer_props.get('NextElapseUSecRealtime')),
+            'last_trigger': _unix_timestamp(timer_props.get('LastTriggerUSec')),
+            'service': {
+                'unit': service,
+                'active_state': service_props.get('ActiveState', ''),
+                'result': service_props.get('Result', ''),
+            },
+        })
     return jsonify({"status": "success", "timers": timers})
 
 @systemd_manager_bp.route('/timers/detail')
@@ -65,21 +419,47 @@ def get_systemd_timer_detail():
 @systemd_manager_bp.route('/timers/logs')
 @login_required
 def get_systemd_timer_logs():
-    """获取 systemd 定时器的运行日志。"""
+    """
+    获取单元的运行日志。支持按级别 (priority) 和时间 (since/until) 在服务端过滤。
+    format=json 时返回结构化条目，并可用 before 游标向前翻页。
+    """
     unit = request.args.get('unit')
     if not unit:
         return jsonify({"status": "error", "message": "Unit name is required."}), 400
+    if not UNIT_PATTERN.match(unit):
+        return jsonify({"status": "error", "message": "Invalid unit name."}), 400
     
     # 限制日志输出行数，避免过大响应
-    lines = request.args.get('lines', '100') # 默认100行
+    lines = request.args.get('lines', str(DEFAULT_LOG_LINES))
     try:
         lines = int(lines)
         if lines <= 0:
-            lines = 100
+            lines = DEFAULT_LOG_LINES
     except ValueError:
-        lines = 100
+        lines = DEFAULT_LOG_LINES
+    lines = min(lines, MAX_LOG_LINES)
+
+    try:
+        priority = parse_priority(request.args.get('priority'))
+        since = time_arg(request.args.get('since'))
+        until = time_arg(request.args.get('until'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-    command = ["journalctl", "-u", unit, f"--lines={lines}", "--no-pager"]
+    if request.args.get('format') == 'json':
+        try:
+            entries, next_cursor = read_page(unit, lines, request.args.get('before'), priority, since, until)
+        except RuntimeError as e:
+            return jsonify({"status": "error", "message": str(e)}), 500
+        return jsonify({"status": "success", "entries": entries, "next_cursor": next_cursor})
+
+    command = ["journalctl", f"--unit={unit}", f"--lines={lines}", "--no-pager"]
+    if priority is not None:
+        command.append(f"--priority={priority}")
+    if since:
+        command.append(f"--since={since}")
+    if until:
+        command.append(f"--until={until}")
     # 对于非root用户，可能需要加上 --user 参数，但是 journalctl 默认会根据用户自动判断
     # 考虑到 systemctl 命令已经处理了用户，这里journalctl应该也可以
     
@@ -100,29 +480,29 @@ def systemd_timer_action():
     if not action or not unit or action not in ['start', 'stop', 'enable', 'disable']:
         return jsonify({"status": "error", "message": "无效的参数。"}), 400
     
-    result = run_systemctl_command([action, unit])
+    result = _systemctl(action, [unit])
     # 对于 enable/disable 操作，即使有警告也认为是成功的
     if result['status'] == 'success' or (action in ['enable', 'disable'] and result['status'] == 'warning'):
         return jsonify({"status": "success", "message": f"定时器 '{unit}' 已成功执行 '{action}' 操作。"}), 200
     else:
-        return jsonify({"status": "error", "message": result['message'] or result['stderr']}), 500
+        return jsonify({"status": "error", "message": result.get('message') or result.get('stderr')}), 500
 
-@systemd_manager_bp.route('/timers/create', methods=['POST'])
-@login_required
-def create_systemd_timer():
-    """创建新的 systemd 定时器和服务。"""
-    data = request.json
-    name = data.get('name')
-    description = data.get('description')
-    command = data.get('command')
-    on_calendar = data.get('on_calendar')
+def _write_timer_files(spec):
+    """
+    根据 {name, description, command, on_calendar} 写入服务和定时器文件，
+    成功时返回 None，否则返回错误信息。调用方负责之后的 daemon-reload。
+    """
+    name = spec.get('name')
+    description = spec.get('description')
+    command = spec.get('command')
+    on_calendar = spec.get('on_calendar')
 
     if not all([name, description, command, on_calendar]):
-        return jsonify({"status": "error", "message": "所有字段都是必填项。"}), 400
+        return "所有字段都是必填项。"
     
     # 安全性：确保名称只包含字母、数字、下划线和短横线
     if not re.match(r'^[a-zA-Z0-9_-]+$', name):
-        return jsonify({"status": "error", "message": "名称只能包含字母、数字、下划线和短横线。"}), 400
+        return "名称只能包含字母、数字、下划线和短横线。"
         
     service_filename = f"{name}.service"
     timer_filename = f"{name}.timer"
@@ -131,7 +511,7 @@ def create_systemd_timer():
     timer_path = os.path.join(current_app.config['SYSTEMD_PATH'], timer_filename)
 
     if os.path.exists(service_path) or os.path.exists(timer_path):
-        return jsonify({"status": "error", "message": "同名服务或定时器已存在。"}), 400
+        return "同名服务或定时器已存在。"
 
     service_content = f"""
 [Unit]
@@ -162,40 +542,109 @@ WantedBy=timers.target
             f.write(service_content.strip())
         with open(timer_path, 'w') as f:
             f.write(timer_content.strip())
+    except Exception as e:
+        return f"创建文件失败: {str(e)}"
+    return None
+
+@systemd_manager_bp.route('/timers/create', methods=['POST'])
+@login_required
+def create_systemd_timer():
+    """
+    创建新的 systemd 定时器和服务。请求体可以是单个定时器，也可以是
+    {"timers": [...]} 批量创建；无论创建多少个都只在最后重载一次 systemd。
+    """
+    data = request.json or {}
+    specs = data['timers'] if isinstance(data.get('timers'), list) else [data]
+
+    created, errors = [], {}
+    for spec in specs:
+        error = _write_timer_files(spec) if isinstance(spec, dict) else "无效的定时器定义。"
+        if error:
+            errors[str(spec.get('name') if isinstance(spec, dict) else spec)] = error
+        else:
+            created.append(spec['name'])
 
+    if created:
         # 重载 systemd daemon
-        run_systemctl_command(["daemon-reload"])
-        
-        return jsonify({"status": "success", "message": f"定时器 '{name}' 已成功创建。"}), 201
-    except Exception as e:
-        return jsonify({"status": "error", "message": f"创建文件失败: {str(e)}"}), 500
+        _systemctl("daemon-reload")
+
+    if len(specs) == 1:
+        if errors:
+            message = next(iter(errors.values()))
+            return jsonify({"status": "error", "message": message}), 500 if message.startswith("创建文件失败") else 400
+        return jsonify({"status": "success", "message": f"定时器 '{created[0]}' 已成功创建。"}), 201
+    status = "success" if not errors else ("warning" if created else "error")
+    return jsonify({"status": status, "message": f"已创建 {len(created)} 个定时器。", "created": created, "errors": errors}), \
+        201 if created else 400
 
 @systemd_manager_bp.route('/timers/delete', methods=['POST'])
 @login_required
 def delete_systemd_timer():
-    """删除 systemd 定时器和服务。"""
-    unit = request.json.get('unit')
-    if not unit:
+    """
+    删除 systemd 定时器和服务。请求体为 {"unit": ...} 或 {"units": [...]}；批量删除时
+    停止、禁用各只调用一次 systemctl，删除文件后只重载一次 systemd。
+    """
+    data = request.json or {}
+    units = data.get('units') if isinstance(data.get('units'), list) else [data.get('unit')]
+    if not all(units):
         return jsonify({"status": "error", "message": "Unit is required."}), 400
-
-    service_unit = unit.replace('.timer', '.service')
+    if any(not isinstance(unit, str) or not UNIT_PATTERN.match(unit) or not unit.endswith('.timer') for unit in units):
+        return jsonify({"status": "error", "message": "Invalid timer unit."}), 400
     
-    # 停止并禁用定时器
-    run_systemctl_command(["stop", unit])
-    run_systemctl_command(["disable", unit])
+    # 停止并禁用定时器，禁用时暂不重载
+    _systemctl("stop", units)
+    _systemctl("disable", units, reload=False)
     
     # 删除文件
     try:
-        timer_path = os.path.join(current_app.config['SYSTEMD_PATH'], unit)
-        service_path = os.path.join(current_app.config['SYSTEMD_PATH'], service_unit)
-        if os.path.exists(timer_path):
-            os.remove(timer_path)
-        if os.path.exists(service_path):
-            os.remove(service_path)
-        
+        for unit in units:
+            service_unit = unit[:-len('.timer')] + '.service'
+            timer_path = os.path.join(current_app.config['SYSTEMD_PATH'], unit)
+            service_path = os.path.join(current_app.config['SYSTEMD_PATH'], service_unit)
+            if os.path.exists(timer_path):
+                os.remove(timer_path)
+            if os.path.exists(service_path):
+                os.remove(service_path)
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"删除文件失败: {str(e)}"}), 500
+    finally:
         # 重载 systemd daemon
-        run_systemctl_command(["daemon-reload"])
+        _systemctl("daemon-reload")
 
-        return jsonify({"status": "success", "message": f"定时器 '{unit}' 已被删除。"}), 200
-    except Exception as e:
-        return jsonify({"status": "error", "message": f"删除文件失败: {str(e)}"}), 500
\ No newline at end of file
+    if len(units) == 1:
+        return jsonify({"status": "success", "message": f"定时器 '{units[0]}' 已被删除。"}), 200
+    return jsonify({"status": "success", "message": f"已删除 {len(units)} 个定时器。"}), 200
+
+def register_socketio_events(socketio):
+    """注册 systemd 页面的 Socket.IO 事件。"""
+
+    @socketio.on("connect", namespace=SYSTEMD_NAMESPACE)
+    def connect():
+        """页面加入共享房间，接收 D-Bus 信号带来的单元状态变化。"""
+        if 'logged_in' not in session:
+            logging.warning(f"Unauthorized systemd connection attempt from SID {request.sid}.")
+            return False  # 拒绝未认证的连接
+        join_room(SYSTEMD_ROOM)
+        # 确保已经连接 D-Bus 并订阅了信号
+        _get_bus()
+
+    @socketio.on("journal-follow", namespace=SYSTEMD_NAMESPACE)
+    def journal_follow(data):
+        """开始实时跟踪单元日志，同一单元的所有客户端共享一个 journalctl 进程。"""
+        unit = (data or {}).get('unit', '')
+        if not UNIT_PATTERN.match(unit):
+            return {"status": "error", "message": "Invalid unit name."}
+        try:
+            priority = parse_priority(data.get('priority'))
+        except ValueError as e:
+            return {"status": "error", "message": str(e)}
+        journal_followers.follow(request.sid, unit, priority)
+        return {"status": "success"}
+
+    @socketio.on("journal-unfollow", namespace=SYSTEMD_NAMESPACE)
+    def journal_unfollow():
+        journal_followers.unfollow(request.sid)
+
+    @socketio.on("disconnect", namespace=SYSTEMD_NAMESPACE)
+    def disconnect():
+        journal_followers.unfollow(request.sid)
@@ -1,10 +1,58 @@
-from flask import Blueprint, render_template
+import os
+import gzip
+from flask import Blueprint, render_template, jsonify, request, current_app, Response
 from .utils import login_required
+from .terminal_recorder import RECORDING_NAME_PATTERN, list_recordings
 
 terminal_bp = Blueprint('terminal', __name__, url_prefix='/terminal')
 
+# 回放录像时每次发送的字节数
+PLAYBACK_CHUNK_BYTES = 64 * 1024
+
 @terminal_bp.route('/')
 @login_required
 def terminal_index():
     """渲染 Web 终端页面。"""
-    return render_template('terminal.html')
\ No newline at end of file
+    return render_template('terminal.html')
+
+@terminal_bp.route('/recordings')
+@login_required
+def get_recordings():
+    """列出已保存的终端录像。"""
+    directory = current_app.config['TERMINAL_RECORDING_DIR']
+    if not directory:
+        return jsonify({"status": "error", "message": "Terminal recording is not enabled."}), 404
+    return jsonify({"status": "success", "recordings": list_recordings(directory)})
+
+def _stream_file(f):
+    with f:
+        while True:
+            chunk = f.read(PLAYBACK_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+@terminal_bp.route('/recordings/<name>')
+@login_required
+def play_recording(name):
+    """
+    分块流式返回一个 asciicast 录像文件，不会把整个文件读入内存。
+    压缩过的分段在客户端支持 gzip 时原样发送，否则边读边解压。
+    """
+    directory = current_app.config['TERMINAL_RECORDING_DIR']
+    if not directory or not RECORDING_NAME_PATTERN.match(name):
+        return jsonify({"status": "error", "message": "Recording not found."}), 404
+    path = os.path.join(directory, name)
+    headers = {}
+    try:
+        if name.endswith('.gz') and 'gzip' not in request.headers.get('Accept-Encoding', ''):
+            f = gzip.open(path, 'rb')
+        else:
+            f = open(path, 'rb')
+            if name.endswith('.gz'):
+                headers['Content-Encoding'] = 'gzip'
+            else:
+                headers['Content-Length'] = str(os.fstat(f.fileno()).st_size)
+    except FileNotFoundError:
+        return jsonify({"status": "error", "message": "Recording not found."}), 404
+    return Response(_stream_file(f), mimetype='application/x-asciicast', headers=headers)
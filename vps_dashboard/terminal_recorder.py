@@ -0,0 +1,123 @@
+import os
+import re
+import gzip
+import json
+import time
+import codecs
+import shutil
+import logging
+
+# 写入缓冲区的大小；缓冲区写满时或由终端每 FLUSH_INTERVAL 秒调用 flush() 写入磁盘
+BUFFER_BYTES = 64 * 1024
+FLUSH_INTERVAL = 1.0
+
+# 录像文件名：<开始时间>-<会话 ID>.<分段编号>.cast，轮转后的分段会被压缩为 .cast.gz
+RECORDING_NAME_PATTERN = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{32}\.\d{3}\.cast(\.gz)?$')
+
+def compress_recording(path):
+    """把已轮转的录像分段压缩为 .gz 并删除原文件（耗时操作，应在线程池中执行）。"""
+    try:
+        with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst, BUFFER_BYTES)
+        os.replace(path + '.gz.tmp', path + '.gz')
+        os.remove(path)
+    except OSError as e:
+        logging.warning(f"Failed to compress terminal recording {path}: {e}")
+
+def list_recordings(directory):
+    """返回目录中的录像文件信息，按文件名（即开始时间）倒序排列。"""
+    recordings = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if RECORDING_NAME_PATTERN.match(entry.name):
+                    stat = entry.stat()
+                    recordings.append({"name": entry.name, "size": stat.st_size, "modified": stat.st_mtime})
+    except FileNotFoundError:
+        pass
+    recordings.sort(key=lambda r: r['name'], reverse=True)
+    return recordings
+
+class AsciicastRecorder:
+    """
+    把终端输出记录为 asciicast v2 格式（首行为 JSON 头，其后每行一个
+    [经过秒数, "o", 文本] 事件）。
+
+    事件只追加到内存缓冲区，由文件对象的缓冲批量写入，交互式的少量输出不会
+    立即触发磁盘写入；调用方定期调用 flush()，空闲前的最后一段输出也会落盘。
+    文件超过 max_bytes 时轮转为新的分段，每个分段都是独立可播放的录像文件；
+    output() 返回被轮转下来的文件路径，由调用方决定是否压缩。
+    """
+
+    def __init__(self, directory, session_id, width, height, command, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.width = width
+        self.height = height
+        self.command = command
+        self.base = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{session_id}")
+        self.part = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+        self._open_part()
+
+    @property
+    def path(self):
+        return f"{self.base}.{self.part:03d}.cast"
+
+    def _open_part(self):
+        self._file = open(self.path, 'ab', buffering=BUFFER_BYTES)
+        self._started = time.monotonic()
+        self._written = 0
+        header = {
+            "version": 2,
+            "width": self.width,
+            "height": self.height,
+            "timestamp": int(time.time()),
+            "command": self.command,
+            "env": {"TERM": "xterm"},
+        }
+        self._write(header)
+
+    def _write(self, event):
+        line = (json.dumps(event, ensure_ascii=False) + '\n').encode()
+        self._file.write(line)
+        self._written += len(line)
+
+    def _event(self, kind, data):
+        self._write([round(time.monotonic() - self._started, 6), kind, data])
+        if self._written >= self.max_bytes:
+            return self._rotate()
+        return None
+
+    def _rotate(self):
+        rotated = self.path
+        self._file.close()
+        self.part += 1
+        self._open_part()
+        return rotated
+
+    def output(self, data):
+        """记录一段 PTY 输出；跨帧的多字节 UTF-8 字符由增量解码器拼接。"""
+        text = self._decoder.decode(data)
+        if text:
+            return self._event("o", text)
+        return None
+
+    def resize(self, cols, rows):
+        self.width, self.height = cols, rows
+        return self._event("r", f"{cols}x{rows}")
+
+    def flush(self):
+        """把缓冲区中的事件写入磁盘。"""
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            tail = self._decoder.decode(b'', final=True)
+            if tail:
+                self._write([round(time.monotonic() - self._started, 6), "o", tail])
+            self._file.close()
+            self._file = None